@@ -1,75 +1,235 @@
+import argparse
 import sys
-import time
 import traceback
 
-from creatorTools.BookFiles import BookFiles
+from creatorTools.BookManifest import BookManifest
+from creatorTools.EngineRegistry import EngineRegistry
 from creatorTools.Exceptions import ReaderException
 from creatorTools.GlobalConfig import GlobalConfig
-from creatorTools.Mp3FileFromAwsPolly import Languages
+from creatorTools.Metrics import Metrics
 from creatorTools.ReaderLog import ReaderLog
+from creatorTools.TtsCache import TtsCache
 
+# modules using libraries of reading engines, asyncio or multiprocessing are imported only when they are needed,
+# so that help and runs with nothing to generate start quickly
 
-if len(sys.argv) != 2:
-    print('Number of arguments:', len(sys.argv), ' is different than one.')
-    print('Provide path to YAML as parameter. YAML should contain configuration of audiobook(s).')
-    print('Text files that is converted should be in UTF-8 encoding.')
-    print('Supported languages (both default and embedded with sign @): ' + Languages.supported_languages())
-    exit(0)
 
-print('Processing config: ', sys.argv[1])
-try:
-    GlobalConfig.read_global_config(sys.argv[1])
-    async_list = []
-    for book_config in GlobalConfig.get_audiobooks():
+def generate_books(task_manager, book_configs):
+    """
+    Generates files of books. Runs in separate thread, while asynchronous tasks are watched by task manager.
+    :param task_manager: AsyncTaskManager that waits for asynchronous generation
+    :param book_configs: yaml files of changed books
+    """
+    from creatorTools.BookFiles import BookFiles
+    for book_config in book_configs:
         ReaderLog.log_par('Processing audiobook defined in file {}'.format(book_config))
         book = BookFiles(book_config)
         book.parse_book_file()
         book.print_generated()
-        if book.generate_mp3():
-            async_list.append(book)
-        book.clear_book_dir()
+        async_gen = book.generate_mp3()
+        if async_gen:
+            task_manager.add_book(book)
+        else:
+            book.clear_book_dir()
+            book.save_hashes()
+            book.create_single_file()
+            book.save_manifest()
+
+
+def process_books(config_file, jobs, book_configs, queue_file=None, workers=0):
+    """
+    Generates books and waits for their asynchronous generation.
+    :param config_file: path of global config
+    :param jobs: number of books generated at the same time
+    :param book_configs: yaml files of books to generate, or None to read global config and generate all its books
+    :param queue_file: path of work queue - if it is given, files are generated by workers of queue
+    :param workers: number of workers of queue started on local host
+    :return: exit code
+    """
+    if book_configs is None:
+        GlobalConfig.read_global_config(config_file)
+        book_configs = GlobalConfig.get_audiobooks()
+    # manifest of every book is checked once, only changed books are processed
+    changed = []
+    for book_config in book_configs:
+        if BookManifest(book_config).is_unchanged():
+            ReaderLog.log_par('Audiobook defined in file {} not changed.'.format(book_config))
+        else:
+            changed.append(book_config)
+    if len(changed) == 0:
+        Metrics.report()
+        return 0
+    # changed sections of all books are checked before anything is sent to reading engine
+    from creatorTools.BookValidator import BookValidator
+    errors = BookValidator.validate(changed)
+    if errors > 0:
+        ReaderLog.log_par('Found {} errors in books, nothing generated.'.format(errors))
+        return 1
+    if queue_file is not None:
+        from creatorTools.QueueCoordinator import QueueCoordinator
+        exit_code = QueueCoordinator(config_file, queue_file, workers).run(changed)
+        Metrics.report()
+        return exit_code
+    from creatorTools.AsyncTaskManager import AsyncTaskManager
+    manager = AsyncTaskManager()
+    exit_code = 0
+    scheduler = None
+    if jobs > 1:
+        from creatorTools.BookPool import BookPool
+        pool = BookPool(config_file, jobs, changed)
+        no_errors = manager.run(pool.run)
+        exit_code = pool.exit_code
+    elif GlobalConfig.is_lpt_schedule_used():
+        from creatorTools.GenerationScheduler import GenerationScheduler
+        scheduler = GenerationScheduler(manager)
+        no_errors = manager.run(lambda task_manager: scheduler.run(changed))
+    else:
+        no_errors = manager.run(lambda task_manager: generate_books(task_manager, changed))
+    for async_book in manager.books:
+        # files are removed when downloads of asynchronous tasks are finished
+        async_book.clear_book_dir()
+        async_book.save_hashes()
+        async_book.create_single_file()
+        async_book.save_manifest()
     # if there were async gen tasks
-    if len(async_list) > 0:
-        ReaderLog.log_par('Waiting for generation of files.')
-        errors_present = False
-        finished = True
-        a_list_size = len(async_list)
-        waiting = 0
-        waiting_step = GlobalConfig.get_check_delay()
-        while True:
-            s_tmp = []
-            ReaderLog.progress("Waiting " + str(waiting) + " seconds. Still " +
-                               str(len(async_list)) + '/' + str(a_list_size) + " books to process.  ")
-            for book in async_list:
-                tmp_res = book.check_async_gen()
-                finished = finished and tmp_res
-                errors_present = errors_present or book.errors_in_async
-                if not tmp_res:
-                    # still mp3 to generate - book will be checked next time
-                    s_tmp.append(book)
-            if finished:
-                break
-            else:
-                async_list = s_tmp
-                finished = True
-                time.sleep(waiting_step)
-                waiting += waiting_step
-        if not errors_present:
+    if len(manager.books) > 0:
+        if no_errors:
             ReaderLog.log('finished.')
         else:
             ReaderLog.log('finished with ERRORS. See log above.')
-        GlobalConfig.delete_s3_bucket()
-except ReaderException as ex:
-    ReaderLog.log_par('==========================================================================')
-    ex.print_error_message()
-    ReaderLog.log('==========================================================================')
-    ex.print_details()
-    sys.exit(1)
-except Exception:
-    ReaderLog.log_par('==========================================================================')
-    ReaderLog.log('[ERROR] Unhandled exception. Details below.')
-    ReaderLog.log('==========================================================================')
-    ReaderLog.log('Details:')
-    sys.stdout.flush()
-    traceback.print_exc(file=sys.stdout)
-    sys.exit(10)
+        from creatorTools.S3Transfer import S3Transfer
+        S3Transfer.cleanup()
+    if scheduler is not None:
+        scheduler.report()
+    TtsCache.report()
+    GlobalConfig.report_aws_clients()
+    Metrics.report()
+    return exit_code
+
+
+def check_books(config_file):
+    """
+    Checks all sections of all books, without generating anything.
+    :param config_file: path of global config
+    :return: exit code
+    """
+    GlobalConfig.read_global_config(config_file)
+    book_configs = GlobalConfig.get_audiobooks()
+    from creatorTools.BookValidator import BookValidator
+    errors = BookValidator.validate(book_configs, all_sections=True)
+    if errors > 0:
+        ReaderLog.log_par('Found {} errors in books.'.format(errors))
+        return 1
+    ReaderLog.log_par('No errors found in {} books.'.format(len(book_configs)))
+    return 0
+
+
+def run_worker(config_file, queue_file):
+    """
+    Generates files of work queue until there is nothing to do.
+    :param config_file: path of global config
+    :param queue_file: path of work queue
+    :return: exit code
+    """
+    GlobalConfig.read_global_config(config_file)
+    from creatorTools.QueueWorker import QueueWorker
+    exit_code = QueueWorker(queue_file).run()
+    TtsCache.report()
+    Metrics.report()
+    return exit_code
+
+
+def run_safely(function, *args):
+    """
+    Calls function and shows errors raised by it.
+    :return: value returned by function, or exit code of error: 1 - known error, 10 - unhandled exception
+    """
+    try:
+        return function(*args)
+    except ReaderException as ex:
+        ReaderLog.log_par('==========================================================================')
+        ex.print_error_message()
+        ReaderLog.log('==========================================================================')
+        ex.print_details()
+        return 1
+    except Exception:
+        ReaderLog.log_par('==========================================================================')
+        ReaderLog.log('[ERROR] Unhandled exception. Details below.')
+        ReaderLog.log('==========================================================================')
+        ReaderLog.log('Details:')
+        sys.stdout.flush()
+        traceback.print_exc(file=sys.stdout)
+        return 10
+
+
+class CreatorArgumentParser(argparse.ArgumentParser):
+    """
+    Parser of arguments that shows languages of reading engines in help, without importing engines.
+    """
+
+    def format_help(self):
+        lines = []
+        # engines are not imported, languages of engines that are not built-in are not known
+        for name in EngineRegistry.get_engine_names():
+            languages = EngineRegistry.get_supported_languages(name)
+            lines.append('{}: {}'.format(name, languages if languages is not None else '(unknown)'))
+        self.epilog = 'Text files that is converted should be in UTF-8 encoding. ' \
+                      'Supported languages (both default and embedded with sign @) of reading engines - ' \
+                      + '; '.join(lines)
+        return super().format_help()
+
+
+def main():
+    parser = CreatorArgumentParser(description='Converts text of audiobook(s) to MP3 files.')
+    parser.add_argument('config', nargs='?', help='path to YAML with configuration of audiobook(s)')
+    parser.add_argument('--jobs', type=int, default=1, metavar='N',
+                        help='number of audiobooks generated at the same time, each in separate process (default: 1)')
+    parser.add_argument('--watch', action='store_true',
+                        help='after generation keep running and generate again books whose files are changed')
+    parser.add_argument('--check', action='store_true',
+                        help='only check all books for errors (names of files, languages, markup), '
+                             'nothing is generated')
+    parser.add_argument('--queue', metavar='FILE',
+                        help='generate files with workers of work queue '
+                             '(SQLite file, can be on storage shared by hosts)')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='number of workers of queue started on this host by coordinator (default: 1)')
+    parser.add_argument('--worker', action='store_true',
+                        help='run as worker of queue: generate files put into queue by coordinator')
+    args = parser.parse_args()
+    if args.config is None:
+        parser.print_help()
+        return 0
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.watch and args.jobs > 1:
+        parser.error('--watch cant be used together with --jobs')
+    if args.check and args.watch:
+        parser.error('--check cant be used together with --watch')
+    if args.worker and args.queue is None:
+        parser.error('--worker requires --queue')
+    if args.workers < 0:
+        parser.error('--workers cant be negative')
+    if args.queue is not None and (args.jobs > 1 or args.watch):
+        parser.error('--queue cant be used together with --jobs or --watch')
+
+    print('Processing config: ', args.config)
+    try:
+        if args.check:
+            return run_safely(check_books, args.config)
+        if args.worker:
+            return run_safely(run_worker, args.config, args.queue)
+        exit_code = run_safely(process_books, args.config, args.jobs, None, args.queue, args.workers)
+        if args.watch and GlobalConfig.is_read():
+            from creatorTools.BookWatcher import BookWatcher
+            BookWatcher(args.config).watch(
+                lambda book_configs: run_safely(process_books, args.config, 1, book_configs))
+    finally:
+        # metrics collected so far are written also if run is stopped by error
+        Metrics.close()
+    return exit_code
+
+
+# processes generating books in parallel import this module too
+if __name__ == '__main__':
+    sys.exit(main())
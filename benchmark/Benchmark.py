@@ -0,0 +1,251 @@
+"""
+Offline benchmark of AudiobookCreator. Books are generated synthetically and read by fake engines,
+so no network is used. Every run of scenario is done in separate process, so peak memory is measured for it only.
+Result is written as JSON and it can be compared with result of previous run (baseline) to find regressions.
+
+Example:
+    python benchmark/Benchmark.py --repeat 3 --output bench.json --baseline previous_bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+# books: number of books, sections: number of MP3 files in each book, section_length: characters in section,
+# lang_density: sections in other language per 1000 characters, config: additional parameters of global config
+SCENARIOS = {
+    'google-small': {'engine': 'google translate', 'books': 2, 'sections': 20, 'section_length': 600,
+                     'lang_density': 2, 'config': {}},
+    'google-large': {'engine': 'google translate', 'books': 1, 'sections': 100, 'section_length': 2000,
+                     'lang_density': 1, 'config': {}},
+    'polly-chunks': {'engine': 'aws polly', 'books': 2, 'sections': 50, 'section_length': 6000,
+                     'lang_density': 1, 'config': {'polly_long_text': 'chunks', 'polly_sync_workers': 4}},
+    'polly-async': {'engine': 'aws polly', 'books': 1, 'sections': 20, 'section_length': 6000,
+                    'lang_density': 1, 'config': {'polly_long_text': 'async', 'polly_sync_workers': 4}},
+}
+
+STAGES = ['parse', 'encode', 'synthesize', 'concatenate', 'tag', 'hash write']
+
+# stages shorter than this (in seconds) are not compared with baseline - they are dominated by noise
+MIN_COMPARED_SECONDS = 0.01
+
+
+def instrument(timer):
+    """
+    Wraps methods of application representing stages of generation.
+    :param timer: StageTimer object
+    """
+    from creatorTools.BookParser import BookParser
+    from creatorTools.FileHashes import FileHashes
+    from creatorTools.Mp3Concatenation import Mp3Concatenation
+    from creatorTools.Mp3File import Mp3File
+    from creatorTools.Mp3FileFromAwsPolly import Mp3FileFromAwsPolly
+    from creatorTools.Mp3FileFromGoogleTranslate import Mp3FileFromGoogleTranslate
+    from creatorTools.S3Transfer import S3Transfer
+    timer.wrap_generator(BookParser, 'iter_sections', 'parse')
+    timer.wrap(Mp3FileFromGoogleTranslate, 'encode_to_required_format', 'encode')
+    timer.wrap(Mp3FileFromAwsPolly, 'encode_to_required_format', 'encode')
+    timer.wrap(Mp3FileFromGoogleTranslate, '_transcode', 'synthesize')
+    timer.wrap(Mp3FileFromAwsPolly, '_synthesize_cached', 'synthesize')
+    timer.wrap(Mp3FileFromAwsPolly, 'schedule_mp3_generation', 'synthesize')
+    timer.wrap(S3Transfer, 'download', 'synthesize')
+    timer.wrap(Mp3Concatenation, 'concatenate', 'concatenate')
+    timer.wrap(Mp3File, '_id3_tag', 'tag')
+    timer.wrap(FileHashes, 'update_hash', 'hash write')
+    timer.wrap(FileHashes, 'write_file_hashes', 'hash write')
+
+
+def peak_rss_mb():
+    """
+    Returns peak memory used by this process in MB, or None if it cant be read on this system.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # in bytes on macOS, in kilobytes on other systems
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_scenario(name, work_dir, latency, task_latency):
+    """
+    Runs one scenario in current process.
+    :return: map with measurements
+    """
+    import yaml
+    from benchmark.BookGenerator import BookGenerator
+    from benchmark.FakeEngines import FakeGoogleTranslate, FakePollyClient
+    from benchmark.StageTimer import StageTimer
+    from creatorTools.GlobalConfig import GlobalConfig
+    scenario = SCENARIOS[name]
+    books = [BookGenerator.generate(work_dir, 'book{}'.format(no), scenario['sections'],
+                                    scenario['section_length'], scenario['lang_density'])
+             for no in range(1, scenario['books'] + 1)]
+    config = {'reading_engine': scenario['engine'], 'audiobooks': books, 'aws_region': 'us-east-1',
+              'aws_access_key_id': 'benchmark', 'aws_secret_access_key': 'benchmark',
+              's3bucket': 'benchmark-bucket', 'check_delay': 1, 'check_delay_max': 1, 'max_sync': 3000}
+    config.update(scenario['config'])
+    config_file = os.path.join(work_dir, 'config.yaml')
+    with open(config_file, 'w', encoding='utf-8') as file:
+        file.write(yaml.dump(config))
+
+    GlobalConfig.read_global_config(config_file)
+    if scenario['engine'] == 'aws polly':
+        engine = FakePollyClient.install(latency, task_latency)
+    else:
+        FakeGoogleTranslate.install(latency)
+        engine = FakeGoogleTranslate
+    timer = StageTimer()
+    instrument(timer)
+
+    import AudiobookCreator
+    sys.argv = ['AudiobookCreator.py', config_file]
+    start = time.perf_counter()
+    exit_code = AudiobookCreator.main()
+    wall = time.perf_counter() - start
+    return {'exit_code': exit_code, 'wall_seconds': round(wall, 6), 'stages': timer.report(),
+            'peak_rss_mb': peak_rss_mb(), 'engine_requests': engine.requests,
+            'files': scenario['books'] * scenario['sections']}
+
+
+def run_in_process(name, repeat_no, args):
+    """
+    Runs one scenario in separate process and reads its result.
+    """
+    work_dir = tempfile.mkdtemp(prefix='audiobook-bench-')
+    result_file = os.path.join(work_dir, 'result.json')
+    command = [sys.executable, os.path.abspath(__file__), '--run-one', name, '--work-dir', work_dir,
+               '--result', result_file, '--latency', str(args.latency), '--task-latency', str(args.task_latency)]
+    try:
+        output = None if args.verbose else subprocess.DEVNULL
+        subprocess.run(command, stdout=output, stderr=output, check=False)
+        try:
+            with open(result_file, encoding='utf-8') as file:
+                result = json.load(file)
+        except (OSError, ValueError):
+            result = {'exit_code': None}
+        if result['exit_code'] != 0:
+            print('[ERROR] Scenario {} (run {}) failed. Use --verbose to see its log.'.format(name, repeat_no))
+            return None
+        return result
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def summarize(runs):
+    """
+    Joins results of many runs of one scenario: median of times, maximum of memory.
+    """
+    stages = {}
+    for stage in STAGES:
+        times = [run['stages'].get(stage, {'seconds': 0.0})['seconds'] for run in runs]
+        calls = [run['stages'].get(stage, {'calls': 0})['calls'] for run in runs]
+        stages[stage] = {'seconds': round(statistics.median(times), 6), 'calls': max(calls)}
+    rss = [run['peak_rss_mb'] for run in runs if run['peak_rss_mb'] is not None]
+    return {'runs': len(runs),
+            'wall_seconds': round(statistics.median(run['wall_seconds'] for run in runs), 6),
+            'wall_seconds_all': [run['wall_seconds'] for run in runs],
+            'stages': stages,
+            'peak_rss_mb': max(rss) if len(rss) > 0 else None,
+            'engine_requests': runs[0]['engine_requests'],
+            'files': runs[0]['files']}
+
+
+def find_regressions(current, baseline, threshold):
+    """
+    Compares results with baseline.
+    :param threshold: allowed growth of value, in percents
+    :return: list of metrics that grew more than threshold
+    """
+    regressions = []
+    for name, result in current.items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        metrics = [('wall_seconds', result['wall_seconds'], base.get('wall_seconds')),
+                   ('peak_rss_mb', result['peak_rss_mb'], base.get('peak_rss_mb'))]
+        for stage in STAGES:
+            metrics.append(('stages.' + stage, result['stages'][stage]['seconds'],
+                            base.get('stages', {}).get(stage, {}).get('seconds')))
+        for metric, value, base_value in metrics:
+            if value is None or base_value is None:
+                continue
+            if metric != 'peak_rss_mb' and base_value < MIN_COMPARED_SECONDS:
+                continue
+            change = (value - base_value) / base_value * 100 if base_value > 0 else 0.0
+            if change > threshold:
+                regressions.append({'scenario': name, 'metric': metric, 'baseline': base_value,
+                                    'current': value, 'change_percent': round(change, 1)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of AudiobookCreator with fake reading engines.')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run, can be given many times (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs of every scenario (default: 3)')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds of every request to fake engine (default: 0.05)')
+    parser.add_argument('--task-latency', type=float, default=2.0,
+                        help='seconds after which asynchronous task of fake Polly is completed (default: 2)')
+    parser.add_argument('--output', help='file where result is written as JSON (default: standard output)')
+    parser.add_argument('--baseline', help='result of previous benchmark, to find regressions')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='growth of metric (in percents) reported as regression (default: 10)')
+    parser.add_argument('--verbose', action='store_true', help='show log of runs')
+    # used internally, to run one scenario in separate process
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        os.chdir(args.work_dir)
+        result = run_scenario(args.run_one, args.work_dir, args.latency, args.task_latency)
+        with open(args.result, 'w', encoding='utf-8') as file:
+            json.dump(result, file)
+        return 0
+
+    results = {}
+    for name in args.scenario or sorted(SCENARIOS):
+        runs = []
+        for repeat_no in range(1, args.repeat + 1):
+            run = run_in_process(name, repeat_no, args)
+            if run is None:
+                return 2
+            runs.append(run)
+            print('{} run {}: {:.3f} s'.format(name, repeat_no, run['wall_seconds']), file=sys.stderr)
+        results[name] = summarize(runs)
+
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+              'platform': platform.platform(), 'latency': args.latency, 'task_latency': args.task_latency,
+              'scenarios': results, 'regressions': []}
+    if args.baseline is not None:
+        with open(args.baseline, encoding='utf-8') as file:
+            report['baseline'] = args.baseline
+            report['regressions'] = find_regressions(results, json.load(file), args.threshold)
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    for regression in report['regressions']:
+        print('[REGRESSION] {scenario} {metric}: {baseline} -> {current} (+{change_percent}%)'.format(**regression),
+              file=sys.stderr)
+    return 1 if len(report['regressions']) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import os
+import random
+
+import yaml
+
+# words used to build sentences, they dont have to make sense
+_WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do', 'eiusmod',
+          'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua', 'enim', 'ad', 'minim', 'veniam',
+          'quis', 'nostrud', 'exercitation', 'ullamco', 'laboris', 'nisi', 'aliquip', 'ex', 'ea', 'commodo']
+_LANGUAGES = ['ENG', 'US', 'GER', 'FR', 'ES', 'IT']
+
+
+class BookGenerator:
+    """
+    Class generating synthetic books: book file with text, yaml file describing book and directory for MP3 files.
+    Text is random, but it is always the same for the same parameters (seed).
+    """
+
+    @staticmethod
+    def generate(directory, name, sections, section_length, lang_density, seed=0):
+        """
+        Creates book in given directory.
+        :param directory: directory where files of book are created
+        :param name: name of book, used as name of files
+        :param sections: number of sections (MP3 files) in book
+        :param section_length: approximate number of characters in one section
+        :param lang_density: number of sections in other language per 1000 characters of text
+        :param seed: seed of random generator
+        :return: path of yaml file of book
+        """
+        rand = random.Random('{}-{}'.format(name, seed))
+        os.makedirs(directory, exist_ok=True)
+        book_file = os.path.join(directory, name + '.book')
+        with open(book_file, 'w', encoding='utf-8') as file:
+            for number in range(1, sections + 1):
+                file.write('@@{:0>3d}-{}_{}.mp3@\n'.format(number, name.title(), number))
+                file.write(BookGenerator._section_text(rand, section_length, lang_density))
+                file.write('\n')
+        yaml_file = os.path.join(directory, name + '.yaml')
+        with open(yaml_file, 'w', encoding='utf-8') as file:
+            file.write(yaml.dump({
+                'BookFile': book_file,
+                'HashFile': os.path.join(directory, name + '.hsh'),
+                'ResultDir': os.path.join(directory, name),
+                'MainLanguage': 'pl',
+                'Album': name.title(),
+                'Artist': 'Benchmark',
+                'AlbumArtist': 'Benchmark',
+                'AlbumDate': '2021'
+            }))
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+        return yaml_file
+
+    @staticmethod
+    def _section_text(rand, length, lang_density):
+        text = []
+        size = 0
+        while size < length:
+            sentence = BookGenerator._sentence(rand)
+            if rand.random() < lang_density * len(sentence) / 1000:
+                sentence = '@{} {}@ '.format(rand.choice(_LANGUAGES), sentence)
+            text.append(sentence)
+            size += len(sentence)
+            if rand.random() < 0.1:
+                text.append('\n')
+        return ''.join(text)
+
+    @staticmethod
+    def _sentence(rand):
+        words = [rand.choice(_WORDS) for _ in range(rand.randint(4, 16))]
+        return ' '.join(words).capitalize() + '. '
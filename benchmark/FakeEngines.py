@@ -0,0 +1,163 @@
+import io
+import threading
+import time
+import uuid
+
+# MPEG-1 Layer III frame: 128 kbps, 44100 Hz, joint stereo, no padding - 417 bytes, 26 ms of audio
+_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+_CHARS_PER_FRAME = 4    # about 10 characters of text are read in one second
+
+
+def mp3_frames(text):
+    """
+    Returns pregenerated MP3 frames, with length of audio depending on length of text.
+    """
+    return _FRAME * max(1, len(text) // _CHARS_PER_FRAME)
+
+
+class FakeGoogleTranslate:
+    """
+    Stand-in for gtts.gTTS class that doesnt use network. It waits for configured time and writes MP3 frames.
+    """
+    latency = 0.0   # seconds of every request
+    requests = 0
+    _lock = threading.Lock()
+
+    def __init__(self, text, lang):
+        self.text = text
+        self.lang = lang
+
+    def save(self, savefile):
+        with open(savefile, 'wb') as file:
+            self.write_to_fp(file)
+
+    def write_to_fp(self, fp):
+        with FakeGoogleTranslate._lock:
+            FakeGoogleTranslate.requests += 1
+        time.sleep(FakeGoogleTranslate.latency)
+        fp.write(mp3_frames(self.text))
+
+    @staticmethod
+    def install(latency):
+        """
+        Replaces gTTS class used by Mp3FileFromGoogleTranslate.
+        :param latency: seconds of every request
+        """
+        import gtts
+        FakeGoogleTranslate.latency = latency
+        gtts.gTTS = FakeGoogleTranslate
+
+
+class FakePollyClient:
+    """
+    Stand-in for client of AWS Polly. Synchronous requests wait for configured time and return MP3 frames.
+    Asynchronous task puts its file into S3 bucket (served by moto) when its time passes - it is done
+    when tasks are listed or read, like if Polly was finishing them in the background.
+    """
+
+    def __init__(self, latency, task_latency):
+        """
+        :param latency: seconds of every synchronous request
+        :param task_latency: seconds after which asynchronous task is completed
+        """
+        self.latency = latency
+        self.task_latency = task_latency
+        self.requests = 0
+        self._tasks = {}    # {task id: [description of task, text, time of completion]}
+        self._lock = threading.Lock()
+
+    def synthesize_speech(self, Text, OutputFormat, VoiceId, TextType):
+        self._count()
+        time.sleep(self.latency)
+        return {'AudioStream': io.BytesIO(mp3_frames(Text)), 'ContentType': 'audio/mpeg'}
+
+    def start_speech_synthesis_task(self, Text, OutputFormat, VoiceId, TextType, OutputS3BucketName,
+                                    OutputS3KeyPrefix=''):
+        self._count()
+        time.sleep(self.latency)
+        task_id = str(uuid.uuid4())
+        task = {'TaskId': task_id, 'TaskStatus': 'scheduled', 'OutputFormat': OutputFormat, 'VoiceId': VoiceId,
+                'OutputUri': 's3://{}/{}{}.mp3'.format(OutputS3BucketName, OutputS3KeyPrefix, task_id)}
+        with self._lock:
+            self._tasks[task_id] = [task, Text, time.monotonic() + self.task_latency,
+                                    OutputS3BucketName, OutputS3KeyPrefix + task_id + '.mp3']
+        return {'SynthesisTask': dict(task)}
+
+    def get_speech_synthesis_task(self, TaskId):
+        self._count()
+        self._complete_tasks()
+        with self._lock:
+            if TaskId not in self._tasks:
+                from botocore.exceptions import ClientError
+                raise ClientError({'Error': {'Code': 'SynthesisTaskNotFoundException', 'Message': TaskId}},
+                                  'GetSpeechSynthesisTask')
+            return {'SynthesisTask': dict(self._tasks[TaskId][0])}
+
+    def list_speech_synthesis_tasks(self, MaxResults=100, NextToken=None, Status=None):
+        self._count()
+        self._complete_tasks()
+        with self._lock:
+            tasks = [dict(entry[0]) for entry in self._tasks.values()
+                     if Status is None or entry[0]['TaskStatus'] == Status]
+        start = int(NextToken or 0)
+        response = {'SynthesisTasks': tasks[start:start + MaxResults]}
+        if start + MaxResults < len(tasks):
+            response['NextToken'] = str(start + MaxResults)
+        return response
+
+    def get_paginator(self, operation_name):
+        return _FakePaginator(getattr(self, operation_name))
+
+    def _count(self):
+        with self._lock:
+            self.requests += 1
+
+    def _complete_tasks(self):
+        from creatorTools.GlobalConfig import GlobalConfig
+        now = time.monotonic()
+        with self._lock:
+            ready = [entry for entry in self._tasks.values()
+                     if entry[0]['TaskStatus'] == 'scheduled' and entry[2] <= now]
+            for entry in ready:
+                entry[0]['TaskStatus'] = 'inProgress'
+        for entry in ready:
+            GlobalConfig.get_aws_client('s3').put_object(Bucket=entry[3], Key=entry[4], Body=mp3_frames(entry[1]))
+            with self._lock:
+                entry[0]['TaskStatus'] = 'completed'
+
+    @staticmethod
+    def install(latency, task_latency):
+        """
+        Starts moto mock of AWS and puts fake client of Polly into clients shared by application.
+        Global config has to be read before.
+        :param latency: seconds of every synchronous request
+        :param task_latency: seconds after which asynchronous task is completed
+        :return: fake client of Polly
+        """
+        try:
+            from moto import mock_aws
+        except ImportError as ex:
+            from creatorTools.Exceptions import GlobalException
+            raise GlobalException('Package moto is required to benchmark AWS Polly (pip install moto).', ex)
+        mock_aws().start()
+        from creatorTools.GlobalConfig import GlobalConfig
+        client = FakePollyClient(latency, task_latency)
+        with GlobalConfig._aws_lock:
+            GlobalConfig._aws_clients['polly'] = client
+        return client
+
+
+class _FakePaginator:
+
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, PaginationConfig=None, **arguments):
+        page_size = (PaginationConfig or {}).get('PageSize', 100)
+        token = None
+        while True:
+            page = self.method(MaxResults=page_size, NextToken=token, **arguments)
+            yield page
+            token = page.get('NextToken')
+            if token is None:
+                return
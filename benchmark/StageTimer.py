@@ -0,0 +1,89 @@
+import functools
+import threading
+import time
+
+
+class StageTimer:
+    """
+    Class measuring time spent in stages of generation. Methods of application are wrapped, so that
+    time of every call is added to its stage. Time of stage doesnt include time of other stages called
+    inside of it (i.e. writing hash while tagging file). Stages running in many threads are summed up,
+    so total time of stages can be longer than time of whole run.
+    """
+
+    def __init__(self):
+        self.seconds = {}   # {stage: seconds}
+        self.calls = {}     # {stage: number of calls}
+        self._lock = threading.Lock()
+        self._local = threading.local()     # stack of stages called in current thread
+
+    def wrap(self, owner, method_name, stage):
+        """
+        Replaces method of class with one that measures its time.
+        :param owner: class
+        :param method_name: name of method
+        :param stage: name of stage
+        """
+        descriptor = owner.__dict__[method_name]
+        is_static = isinstance(descriptor, staticmethod)
+        method = descriptor.__func__ if is_static else descriptor
+
+        @functools.wraps(method)
+        def measured(*args, **kwargs):
+            self._enter(stage)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._leave()
+        setattr(owner, method_name, staticmethod(measured) if is_static else measured)
+
+    def wrap_generator(self, owner, method_name, stage):
+        """
+        Like wrap, but for static method returning generator - time of getting every element is measured.
+        """
+        method = owner.__dict__[method_name].__func__
+
+        @functools.wraps(method)
+        def measured(*args, **kwargs):
+            generator = method(*args, **kwargs)
+            while True:
+                self._enter(stage)
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+                finally:
+                    self._leave()
+                yield item
+        setattr(owner, method_name, staticmethod(measured))
+
+    def report(self):
+        """
+        :return: map {stage: {'seconds': time, 'calls': number of calls}}
+        """
+        with self._lock:
+            return {stage: {'seconds': round(self.seconds[stage], 6), 'calls': self.calls[stage]}
+                    for stage in sorted(self.seconds)}
+
+    def _enter(self, stage):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        now = time.perf_counter()
+        if len(stack) > 0:
+            # outer stage is paused
+            self._add(stack[-1][0], now - stack[-1][1], 0)
+        stack.append([stage, now])
+
+    def _leave(self):
+        stack = self._local.stack
+        now = time.perf_counter()
+        stage, start = stack.pop()
+        self._add(stage, now - start, 1)
+        if len(stack) > 0:
+            stack[-1][1] = now
+
+    def _add(self, stage, seconds, calls):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + calls
@@ -0,0 +1,136 @@
+"""
+Benchmark of start of AudiobookCreator. It measures commands that dont generate anything: showing help and run
+of config whose books are not changed (no-op run). Every command is run in new process with 'python -X importtime',
+so time of imports of every module is known, and it is checked that libraries of reading engines are not imported.
+
+Example:
+    python benchmark/StartupBenchmark.py --repeat 10 --max-ms 300
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CREATOR = os.path.join(ROOT_DIR, 'AudiobookCreator.py')
+
+# modules that are not needed to start - they should be imported only when something is generated
+HEAVY_MODULES = ['asyncio', 'boto3', 'botocore', 'gtts', 'multiprocessing', 'mutagen', 'pydub', 'requests']
+
+TOP_MODULES = 10
+
+
+def prepare_noop(work_dir):
+    """
+    Generates books once (with fake engine), so that next runs of the same config have nothing to do.
+    :return: path of global config
+    """
+    command = [sys.executable, os.path.join(ROOT_DIR, 'benchmark', 'Benchmark.py'), '--run-one', 'google-small',
+               '--work-dir', work_dir, '--result', os.path.join(work_dir, 'result.json'), '--latency', '0']
+    subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return os.path.join(work_dir, 'config.yaml')
+
+
+def parse_importtime(output):
+    """
+    Reads output of 'python -X importtime'.
+    :return: map {module: cumulative time in microseconds} for modules imported directly by program (not nested)
+             and map {module: self time in microseconds} for all modules
+    """
+    top_level = {}
+    self_times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        module = name.strip()
+        self_times[module] = self_times.get(module, 0) + int(self_us)
+        if name.startswith(' ') and not name.startswith('  '):
+            top_level[module] = int(cumulative_us)
+    return top_level, self_times
+
+
+def measure(command, work_dir):
+    """
+    Runs command once.
+    :return: map with wall time, time of imports and imported heavy modules
+    """
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime'] + command, cwd=work_dir,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=False)
+    wall = time.perf_counter() - start
+    top_level, self_times = parse_importtime(completed.stderr)
+    heavy = sorted(module for module in HEAVY_MODULES if module in self_times)
+    return {'exit_code': completed.returncode, 'wall_ms': wall * 1000,
+            'import_ms': sum(top_level.values()) / 1000, 'top_level': top_level, 'heavy_modules': heavy}
+
+
+def summarize(runs):
+    """
+    Joins results of many runs of one command: median of times, modules from last run.
+    """
+    top = sorted(runs[-1]['top_level'].items(), key=lambda item: item[1], reverse=True)[:TOP_MODULES]
+    return {'runs': len(runs),
+            'wall_ms': round(statistics.median(run['wall_ms'] for run in runs), 1),
+            'wall_ms_all': [round(run['wall_ms'], 1) for run in runs],
+            'import_ms': round(statistics.median(run['import_ms'] for run in runs), 1),
+            'top_imports_ms': {module: round(cumulative / 1000, 1) for module, cumulative in top},
+            'heavy_modules': runs[-1]['heavy_modules']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of start of AudiobookCreator (help and no-op run).')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs of every command (default: 5)')
+    parser.add_argument('--output', help='file where result is written as JSON (default: standard output)')
+    parser.add_argument('--max-ms', type=float,
+                        help='maximal median wall time of command (in milliseconds), exit code is 1 if it is exceeded')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='audiobook-startup-')
+    try:
+        commands = {'help': [CREATOR, '--help'], 'noop': [CREATOR, prepare_noop(work_dir)]}
+        # python itself, to know which part of time is not spent by program
+        commands['interpreter'] = ['-c', 'pass']
+        results = {}
+        for name, command in commands.items():
+            runs = []
+            for _ in range(args.repeat):
+                run = measure(command, work_dir)
+                if run['exit_code'] != 0:
+                    print('[ERROR] Command {} failed with exit code {}.'.format(name, run['exit_code']))
+                    return 2
+                runs.append(run)
+            results[name] = summarize(runs)
+            print('{}: {:.1f} ms'.format(name, results[name]['wall_ms']), file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    failures = []
+    for name, result in results.items():
+        if name == 'interpreter':
+            continue
+        if len(result['heavy_modules']) > 0:
+            failures.append('{} imports {}'.format(name, ', '.join(result['heavy_modules'])))
+        if args.max_ms is not None and result['wall_ms'] > args.max_ms:
+            failures.append('{} takes {} ms, more than {} ms'.format(name, result['wall_ms'], args.max_ms))
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+              'platform': platform.platform(), 'commands': results, 'failures': failures}
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    for failure in failures:
+        print('[SLOW START] ' + failure, file=sys.stderr)
+    return 1 if len(failures) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import asyncio
+import time
+
+from creatorTools.Exceptions import ReaderException
+from creatorTools.GlobalConfig import GlobalConfig
+from creatorTools.Metrics import Metrics
+from creatorTools.ReaderLog import ReaderLog
+
+
+class AsyncTaskManager:
+    """
+    Class waiting for asynchronous generation of MP3 files, based on asyncio.
+    Statuses of all tasks are read together, with one listing of tasks, in cycles. Delay between cycles grows
+    while no task is finished. File is downloaded and tagged as soon as its task is completed,
+    independently of other tasks. Synchronous generation of books runs at the same time in separate thread.
+    """
+
+    def __init__(self):
+        self.books = []     # books with asynchronous generation
+        self._loop = None
+        self._waiting = {}  # {task id: (book, mp3)} for tasks that are not finished yet
+        self._pending = set()   # asyncio tasks: poller and downloads of finished files
+        self._poller = None
+        self._all_files = 0
+        self._done_files = 0
+        self._all_chars = 0     # length of text of all files, to calculate throughput
+        self._done_chars = 0
+        self._first_start = None    # time when first task was watched
+        self._task_start = {}   # {task id: time when task was watched}
+        self._deadline = None
+        self.on_file_finished = None    # function called with book and mp3 object when file is finished
+        self.error = None   # exception that stopped watching of tasks, set before producer ends
+
+    def run(self, producer):
+        """
+        Runs producer in separate thread and waits until it ends and until all asynchronous tasks are finished.
+        :param producer: function with one parameter - this object. It generates books and calls add_book for each
+                         book that started asynchronous generation (or add_task for every started task).
+        :return: true if there were no errors in asynchronous generation
+        """
+        asyncio.run(self._main(producer))
+        return not any(book.errors_in_async for book in self.books)
+
+    def add_book(self, book):
+        """
+        Starts watching all asynchronous tasks of book. Can be called from any thread.
+        :param book: BookFiles object
+        """
+        self._loop.call_soon_threadsafe(self._watch_book, book)
+
+    def add_task(self, book, mp3):
+        """
+        Starts watching one asynchronous task of book. Can be called from any thread.
+        :param book: BookFiles object
+        :param mp3: object of file, with id of started task
+        """
+        self._loop.call_soon_threadsafe(self._watch_file, book, mp3)
+
+    def _watch_book(self, book):
+        for mp3 in book.mp3_map.values():
+            if getattr(mp3, 'task_id', None) is not None:
+                self._watch_file(book, mp3)
+
+    def _watch_file(self, book, mp3):
+        if len(self.books) == 0:
+            ReaderLog.log_par('Waiting for generation of files.')
+        if book not in self.books:
+            self.books.append(book)
+        self._waiting[mp3.task_id] = (book, mp3)
+        self._task_start[mp3.task_id] = time.monotonic()
+        self._all_files += 1
+        self._all_chars += len(mp3.polly_text)
+        if self._first_start is None:
+            self._first_start = time.monotonic()
+        self._start_poller()
+
+    def _start_poller(self):
+        if len(self._waiting) > 0 and (self._poller is None or self._poller.done()):
+            self._poller = self._start(self._poll())
+
+    def _start(self, coroutine):
+        task = self._loop.create_task(coroutine)
+        self._pending.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None and self.error is None:
+            # producer waiting for finished files is informed, exception is raised again by _wait_pending
+            self.error = task.exception()
+            self._pending.add(task)
+
+    async def _main(self, producer):
+        self._loop = asyncio.get_running_loop()
+        timeout = GlobalConfig.get_async_timeout()
+        if timeout is not None:
+            self._deadline = time.monotonic() + timeout
+        try:
+            await asyncio.to_thread(producer, self)
+            # all tasks are known now - waiting for them without any additional delay
+            if len(self._pending) > 0:
+                with Metrics.span('async_wait'):
+                    await self._wait_pending(timeout)
+        finally:
+            for task in self._pending:
+                task.cancel()
+
+    async def _wait_pending(self, timeout):
+        while len(self._pending) > 0:
+            remaining = None if self._deadline is None else max(0.0, self._deadline - time.monotonic())
+            done, _ = await asyncio.wait(set(self._pending), timeout=remaining,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if len(done) == 0:
+                from creatorTools.Exceptions import GlobalException
+                raise GlobalException('Asynchronous generation of {} files not finished in {} seconds.'
+                                      .format(self._all_files - self._done_files, timeout), None)
+            for task in done:
+                task.result()   # unexpected exceptions stop processing
+
+    async def _poll(self):
+        """
+        Reads statuses of all waiting tasks in cycles, until there are no waiting tasks.
+        Number of requests in one cycle doesnt depend on number of tasks.
+        """
+        delay = GlobalConfig.get_check_delay()
+        while len(self._waiting) > 0:
+            await asyncio.sleep(delay)
+            mp3_class = type(next(iter(self._waiting.values()))[1])
+            statuses = await asyncio.to_thread(mp3_class.list_tasks, set(self._waiting))
+            finished = 0
+            for task_id in list(self._waiting):
+                status = statuses.get(task_id)
+                if status is not None and status['TaskStatus'] in ('scheduled', 'inProgress'):
+                    continue
+                # task is finished, or it is not known to reading engine (file fails then)
+                book, mp3 = self._waiting.pop(task_id)
+                self._start(self._finish_file(book, mp3, status))
+                finished += 1
+            if finished > 0:
+                delay = GlobalConfig.get_check_delay()
+            else:
+                delay = min(delay * 1.5, GlobalConfig.get_check_delay_max())
+            if len(self._waiting) > 0:
+                ReaderLog.progress(self._progress_message() + ' Next check in {:.0f} s.  '.format(delay))
+
+    async def _finish_file(self, book, mp3, status):
+        """
+        Downloads and tags file of finished task in separate thread.
+        """
+        task_id = mp3.task_id
+        finished = True
+        try:
+            if status is None:
+                from creatorTools.Exceptions import Mp3Exception
+                raise Mp3Exception('Task {} of file {} is unknown to AWS.'.format(task_id, mp3.file_name), None)
+            if not await asyncio.to_thread(mp3.check_save_task, status):
+                # not finished yet - it will be checked in next cycle
+                finished = False
+                self._waiting[task_id] = (book, mp3)
+                self._start_poller()
+                return
+        except ReaderException as error:
+            error.print_error_message()
+            mp3.task_id = None  # error occurred - we will ignore this task anyway
+            book.errors_in_async = True
+            # task is not resumed by next run - file is generated again
+            book.task_state.remove(mp3.file_tile)
+        else:
+            Metrics.record('async_task', time.monotonic() - self._task_start[task_id], file=mp3.file_name)
+        finally:
+            if finished and self.on_file_finished is not None:
+                self.on_file_finished(book, mp3)
+        self._done_files += 1
+        self._done_chars += len(mp3.polly_text)
+        ReaderLog.progress(self._progress_message() + '  ')
+
+    def _progress_message(self):
+        """
+        Returns line with number of generated files, throughput (characters of text per minute) and estimated
+        time of end of generation.
+        """
+        message = 'Generated {}/{} files'.format(self._done_files, self._all_files)
+        elapsed = time.monotonic() - self._first_start
+        if self._done_chars == 0 or elapsed <= 0:
+            return message + ', ETA unknown.'
+        rate = self._done_chars / elapsed
+        eta = int((self._all_chars - self._done_chars) / rate)
+        return message + ', {:.0f} characters/min, ETA {}:{:0>2d}:{:0>2d}.'.format(rate * 60, eta // 3600,
+                                                                                 eta // 60 % 60, eta % 60)
@@ -1,9 +1,12 @@
 import os
 
+from creatorTools.BookManifest import BookManifest
+from creatorTools.BookParser import BookParser
 from creatorTools.FileHashes import FileHashes
 from creatorTools.GlobalConfig import GlobalConfig
-from creatorTools.Mp3FileFromAwsPolly import Mp3FileFromAwsPolly
+from creatorTools.Metrics import Metrics
 from creatorTools.ReaderLog import ReaderLog
+from creatorTools.TaskState import TaskState
 
 
 class BookFiles:
@@ -15,108 +18,262 @@ class BookFiles:
         *.yaml file describing configuration of Book.
     """
 
-    def __init__(self, yaml_path):
+    def __init__(self, yaml_path, state=None):
         """
         Reads path to yaml file that keeps all parameters about Book.
         Initializes all main variables.
         :param yaml_path: absolute or relative path
+        :param state: map returned by get_state in other process - files of book are not read again then
         """
         self.yaml_file = yaml_path
+        self.manifest = BookManifest(yaml_path)
+        self.mp3_map = {}
+        self.mp3_all_present = []
+        self.errors_in_async = False    # set to True if in any async generation errors were present
+        self.single_file = None     # name of audiobook file with chapters, if it is created
+        if state is not None:
+            self.yaml_config = state['yaml_config']
+            self.file_hashes = FileHashes(self.yaml_config['HashFile'])
+            self.file_hashes.hashes = state['hashes']
+            self.task_state = TaskState(self.yaml_config['HashFile'])
+            self.task_state.tasks = state['tasks']
+            self.manifest.captured = state['manifest']
+            self.manifest.hash_path = self.yaml_config['HashFile']
+            self.mp3_all_present = state['mp3_all_present']
+            return
         a_yaml_file = open(self.yaml_file, encoding='utf8')
         import yaml
         self.yaml_config = yaml.load(a_yaml_file, Loader=yaml.FullLoader)
         self.file_hashes = FileHashes(self.yaml_config['HashFile'])
         self.file_hashes.read_file_hashes()
-        # divide text into parts that will represent individual MP3s.
+        self.task_state = TaskState(self.yaml_config['HashFile'])
+        self.task_state.read()
+        # text is divided into parts that represent individual MP3s later, while book file is parsed
         try:
-            self.file_texts = open(self.yaml_config['BookFile'], encoding='utf8').read().replace("\n", "  ").split('@@')
+            open(self.yaml_config['BookFile'], encoding='utf8').close()
         except OSError as ex:
             from creatorTools.Exceptions import BookException
             raise BookException('Cant open for reading file containing text of book: {} '
                                 .format(self.yaml_config['BookFile']), ex)
-        self.mp3_map = {}
-        self.mp3_all_present = []
-        self.errors_in_async = False    # set to True if in any async generation errors were present
+        self.manifest.capture(self.yaml_config['BookFile'], self.get_result_dir(), self.yaml_config['HashFile'])
 
     def parse_book_file(self):
-        for file_text in self.file_texts:
-            # if section part representing MP3 is empty
-            if len(file_text) == 0:
-                continue
-            # we split by first @ - before it there is name of MP3 file
-            struct = file_text.split('@', 1)
-            if len(struct) < 2:
-                continue
-            filename = struct[0]
+        with Metrics.span('parse_book_file', book=self.yaml_file):
+            self._parse_book_file()
+
+    def _parse_book_file(self):
+        # sections are read from file one by one
+        for section in BookParser.iter_sections(self.yaml_config['BookFile'], GlobalConfig.is_book_mmap_used()):
+            filename = section.name
             only_name = filename.split('-')
-            curr_hash = FileHashes.calc_hash(file_text)
-            if self.file_hashes.is_hash_processable(only_name[1].split('.')[0], curr_hash):
+            if len(only_name) < 2:
+                from creatorTools.Exceptions import BookException
+                raise BookException('Wrong name of MP3 file \'{}\' in line {} of file {} '
+                                    .format(filename, section.line, self.yaml_config['BookFile']), None)
+            if self.file_hashes.is_hash_processable(only_name[1].split('.')[0], section.hash):
                 # mp3 file is processable - hash of text is different from one from previous (existing mp3) version.
-                # params: text to read, table [num,filename with extension], hash of text, this object
-                # here we select proper class to generate data - depending on configuration
-                self.mp3_map[only_name[1]] = GlobalConfig.get_reading_object(struct[1], only_name, curr_hash, self)
+                self.mp3_map[only_name[1]] = self.create_mp3(section, only_name)
             # add all present mp3 files to check dir later
             self.mp3_all_present.append(filename)
 
+    def create_mp3(self, section, only_name):
+        """
+        Creates object generating MP3 file from section of book file.
+        :param section: BookSection object
+        :param only_name: table [num, filename with extension]
+        """
+        # here we select proper class to generate data - depending on configuration
+        mp3 = GlobalConfig.get_reading_object(section.text, only_name, section.hash, self)
+        mp3.set_source(section)
+        return mp3
+
     def print_generated(self):
         ReaderLog.log_inline('Files to be regenerated:')
         if len(self.mp3_map) == 0:
             ReaderLog.log(' none')
             return
-        for file in self.mp3_map.keys():
-            print(' ', end='')
-            print(file, end='')
-        print('')
+        ReaderLog.log(''.join(' ' + file for file in self.mp3_map.keys()))
 
     def generate_mp3(self):
+        self._resume_tasks()
+        workers = GlobalConfig.get_sync_workers()
+        if workers > 1:
+            return self._generate_mp3_concurrently(workers)
         async_gen = False
         for mp3 in self.mp3_map.values():
             ReaderLog.log_inline('Processing: {} ... '.format(mp3.file_tile))
-            size = mp3.encode_to_required_format()
-            if size <= GlobalConfig.get_max_sync_size():
+            size = self._encode(mp3)
+            if BookFiles.is_generated_synchronously(size):
                 # converting on-the-fly
                 ReaderLog.log_inline('generating and saving file ... ')
                 mp3.save_mp3()
                 ReaderLog.log('finished.')
             else:
-                # asynchronous generation
-                async_gen = True
-                mp3.schedule_mp3_generation()
-                ReaderLog.log('started asynchronous generation. ')
+                # asynchronous generation, unless file was taken from cache
+                self.schedule_mp3(mp3)
+                if mp3.task_id is not None:
+                    async_gen = True
+                    ReaderLog.log('started asynchronous generation. ')
+                else:
+                    ReaderLog.log('finished.')
         return async_gen
 
-    def check_async_gen(self):
+    def _generate_mp3_concurrently(self, workers):
         """
-        Checks status of offline mp3 generation
-        :return: true if all files were generated and downloaded, or if no files to generate
+        Generates files like generate_mp3, but up to given number of synchronous requests is processed at the same time.
+        Each file is tagged and its hash is saved as soon as it is finished.
+        :param workers: number of files generated at the same time
+        :return: true if asynchronous generation was started for any file
         """
-        all_generated = True
+        async_gen = False
+        sync_list = []
         for mp3 in self.mp3_map.values():
-            if mp3.task_id is not None:
-                # async generation
-                from creatorTools.Exceptions import ReaderException
-                try:
-                    tmp_res = mp3.check_save_task()
-                    all_generated = all_generated and tmp_res
-                except ReaderException as error:
-                    error.print_error_message()
-                    mp3.task_id = None  # error occurred - we will ignore this task anyway
-                    self.errors_in_async = True
-        return all_generated
+            size = self._encode(mp3)
+            if BookFiles.is_generated_synchronously(size):
+                sync_list.append(mp3)
+            else:
+                # asynchronous generation, unless file was taken from cache
+                self.schedule_mp3(mp3)
+                if mp3.task_id is not None:
+                    async_gen = True
+                    ReaderLog.log('Processing: {} ... started asynchronous generation. '.format(mp3.file_tile))
+                else:
+                    ReaderLog.log('Processing: {} ... finished.'.format(mp3.file_tile))
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {executor.submit(mp3.save_mp3): mp3 for mp3 in sync_list}
+            for future in as_completed(futures):
+                future.result()
+                ReaderLog.log('Processing: {} ... finished.'.format(futures[future].file_tile))
+        finally:
+            # in case of error files not started yet are not generated
+            executor.shutdown(wait=True, cancel_futures=True)
+        return async_gen
+
+    def _resume_tasks(self):
+        """
+        Attaches asynchronous tasks started by previous run to files that are still to be generated from the same text.
+        Tasks that cant be resumed (text changed, task failed or is unknown to service) are removed
+        together with their results in bucket.
+        """
+        if len(self.task_state.tasks) == 0:
+            return
+        mp3_files = {mp3.file_tile: mp3 for mp3 in self.mp3_map.values()}
+        resumable = {}  # {task id: mp3 object}
+        if GlobalConfig.is_async_generation_used():
+            for name, task in self.task_state.tasks.items():
+                mp3 = mp3_files.get(name)
+                if mp3 is not None and mp3.raw_text_hash == task['hash']:
+                    resumable[task['task_id']] = mp3
+        if len(resumable) > 0:
+            statuses = type(next(iter(resumable.values()))).list_tasks(set(resumable))
+            for task_id, mp3 in resumable.items():
+                if statuses.get(task_id, {}).get('TaskStatus') in ('scheduled', 'inProgress', 'completed'):
+                    mp3.task_id = task_id
+                    mp3.s3_key = self.task_state.tasks[mp3.file_tile]['s3_key']
+        for name in list(self.task_state.tasks):
+            mp3 = mp3_files.get(name)
+            if mp3 is None or getattr(mp3, 'task_id', None) is None:
+                task = self.task_state.remove(name)
+                ReaderLog.log('Removing task {} of file {} started by previous run, it cant be resumed.'
+                              .format(task['task_id'], task['file']))
+                if GlobalConfig.is_async_generation_used():
+                    from creatorTools.S3Transfer import S3Transfer
+                    S3Transfer.delete(task['s3_key'])
+
+    def prepare_mp3(self):
+        """
+        Resumes tasks started by previous run and encodes texts of all files, so that they can be generated
+        in any order, i.e. by GenerationScheduler.
+        :return: list of tuples (mp3 object, size of encoded text)
+        """
+        self._resume_tasks()
+        return [(mp3, self._encode(mp3)) for mp3 in self.mp3_map.values()]
+
+    @staticmethod
+    def is_generated_synchronously(size):
+        return size <= GlobalConfig.get_max_sync_size() or not GlobalConfig.is_async_generation_used()
+
+    def schedule_mp3(self, mp3):
+        """
+        Starts asynchronous generation of file, unless task started by previous run is resumed.
+        """
+        if mp3.task_id is not None:
+            ReaderLog.log_inline('resumed task: {} ... '.format(mp3.task_id))
+            return
+        mp3.schedule_mp3_generation()
+        if mp3.task_id is not None:
+            self.task_state.add(mp3.file_tile, mp3.task_id, mp3.s3_key, mp3.raw_text_hash,
+                                os.path.join(self.get_result_dir(), mp3.file_name))
+
+    @staticmethod
+    def _encode(mp3):
+        with Metrics.span('encode_to_required_format', file=mp3.file_name):
+            return mp3.encode_to_required_format()
+
+    def get_async_tasks(self):
+        """
+        Returns descriptions of files that are generated asynchronously, so that they can be finished by other process.
+        :return: list of maps with data required by attach_async_tasks
+        """
+        tasks = []
+        for name, mp3 in self.mp3_map.items():
+            if getattr(mp3, 'task_id', None) is not None:
+                tasks.append({'name': name, 'file_no': mp3.file_no, 'hash': mp3.raw_text_hash,
+                              'text': mp3.polly_text, 'task_id': mp3.task_id, 's3_key': mp3.s3_key})
+        return tasks
+
+    def get_state(self):
+        """
+        Returns state of book read from its files, so that other process can finish generation without reading them.
+        :return: map passed as state to constructor
+        """
+        return {'yaml_config': self.yaml_config, 'hashes': self.file_hashes.hashes, 'tasks': self.task_state.tasks,
+                'manifest': self.manifest.captured, 'mp3_all_present': self.mp3_all_present}
+
+    def attach_async_tasks(self, tasks):
+        """
+        Creates objects of files generated asynchronously by other process, without parsing book file.
+        :param tasks: list returned by get_async_tasks
+        """
+        for task in tasks:
+            mp3 = GlobalConfig.get_reading_object(task['text'], [task['file_no'], task['name']], task['hash'], self)
+            mp3.polly_text = task['text']
+            mp3.task_id = task['task_id']
+            mp3.s3_key = task['s3_key']
+            self.mp3_map[task['name']] = mp3
 
     def clear_book_dir(self):
-        # remove those files that are not present in book text anymore
+        # remove those files that are not present in book text anymore, files being written (.tmp) are kept
         list_dir = os.listdir(self.get_result_dir())
         for file in list_dir:
-            if '.mp3' in file.lower() and file not in self.mp3_all_present:
+            if '.mp3' in file.lower() and not file.lower().endswith('.tmp') and file not in self.mp3_all_present:
                 ReaderLog.log('Removing not used file {} from {}'.format(file, self.get_result_dir()))
                 os.remove(os.path.join(self.get_result_dir(), file))
 
     def update_and_save_hashes(self, only_name, new_hash):
-        # write file after each successful conversion
+        # save hash after each successful conversion, it can be called from many threads at the same time
         self.file_hashes.update_hash(only_name, new_hash)
+        # file is ready, so its asynchronous task doesnt have to be resumed
+        self.task_state.remove(only_name)
+
+    def save_hashes(self):
+        # write all hashes to hash file, when generation of files is finished
         self.file_hashes.write_file_hashes()
 
+    def create_single_file(self):
+        # one audiobook file with chapters is created from all MP3 files, if it is configured
+        if not self.errors_in_async:
+            from creatorTools.ChapteredOutput import ChapteredOutput
+            self.single_file = ChapteredOutput.build(self)
+
+    def save_manifest(self):
+        # book is skipped in next runs, as long as its files are not changed
+        if not self.errors_in_async:
+            files = self.mp3_all_present + ([self.single_file] if self.single_file is not None else [])
+            self.manifest.save(files)
+
     def get_default_language(self):
         return self.yaml_config['MainLanguage']
 
@@ -125,3 +282,17 @@ class BookFiles:
 
     def get_mp3_tag(self, tag_name):
         return self.yaml_config[tag_name]
+
+    def get_single_file_format(self):
+        """
+        Returns format of audiobook file with chapters ('m4b' or 'opus'), or None if only MP3 files are created.
+        """
+        single_file = self.yaml_config.get('SingleFile')
+        if single_file is None:
+            return None
+        from creatorTools.ChapteredOutput import ChapteredOutput
+        if single_file not in ChapteredOutput.FORMATS:
+            from creatorTools.Exceptions import BookException
+            raise BookException('Not correct value for SingleFile parameter: {} (allowed: {}) in file {}'
+                                .format(single_file, ', '.join(ChapteredOutput.FORMATS), self.yaml_file), None)
+        return single_file
@@ -0,0 +1,102 @@
+import hashlib
+import os
+
+import yaml
+
+
+class BookManifest:
+    """
+    Class representing manifest of book - file kept next to yaml file of book (with extension .mnf).
+    It stores size, modification time and fingerprint of content of yaml file, book file and hash file
+    (with its journal), and list of MP3 files generated from them. If files didnt change since last successful run
+    and all MP3 files are present, book can be skipped without parsing it.
+    """
+
+    def __init__(self, yaml_path):
+        """
+        :param yaml_path: absolute or relative path of yaml file of book
+        """
+        self.yaml_file = yaml_path
+        self.manifest_file = os.path.splitext(yaml_path)[0] + '.mnf'
+        self.captured = None    # fingerprints of files taken before processing of book
+        self.hash_path = None
+
+    def is_unchanged(self):
+        """
+        Checks if book can be skipped. Content of files is read only if their size is the same,
+        but modification time is different.
+        :return: true if yaml, book and hash files are the same as in manifest and all MP3 files are present
+        """
+        try:
+            with open(self.manifest_file, encoding='utf8') as manifest_file:
+                manifest = yaml.load(manifest_file, Loader=yaml.SafeLoader)
+            if not BookManifest._same_file(self.yaml_file, manifest['yaml']) or \
+                    not BookManifest._same_file(manifest['book']['path'], manifest['book']) or \
+                    not BookManifest._same_file(manifest['hash']['path'], manifest['hash']):
+                return False
+            # journal is written only when generation was stopped - hashes are different than in manifest
+            if os.path.exists(manifest['hash']['path'] + '.journal'):
+                return False
+            present = set(os.listdir(manifest['result_dir']))
+        except (OSError, yaml.YAMLError, KeyError, TypeError):
+            # no manifest, or it is not correct - book is processed normally
+            return False
+        return all(file in present for file in manifest['files'])
+
+    def capture(self, book_path, result_dir, hash_path):
+        """
+        Takes fingerprints of yaml and book files, before book file is parsed.
+        :param book_path: path of book file
+        :param result_dir: directory of generated MP3 files
+        :param hash_path: path of hash file, its fingerprint is taken when manifest is saved
+        """
+        self.captured = {
+            'yaml': BookManifest._fingerprint(self.yaml_file),
+            'book': BookManifest._fingerprint(book_path),
+            'result_dir': result_dir
+        }
+        self.captured['book']['path'] = book_path
+        self.hash_path = hash_path
+
+    def save(self, files):
+        """
+        Writes manifest with fingerprints taken by capture and fingerprint of hash file, which has to be already saved.
+        :param files: names of all MP3 files of book
+        """
+        manifest = dict(self.captured, files=list(files), hash=BookManifest._fingerprint(self.hash_path))
+        manifest['hash']['path'] = self.hash_path
+        tmp_file = self.manifest_file + '.tmp'
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as manifest_file:
+                manifest_file.write(yaml.dump(manifest))
+            os.replace(tmp_file, self.manifest_file)
+        except OSError as ex:
+            from creatorTools.Exceptions import BookException
+            raise BookException('Not able to write manifest of book: {} '.format(self.manifest_file), ex)
+
+    @staticmethod
+    def _same_file(path, saved):
+        stat = os.stat(path)
+        if stat.st_size != saved['size']:
+            return False
+        if stat.st_mtime_ns == saved['mtime_ns']:
+            return True
+        # file was touched - checking its content
+        return BookManifest._content_hash(path) == saved['sha256']
+
+    @staticmethod
+    def _fingerprint(path):
+        try:
+            stat = os.stat(path)
+            return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': BookManifest._content_hash(path)}
+        except OSError as ex:
+            from creatorTools.Exceptions import BookException
+            raise BookException('Not able to read file: {} '.format(path), ex)
+
+    @staticmethod
+    def _content_hash(path):
+        content_hash = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                content_hash.update(block)
+        return content_hash.hexdigest()
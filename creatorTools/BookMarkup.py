@@ -0,0 +1,70 @@
+import bisect
+from collections import namedtuple
+
+# fragment of text of section read in one language
+#   lang - code of language used in book file (i.e. 'ENG'), or None for default language of book
+#   text - text to read, without markup
+#   start, end - position of text in text of section
+Span = namedtuple('Span', ['lang', 'text', 'start', 'end'])
+
+
+class MarkupError(Exception):
+    """
+    Raised when text of section doesnt follow syntax of book file.
+    """
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.message = message
+        self.offset = offset    # position of error in text of section
+
+
+class BookMarkup:
+    """
+    Class compiling markup of text of section (sections in other languages: @ENG text@) into list of spans.
+    Text is read once, from start to end. The same list of spans is used by all reading engines.
+    """
+
+    @staticmethod
+    def compile(text, languages):
+        """
+        Divides text into spans in default language and in languages given by markup.
+        :param text: text of section (part after name of MP3 file)
+        :param languages: codes of languages that can be used in markup
+        :return: list of Span objects, in order of text
+        """
+        # longer codes are checked first, so that code is never taken for beginning of longer one
+        codes = sorted(languages, key=len, reverse=True)
+        spans = []
+        pos = 0
+        while True:
+            mark = text.find('@', pos)
+            if mark == -1:
+                if pos < len(text):
+                    spans.append(Span(None, text[pos:], pos, len(text)))
+                return spans
+            if mark > pos:
+                spans.append(Span(None, text[pos:mark], pos, mark))
+            lang = next((code for code in codes if text.startswith(code, mark + 1)), None)
+            if lang is None:
+                raise MarkupError('sign @ not followed by language code ({})'.format(' '.join(languages)), mark)
+            start = mark + 1 + len(lang)
+            end = text.find('@', start)
+            if end == -1:
+                raise MarkupError('section in language {} not closed with sign @'.format(lang), mark)
+            spans.append(Span(lang, text[start:end], start, end))
+            pos = end + 1
+
+    @staticmethod
+    def line_column(offset, first_line, first_column, breaks):
+        """
+        Translates position in text of section to position in book file.
+        :param offset: position in text of section
+        :param first_line: line of book file where text of section starts (first line is 1)
+        :param first_column: column of book file where text of section starts (first column is 1)
+        :param breaks: positions in text of section where new lines were (each replaced by two spaces)
+        :return: tuple (line, column)
+        """
+        passed = bisect.bisect_right(breaks, offset - 1)    # number of new lines before offset
+        if passed == 0:
+            return first_line, first_column + offset
+        return first_line + passed, offset - (breaks[passed - 1] + 2) + 1
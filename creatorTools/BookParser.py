@@ -0,0 +1,131 @@
+import mmap
+import os
+from collections import namedtuple
+
+from creatorTools.FileHashes import FileHashes
+
+# one section of book file, representing one MP3 file
+#   name - name of MP3 file (text before first @)
+#   text - text to read (text after first @), new lines are replaced by two spaces
+#   hash - hash of whole section, the same as used in hash file
+#   line - number of line where section starts (first line is 1)
+#   offset - position where section starts: number of characters, or number of bytes if file is read using mmap
+#   breaks - positions in text where new lines were (each new line is replaced by two spaces)
+BookSection = namedtuple('BookSection', ['name', 'text', 'hash', 'line', 'offset', 'breaks'])
+
+
+class BookParser:
+    """
+    Class reading book file section by section. Sections are separated by double @.
+    Only one section is kept in memory at a time, independently of size of the file.
+    """
+
+    _CHUNK = 1024 * 1024
+
+    @staticmethod
+    def iter_sections(path, use_mmap=False):
+        """
+        Generator of sections of book file.
+        :param path: absolute or relative path of book file in UTF-8 encoding
+        :param use_mmap: if true, file is mapped to memory instead of being read in chunks
+        :return: BookSection objects in order of the file
+        """
+        try:
+            if use_mmap:
+                raw_sections = BookParser._iter_raw_mmap(path)
+            else:
+                raw_sections = BookParser._iter_raw(path)
+            line = 1
+            for raw, offset in raw_sections:
+                section = BookParser._make_section(raw, line, offset)
+                if section is not None:
+                    yield section
+                line += raw.count('\n')
+        except (OSError, UnicodeDecodeError) as ex:
+            from creatorTools.Exceptions import BookException
+            raise BookException('Cant read file containing text of book: {} '.format(path), ex)
+
+    @staticmethod
+    def _make_section(raw, line, offset):
+        # if section part representing MP3 is empty
+        if len(raw) == 0:
+            return None
+        text = raw.replace('\n', '  ')
+        # we split by first @ - before it there is name of MP3 file
+        struct = text.split('@', 1)
+        if len(struct) < 2:
+            return None
+        # k-th new line is moved by k characters, as every previous one was replaced by two characters
+        text_start = len(struct[0]) + 1
+        breaks = []
+        new_lines = 0
+        new_line = raw.find('\n')
+        while new_line != -1:
+            position = new_line + new_lines - text_start
+            if position >= 0:
+                breaks.append(position)
+            new_lines += 1
+            new_line = raw.find('\n', new_line + 1)
+        return BookSection(struct[0], struct[1], FileHashes.calc_hash(text), line, offset, breaks)
+
+    @staticmethod
+    def _iter_raw(path):
+        """
+        Reads file in chunks and divides it by double @, exactly like str.split would do.
+        :return: tuples (text of section, offset in characters)
+        """
+        with open(path, encoding='utf8') as file:
+            pieces = []     # pieces of current section
+            start = 0       # offset of current section
+            read = 0        # number of characters read so far
+            last_at = False     # true if current section ends with single @
+            while True:
+                chunk = file.read(BookParser._CHUNK)
+                if chunk == '':
+                    break
+                pos = 0
+                if last_at and chunk[0] == '@':
+                    # double @ divided between chunks
+                    pieces[-1] = pieces[-1][:-1]
+                    yield ''.join(pieces), start
+                    pieces = []
+                    start = read + 1
+                    pos = 1
+                while True:
+                    found = chunk.find('@@', pos)
+                    if found == -1:
+                        break
+                    pieces.append(chunk[pos:found])
+                    yield ''.join(pieces), start
+                    pieces = []
+                    pos = found + 2
+                    start = read + pos
+                if pos < len(chunk):
+                    pieces.append(chunk[pos:])
+                    last_at = chunk[-1] == '@'
+                else:
+                    last_at = False
+                read += len(chunk)
+            yield ''.join(pieces), start
+
+    @staticmethod
+    def _iter_raw_mmap(path):
+        """
+        Maps file to memory and divides it by double @. Only one section is decoded at a time.
+        :return: tuples (text of section, offset in bytes)
+        """
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                # empty file cant be mapped to memory
+                yield '', 0
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                start = 0
+                while True:
+                    found = data.find(b'@@', start)
+                    end = len(data) if found == -1 else found
+                    # new lines are translated like in text mode of open()
+                    yield data[start:end].decode('utf8').replace('\r\n', '\n').replace('\r', '\n'), start
+                    if found == -1:
+                        break
+                    start = found + 2
@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from creatorTools.BookFiles import BookFiles
+from creatorTools.Exceptions import ReaderException
+from creatorTools.GlobalConfig import GlobalConfig
+from creatorTools.Metrics import Metrics
+from creatorTools.ReaderLog import ReaderLog
+from creatorTools.S3Transfer import S3Transfer
+from creatorTools.TtsCache import TtsCache
+
+
+class BookPool:
+    """
+    Class generating many books at the same time, each book in separate process.
+    Log of each process is passed to main process line by line, with name of book at the beginning of line.
+    Asynchronous tasks started by processes are watched in main process, by task manager.
+    Error in one book doesnt stop generation of other books - status of every book is shown at the end.
+    """
+
+    # exit codes, the same as for whole program
+    OK = 0
+    ERROR = 1
+    UNHANDLED_ERROR = 10
+
+    def __init__(self, config_file, jobs, book_configs):
+        """
+        :param config_file: path of global config, it is read again by every process
+        :param jobs: number of processes
+        :param book_configs: yaml files of changed books
+        """
+        self.config_file = config_file
+        self.jobs = jobs
+        self.book_configs = book_configs
+        self.exit_code = BookPool.OK
+        self._statuses = {}     # {yaml file of book: status text}
+
+    def run(self, task_manager):
+        """
+        Generates all books. It is producer for AsyncTaskManager, so it runs in separate thread.
+        :param task_manager: AsyncTaskManager that waits for asynchronous generation
+        """
+        books = self.book_configs
+        # main process runs threads already (task manager, log printer), so processes cant be forked from it
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+                                              else 'spawn')
+        log_queue = context.Queue()
+        printer = threading.Thread(target=BookPool._print_log, args=(log_queue,), daemon=True)
+        printer.start()
+        # all processes put files generated asynchronously under the same prefix, it is cleaned up by main process
+        run_prefix = S3Transfer.get_key_prefix()
+        try:
+            with ProcessPoolExecutor(max_workers=min(self.jobs, max(1, len(books))), mp_context=context,
+                                     initializer=BookPool._init_process,
+                                     initargs=(self.config_file, run_prefix, log_queue)) as executor:
+                futures = {executor.submit(BookPool._process_book, book_config): book_config
+                           for book_config in books}
+                for future in as_completed(futures):
+                    self._book_finished(futures[future], future.result(), task_manager)
+        finally:
+            log_queue.put(None)
+            printer.join()
+        self._report(books)
+
+    def _book_finished(self, book_config, result, task_manager):
+        self.exit_code = max(self.exit_code, result['exit_code'])
+        TtsCache.add_counters(result['cache_counters'])
+        Metrics.merge(result['metrics'])
+        if len(result['async_tasks']) == 0:
+            self._statuses[book_config] = result['status']
+            return
+        # generation is finished by main process
+        S3Transfer.prepare_bucket()
+        book = BookFiles(book_config, result['book_state'])
+        book.attach_async_tasks(result['async_tasks'])
+        task_manager.add_book(book)
+        self._statuses[book_config] = 'waiting for {} files generated asynchronously'.format(len(result['async_tasks']))
+
+    def _report(self, books):
+        ReaderLog.log_par('Status of audiobooks:')
+        for book_config in books:
+            ReaderLog.log('  {}: {}'.format(book_config, self._statuses.get(book_config, 'not processed')))
+
+    @staticmethod
+    def _print_log(log_queue):
+        while True:
+            line = log_queue.get()
+            if line is None:
+                return
+            ReaderLog.log(line)
+
+    @staticmethod
+    def _init_process(config_file, run_prefix, log_queue):
+        GlobalConfig.read_global_config(config_file)
+        S3Transfer._run_prefix = run_prefix
+        Metrics.set_worker_process()
+        ReaderLog.set_sink(lambda line: log_queue.put(BookPool._line_prefix + line))
+
+    _line_prefix = ''   # name of book processed by process, added to lines of its log
+
+    @staticmethod
+    def _process_book(book_config):
+        """
+        Generates files of one book in worker process.
+        :return: map with result of processing, it is passed to main process
+        """
+        BookPool._line_prefix = '[{}] '.format(os.path.basename(book_config))
+        result = {'exit_code': BookPool.OK, 'status': 'generated', 'async_tasks': [], 'book_state': None}
+        book = None
+        try:
+            ReaderLog.log('Processing audiobook defined in file {}'.format(book_config))
+            book = BookFiles(book_config)
+            book.parse_book_file()
+            book.print_generated()
+            async_gen = book.generate_mp3()
+            book.save_hashes()
+            if async_gen:
+                # main process finishes generation, book is passed to it with hashes saved here
+                result['async_tasks'] = book.get_async_tasks()
+                result['book_state'] = book.get_state()
+            else:
+                book.clear_book_dir()
+                book.create_single_file()
+                book.save_manifest()
+        except ReaderException as ex:
+            ex.print_error_message()
+            ex.print_details()
+            result.update(exit_code=BookPool.ERROR, status='ERROR', async_tasks=[])
+        except Exception:
+            ReaderLog.log('[ERROR] Unhandled exception. Details below.')
+            for line in traceback.format_exc().splitlines():
+                ReaderLog.log(line)
+            result.update(exit_code=BookPool.UNHANDLED_ERROR, status='ERROR', async_tasks=[])
+        finally:
+            if book is not None and result['exit_code'] != BookPool.OK:
+                # hashes of files generated before error are kept
+                try:
+                    book.save_hashes()
+                except ReaderException:
+                    pass
+        # counters are reset, so that process passes only values of this book
+        result['cache_counters'] = TtsCache.get_counters(reset=True)
+        result['metrics'] = Metrics.snapshot(reset=True)
+        return result
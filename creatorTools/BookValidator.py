@@ -0,0 +1,128 @@
+import os
+
+import yaml
+
+from creatorTools.BookParser import BookParser
+from creatorTools.Exceptions import ReaderException
+from creatorTools.FileHashes import FileHashes
+from creatorTools.GlobalConfig import GlobalConfig
+from creatorTools.ReaderLog import ReaderLog
+
+
+class BookValidator:
+    """
+    Class checking books before any request is sent to reading engine: names of MP3 files, default language,
+    markup of sections in other languages (signs @ and codes of languages) and limits of reading engine
+    (i.e. length of parts of text read by Google Translate). Books are checked at the same time, each in separate
+    process, and all errors are reported together, with file and line where they are.
+    Files of books are only read - hash files are not compacted and state of asynchronous tasks is not touched.
+    Text of checked section is compiled again when it is generated - compiling is cheap compared to reading
+    of text by engine, and spans dont have to be kept for all sections of all books.
+    """
+
+    @staticmethod
+    def validate(book_configs, all_sections=False):
+        """
+        Checks books and shows all errors found.
+        :param book_configs: yaml files of books
+        :param all_sections: if true, all sections are checked, otherwise only sections that are generated again
+        :return: number of errors
+        """
+        workers = max(1, min(len(book_configs), os.cpu_count() or 1))
+        if workers > 1:
+            # parsing and compiling use processor, so threads would check books one after another
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            context = multiprocessing.get_context(start_method)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=BookValidator._init_process,
+                                     initargs=(GlobalConfig._global_config,)) as executor:
+                results = list(executor.map(BookValidator._validate_book, book_configs,
+                                            [all_sections] * len(book_configs)))
+        else:
+            results = [BookValidator._validate_book(book_config, all_sections) for book_config in book_configs]
+        errors = [error for book_errors in results for error in book_errors]
+        if len(errors) > 0:
+            ReaderLog.log_par('Errors found in books ({}):'.format(len(errors)))
+            for error in errors:
+                ReaderLog.log('[ERROR] {}'.format(error))
+        return len(errors)
+
+    @staticmethod
+    def _init_process(global_config):
+        GlobalConfig._global_config = global_config
+
+    @staticmethod
+    def _validate_book(book_config, all_sections):
+        """
+        :return: list of descriptions of errors
+        """
+        try:
+            book = _ValidatedBook(book_config)
+            book_file = book.yaml_config['BookFile']
+            file_hashes = None
+            if not all_sections:
+                file_hashes = FileHashes(book.yaml_config['HashFile'])
+                file_hashes.read_file_hashes(compact=False)
+            languages = GlobalConfig.get_reading_class().supported_languages().split()
+        except ReaderException as ex:
+            return ['{}: {}'.format(book_config, ex.message)]
+        except KeyError as ex:
+            return ['{}: missing parameter {}'.format(book_config, ex)]
+        except (OSError, TypeError, yaml.YAMLError) as ex:
+            return ['{}: not able to read yaml file of book ({})'.format(book_config, ex)]
+        errors = []
+        if str(book.get_default_language()).upper() not in languages:
+            errors.append('{}: not supported MainLanguage {} (supported: {})'
+                          .format(book_config, book.get_default_language(), ' '.join(languages)))
+            # text cant be checked without default language
+            return errors
+        names = {}  # {name of MP3 file without number and extension: line of its section}
+        try:
+            for section in BookParser.iter_sections(book_file, GlobalConfig.is_book_mmap_used()):
+                where = '{}, line {}'.format(book_file, section.line)
+                only_name = section.name.split('-')
+                if len(only_name) < 2 or only_name[0] == '' or not only_name[1].lower().endswith('.mp3'):
+                    errors.append('{}: wrong name of MP3 file \'{}\' - expected number-name.mp3'
+                                  .format(where, section.name))
+                    continue
+                # hashes of files are kept by name without number, so it has to be unique
+                file_tile = only_name[1].split('.')[0]
+                if file_tile in names:
+                    errors.append('{}: name \'{}\' of MP3 file \'{}\' is used also in line {}'
+                                  .format(where, file_tile, section.name, names[file_tile]))
+                names[file_tile] = section.line
+                if not all_sections and not file_hashes.is_hash_processable(file_tile, section.hash):
+                    continue
+                try:
+                    mp3 = GlobalConfig.get_reading_object(section.text, only_name, section.hash, book)
+                    mp3.set_source(section)
+                    mp3.validate()
+                except ReaderException as ex:
+                    errors.append('{}: {}'.format(where, ex.message))
+        except ReaderException as ex:
+            errors.append('{}: {}'.format(book_file, ex.message))
+        return errors
+
+
+class _ValidatedBook:
+    """
+    Parameters of book read from its yaml file, given to objects of reading engine instead of BookFiles,
+    which reads also hashes and state of tasks of book, and prepares it to generation.
+    """
+
+    def __init__(self, yaml_path):
+        with open(yaml_path, encoding='utf8') as yaml_file:
+            self.yaml_config = yaml.load(yaml_file, Loader=yaml.FullLoader)
+        if not isinstance(self.yaml_config, dict):
+            raise TypeError('it doesnt contain map of parameters')
+        self.yaml_file = yaml_path
+
+    def get_default_language(self):
+        return self.yaml_config['MainLanguage']
+
+    def get_result_dir(self):
+        return self.yaml_config['ResultDir']
+
+    def get_mp3_tag(self, tag_name):
+        return self.yaml_config[tag_name]
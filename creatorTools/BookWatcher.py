@@ -0,0 +1,135 @@
+import os
+import time
+
+import yaml
+
+from creatorTools.GlobalConfig import GlobalConfig
+from creatorTools.ReaderLog import ReaderLog
+
+
+class BookWatcher:
+    """
+    Class watching files of audiobooks (global config, yaml files of books and book files) and calling
+    generation of books whose files changed. Program stays running, so clients of reading engines, cache and
+    hashes are ready when file is saved again.
+    Changes are found with inotify (if package inotify_simple is installed), or by checking modification time
+    of files every watch_interval seconds. Changes saved quickly one after another are processed together,
+    after watch_debounce seconds without changes.
+    """
+
+    def __init__(self, config_file):
+        """
+        :param config_file: path of global config
+        """
+        self.config_file = config_file
+        self._books_of_files = {}   # {absolute path of file: yaml file of book, or None for global config}
+
+    def watch(self, on_change):
+        """
+        Watches files until program is stopped with Ctrl+C.
+        :param on_change: function called with list of yaml files of changed books, or with None if global config
+                          changed (then all books are processed again)
+        """
+        self._update_files()
+        try:
+            from inotify_simple import INotify
+            inotify = INotify()
+        except (ImportError, OSError):
+            inotify = None
+        ReaderLog.log_par('Watching {} files of audiobooks for changes ({}). Press Ctrl+C to stop.'
+                          .format(len(self._books_of_files), 'inotify' if inotify is not None else 'polling'))
+        try:
+            changes = self._inotify_changes(inotify) if inotify is not None else self._polled_changes()
+            for changed in changes:
+                if None in changed:
+                    ReaderLog.log_par('Config {} changed.'.format(self.config_file))
+                    on_change(None)
+                else:
+                    on_change(sorted(changed, key=GlobalConfig.get_audiobooks().index))
+                self._update_files()
+        except KeyboardInterrupt:
+            ReaderLog.log_par('Watching stopped.')
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _update_files(self):
+        """
+        Finds files to watch. It is done after every change, because yaml file of book can point to other book file.
+        """
+        files = {os.path.abspath(self.config_file): None}
+        for book_config in GlobalConfig.get_audiobooks():
+            files[os.path.abspath(book_config)] = book_config
+            try:
+                with open(book_config, encoding='utf8') as yaml_file:
+                    book_file = yaml.load(yaml_file, Loader=yaml.SafeLoader)['BookFile']
+                files[os.path.abspath(book_file)] = book_config
+            except (OSError, yaml.YAMLError, KeyError, TypeError):
+                # yaml file is watched anyway, error is shown when book is processed
+                pass
+        self._books_of_files = files
+
+    def _inotify_changes(self, inotify):
+        """
+        Generator of sets of changed books, based on events of inotify. Directories of files are watched,
+        so that files replaced by editors (saved as new file and renamed) are noticed.
+        """
+        from inotify_simple import flags
+        mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE | flags.DELETE
+        watched = {}    # {watch descriptor: directory}
+        debounce_ms = int(GlobalConfig.get_watch_debounce() * 1000)
+        while True:
+            for directory in {os.path.dirname(file) for file in self._books_of_files} - set(watched.values()):
+                watched[inotify.add_watch(directory, mask)] = directory
+            events = inotify.read()
+            # events are collected until there are no new ones for debounce time
+            while True:
+                more = inotify.read(timeout=debounce_ms)
+                if len(more) == 0:
+                    break
+                events.extend(more)
+            changed = set()
+            for event in events:
+                path = os.path.join(watched.get(event.wd, ''), event.name)
+                if path in self._books_of_files:
+                    changed.add(self._books_of_files[path])
+            if len(changed) > 0:
+                yield changed
+
+    def _polled_changes(self):
+        """
+        Generator of sets of changed books, based on size and modification time of files checked in cycles.
+        """
+        interval = GlobalConfig.get_watch_interval()
+        debounce = GlobalConfig.get_watch_debounce()
+        states = self._file_states()
+        while True:
+            time.sleep(interval)
+            current = self._file_states()
+            changed_files = {file for file in current if current[file] != states.get(file)}
+            if len(changed_files) == 0:
+                states = current
+                continue
+            # files are checked until they dont change for debounce time
+            while True:
+                time.sleep(debounce)
+                latest = self._file_states()
+                if latest == current:
+                    break
+                changed_files.update(file for file in latest if latest[file] != current.get(file))
+                current = latest
+            yield {self._books_of_files[file] for file in changed_files if file in self._books_of_files}
+            # files of books can be different after change. Files saved during generation are compared
+            # with their state before it, so that their change is noticed in next cycle
+            fresh = self._file_states()
+            states = {file: current[file] if file in current else fresh[file] for file in fresh}
+
+    def _file_states(self):
+        states = {}
+        for file in self._books_of_files:
+            try:
+                stat = os.stat(file)
+                states[file] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                states[file] = None
+        return states
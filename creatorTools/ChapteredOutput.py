@@ -0,0 +1,131 @@
+import os
+import shutil
+import subprocess
+
+from creatorTools.Exceptions import Mp3Exception
+from creatorTools.Metrics import Metrics
+from creatorTools.ReaderLog import ReaderLog
+
+
+class ChapteredOutput:
+    """
+    Class with static methods creating one audiobook file (M4B with AAC, or Ogg Opus) with chapters,
+    from MP3 files of book, in order of book file. MP3 files are cache of audio of sections - when only some
+    sections changed, file is created again from MP3 files, without reading any text again.
+    MP3 files are joined and encoded by one ffmpeg process, so there are no gaps between chapters (segments encoded
+    separately and joined would keep silence added by encoder at beginning and end of every segment),
+    and memory used doesnt depend on length of book.
+    """
+
+    # {format: (extension of audiobook file, encoder, bitrate, muxer)}
+    FORMATS = {
+        'm4b': ('.m4b', 'aac', '64k', 'ipod'),
+        'opus': ('.opus', 'libopus', '32k', 'ogg'),
+    }
+    SEGMENTS_DIR = '.segments'  # segments encoded separately by previous versions, it is removed
+
+    @staticmethod
+    def build(book):
+        """
+        Creates audiobook file of book, if it is configured in yaml file of book (SingleFile: m4b or opus).
+        :param book: BookFiles object, with all MP3 files generated
+        :return: name of created file (in result directory), or None if file is not configured
+        """
+        output_format = book.get_single_file_format()
+        if output_format is None:
+            return None
+        extension, _, _, _ = ChapteredOutput.FORMATS[output_format]
+        result_dir = book.get_result_dir()
+        with Metrics.span('chaptered_output', book=book.yaml_file):
+            chapters = []   # list of tuples (title, path of MP3 file)
+            for mp3_name in book.mp3_all_present:
+                mp3_path = os.path.join(result_dir, mp3_name)
+                if not os.path.isfile(mp3_path):
+                    from creatorTools.Exceptions import BookException
+                    raise BookException('File {} was not generated, audiobook file cant be created.'
+                                        .format(mp3_name), None)
+                only_name = mp3_name.split('-', 1)[1].split('.')[0]
+                chapters.append((only_name.replace('_', ' ').title(), mp3_path))
+            file_name = ChapteredOutput._file_name(book.get_mp3_tag('Album'), extension)
+            ChapteredOutput._encode(chapters, book, os.path.join(result_dir, file_name), output_format)
+            segments_dir = os.path.join(result_dir, ChapteredOutput.SEGMENTS_DIR)
+            if os.path.isdir(segments_dir):
+                shutil.rmtree(segments_dir, ignore_errors=True)
+        ReaderLog.log('Created audiobook file {} with {} chapters.'
+                      .format(os.path.join(result_dir, file_name), len(chapters)))
+        return file_name
+
+    @staticmethod
+    def _file_name(album, extension):
+        # characters not allowed in names of files on popular systems are replaced
+        return ''.join('_' if char in '<>:"/\\|?*' else char for char in str(album)) + extension
+
+    @staticmethod
+    def _encode(chapters, book, output, output_format):
+        """
+        Joins MP3 files and encodes them to target format, adding tags and chapters. File is created under
+        temporary name and renamed, so that file interrupted while encoding is never used.
+        """
+        _, encoder, bitrate, muxer = ChapteredOutput.FORMATS[output_format]
+        list_file = output + '.list'
+        metadata_file = output + '.meta'
+        tmp_output = output + '.tmp'
+        try:
+            with open(list_file, 'w', encoding='utf-8') as file:
+                for _, mp3_path in chapters:
+                    # path is quoted, quote inside of it is closed, escaped and opened again
+                    file.write("file '{}'\n".format(os.path.abspath(mp3_path).replace("'", "'\\''")))
+            with open(metadata_file, 'w', encoding='utf-8') as file:
+                file.write(ChapteredOutput._metadata(chapters, book))
+            ChapteredOutput._ffmpeg(['-f', 'concat', '-safe', '0', '-i', list_file, '-i', metadata_file,
+                                     '-map', '0:a', '-map_metadata', '1', '-map_chapters', '1',
+                                     '-c:a', encoder, '-b:a', bitrate, '-f', muxer, tmp_output],
+                                    'Not able to create file {}'.format(output))
+            os.replace(tmp_output, output)
+        except OSError as ex:
+            raise Mp3Exception('Not able to create file {}'.format(output), ex)
+        finally:
+            for file in (list_file, metadata_file, tmp_output):
+                if os.path.isfile(file):
+                    os.remove(file)
+
+    @staticmethod
+    def _metadata(chapters, book):
+        """
+        Returns tags and chapters in format of ffmpeg metadata file. Length of chapter is length of its MP3 file.
+        """
+        import mutagen
+        lines = [';FFMETADATA1']
+        for key, tag in (('title', 'Album'), ('album', 'Album'), ('artist', 'Artist'),
+                         ('album_artist', 'AlbumArtist'), ('date', 'AlbumDate')):
+            lines.append('{}={}'.format(key, ChapteredOutput._escape(book.get_mp3_tag(tag))))
+        start = 0
+        for title, mp3_path in chapters:
+            audio = mutagen.File(mp3_path)
+            if audio is None or audio.info is None:
+                raise Mp3Exception('Not able to read length of audio in file {}'.format(mp3_path), None)
+            end = start + int(round(audio.info.length * 1000))
+            lines += ['[CHAPTER]', 'TIMEBASE=1/1000', 'START={}'.format(start), 'END={}'.format(end),
+                      'title={}'.format(ChapteredOutput._escape(title))]
+            start = end
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _escape(value):
+        # special characters of metadata file are preceded by backslash
+        return ''.join('\\' + char if char in '=;#\\\n' else char for char in str(value))
+
+    @staticmethod
+    def _ffmpeg(arguments, error_message):
+        from pydub.utils import get_encoder_name
+        ffmpeg = get_encoder_name()
+        try:
+            process = subprocess.run([ffmpeg, '-loglevel', 'error', '-nostdin', '-y'] + arguments,
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except OSError as ex:
+            raise Mp3Exception('Not able to start {}. {}'.format(ffmpeg, error_message), ex)
+        if process.returncode != 0:
+            # last line of error output describes reason of failure
+            errors = process.stderr.decode('utf-8', 'replace').strip().splitlines()
+            raise Mp3Exception('{}: {}'.format(error_message, errors[-1] if len(errors) > 0 else 'unknown error'),
+                               None)
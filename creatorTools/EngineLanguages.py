@@ -0,0 +1,45 @@
+# Languages supported by built-in reading engines. Module doesnt import engines, so languages can be shown
+# (i.e. in help of program) without loading libraries of engines.
+
+
+class PollyLanguages:
+    """
+    Class translates codes of languages used in 'book' file to language codes used by polly:
+    https://docs.aws.amazon.com/polly/latest/dg/voicelist.html
+    """
+
+    @staticmethod
+    def table_of_languages():
+        return {'PL': 'pl-PL', 'ENG': 'en-GB', 'US': 'en-US',
+                'GER': 'de-DE', 'FR': 'fr-FR', 'ES': 'es-ES',
+                'IT': 'it-IT'}
+
+    @staticmethod
+    def get_voice(lang_code):
+        voices = {'PL': 'Jacek', 'ENG': 'Brian', 'US': 'Joey',
+                  'GER': 'Hans', 'FR': 'Mathieu', 'ES': 'Miguel',
+                  'IT': 'Giorgio'}
+        return voices[lang_code]
+
+    @staticmethod
+    def supported_languages():
+        return 'PL ENG US GER FR ES IT'
+
+
+class GoogleLanguages:
+    """
+    Class translates codes of languages used in 'book' file to language codes used by Google Translate.
+    """
+
+    @staticmethod
+    def get_lang_tab():
+        return ['PL', 'ENG', 'US', 'GER', 'FR', 'ES', 'IT']
+
+    @staticmethod
+    def supported_languages():
+        return ' '.join(GoogleLanguages.get_lang_tab())
+
+    @staticmethod
+    def get_google_lang(lang):
+        langs = {'PL': 'pl', 'ENG': 'en-GB', 'US': 'en', 'GER': 'de', 'FR': 'fr', 'ES': 'es', 'IT': 'it'}
+        return langs[lang]
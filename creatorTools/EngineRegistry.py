@@ -0,0 +1,104 @@
+import importlib
+import inspect
+import threading
+
+
+class EngineRegistry:
+    """
+    Class with static data mapping names of reading engines (value of reading_engine in global config)
+    to classes generating MP3 files. Module of engine is imported only when engine is used for the first time,
+    so libraries of other engines are never loaded.
+    Besides built-in engines, new ones can be added:
+        - in global config, as map engines: {name: 'module:Class'}
+        - by installed packages, as entry points in group 'audiobook_creator.engines'
+    Class of engine inherits from Mp3File and implements all its abstract methods (i.e. static method
+    supported_languages). Languages of built-in engines are known without importing them.
+    """
+    ENTRY_POINT_GROUP = 'audiobook_creator.engines'
+
+    _BUILT_IN = {
+        'aws polly': 'creatorTools.Mp3FileFromAwsPolly:Mp3FileFromAwsPolly',
+        'google translate': 'creatorTools.Mp3FileFromGoogleTranslate:Mp3FileFromGoogleTranslate',
+    }
+    _BUILT_IN_LANGUAGES = {
+        'aws polly': 'creatorTools.EngineLanguages:PollyLanguages',
+        'google translate': 'creatorTools.EngineLanguages:GoogleLanguages',
+    }
+    _classes = {}   # {name of engine: class}, for engines already imported
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_engine_class(name):
+        """
+        Returns class of engine, importing its module if needed.
+        :param name: name of engine
+        """
+        with EngineRegistry._lock:
+            if name not in EngineRegistry._classes:
+                EngineRegistry._classes[name] = EngineRegistry._load(name)
+            return EngineRegistry._classes[name]
+
+    @staticmethod
+    def get_supported_languages(name):
+        """
+        Returns codes of languages supported by engine, separated by spaces. Engine is not imported - languages
+        of engines that are not built-in are known only when they were already loaded.
+        :param name: name of engine
+        :return: codes of languages, or None if they are not known
+        """
+        with EngineRegistry._lock:
+            engine_class = EngineRegistry._classes.get(name)
+        if engine_class is not None:
+            return engine_class.supported_languages()
+        if name not in EngineRegistry._BUILT_IN_LANGUAGES or name in EngineRegistry._configured():
+            return None
+        module_name, _, class_name = EngineRegistry._BUILT_IN_LANGUAGES[name].partition(':')
+        return getattr(importlib.import_module(module_name), class_name).supported_languages()
+
+    @staticmethod
+    def get_engine_names():
+        """
+        Returns names of all available engines, without importing them.
+        """
+        names = set(EngineRegistry._BUILT_IN) | set(EngineRegistry._configured())
+        names.update(entry_point.name for entry_point in EngineRegistry._entry_points())
+        return sorted(names)
+
+    @staticmethod
+    def _load(name):
+        engine_class = EngineRegistry._import(name)
+        from creatorTools.Exceptions import GlobalException
+        from creatorTools.Mp3File import Mp3File
+        if not inspect.isclass(engine_class) or not issubclass(engine_class, Mp3File):
+            raise GlobalException('Class of reading engine \'{}\' doesnt inherit from Mp3File'.format(name), None)
+        if inspect.isabstract(engine_class):
+            raise GlobalException('Class of reading engine \'{}\' doesnt implement methods: {}'
+                                  .format(name, ', '.join(sorted(engine_class.__abstractmethods__))), None)
+        return engine_class
+
+    @staticmethod
+    def _import(name):
+        target = EngineRegistry._configured().get(name) or EngineRegistry._BUILT_IN.get(name)
+        try:
+            if target is not None:
+                module_name, _, class_name = target.partition(':')
+                return getattr(importlib.import_module(module_name), class_name)
+            for entry_point in EngineRegistry._entry_points():
+                if entry_point.name == name:
+                    return entry_point.load()
+        except (ImportError, AttributeError) as ex:
+            from creatorTools.Exceptions import GlobalException
+            raise GlobalException('Not able to load reading engine \'{}\' ({})'.format(name, target), ex)
+        from creatorTools.Exceptions import GlobalException
+        raise GlobalException('Not correct value for reading_engine parameter: {}. Available engines: {}'
+                              .format(name, ', '.join(EngineRegistry.get_engine_names())), None)
+
+    @staticmethod
+    def _configured():
+        from creatorTools.GlobalConfig import GlobalConfig
+        return GlobalConfig.get_configured_engines()
+
+    @staticmethod
+    def _entry_points():
+        from importlib.metadata import entry_points
+        return entry_points(group=EngineRegistry.ENTRY_POINT_GROUP)
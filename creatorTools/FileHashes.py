@@ -1,10 +1,16 @@
 import yaml
 import hashlib
+import os
+import threading
+
+from creatorTools.Metrics import Metrics
 
 
 class FileHashes:
     """
-    Class representing file with hashes of MP3 files
+    Class representing file with hashes of MP3 files.
+    Hash file (YAML) is a snapshot. Every update is appended as one line to journal file kept next to it,
+    and journal is merged into snapshot (compacted) from time to time, with atomic rename of the file.
     """
     def __init__(self, file):
         """
@@ -12,21 +18,43 @@ class FileHashes:
         :param file: absolute or relative path
         """
         self.hash_file = file
+        self.journal_file = file + '.journal'
         self.hashes = None
+        self._journal = None    # journal file opened for appending
+        self._journal_records = 0   # number of records in journal
+        self._lock = threading.Lock()  # hashes can be updated by many threads generating files
 
-    def read_file_hashes(self):
+    def read_file_hashes(self, compact=True):
+        """
+        Reads hashes from hash file and its journal.
+        :param compact: if false, files are only read - journal left by previous run is not merged into hash file
+        """
         try:
             hashes = open(self.hash_file, encoding='utf8')
             self.hashes = yaml.load(hashes, Loader=yaml.FullLoader)
+            hashes.close()
         except FileNotFoundError:
             self.hashes = {}
+            # hash file was deleted - all files are regenerated, so journal is not valid anymore
+            if compact:
+                self._remove_journal()
+            return
         except yaml.YAMLError as ex:
             from creatorTools.Exceptions import BookException
             raise BookException('Not able to correctly parse hash file: {} '.format(self.hash_file), ex)
+        if self.hashes is None:
+            self.hashes = {}
+        self._journal_records = self._replay_journal()
+        if self._journal_records > 0 and compact:
+            # previous run didnt finish compaction
+            self.write_file_hashes()
 
     def write_file_hashes(self):
-        with open(self.hash_file, "w", encoding="utf-8") as text_file:
-            text_file.write(yaml.dump(self.hashes))
+        """
+        Writes all hashes to hash file atomically and empties journal.
+        """
+        with self._lock, Metrics.span('hash_write', file=self.hash_file):
+            self._compact()
 
     def is_hash_processable(self, only_name, curr_hash):
         """
@@ -48,7 +76,78 @@ class FileHashes:
             return True
 
     def update_hash(self, only_name, new_hash):
-        self.hashes[only_name] = new_hash
+        """
+        Updates hash of file and saves it durably as one record in journal.
+        Journal is compacted when it reaches number of records configured in global config.
+        """
+        with self._lock, Metrics.span('hash_write', file=self.hash_file):
+            self.hashes[only_name] = new_hash
+            try:
+                if self._journal is None:
+                    if not os.path.isfile(self.hash_file):
+                        # journal is valid only together with hash file
+                        self._compact()
+                    self._journal = open(self.journal_file, 'a', encoding='utf-8')
+                self._journal.write('{}\t{}\n'.format(only_name, new_hash))
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+            except OSError as ex:
+                from creatorTools.Exceptions import BookException
+                raise BookException('Not able to write journal of hashes: {} '.format(self.journal_file), ex)
+            self._journal_records += 1
+            from creatorTools.GlobalConfig import GlobalConfig
+            if self._journal_records >= GlobalConfig.get_hash_compact_every():
+                self._compact()
+
+    def _replay_journal(self):
+        """
+        Applies records from journal to hashes read from hash file.
+        Last line is ignored if it is not complete (i.e. program was stopped while writing it).
+        :return: number of applied records
+        """
+        records = 0
+        try:
+            with open(self.journal_file, encoding='utf-8') as journal:
+                for line in journal:
+                    if not line.endswith('\n'):
+                        break
+                    record = line[:-1].split('\t')
+                    if len(record) == 2:
+                        self.hashes[record[0]] = record[1]
+                        records += 1
+        except FileNotFoundError:
+            pass
+        except (OSError, UnicodeDecodeError) as ex:
+            from creatorTools.Exceptions import BookException
+            raise BookException('Not able to read journal of hashes: {} '.format(self.journal_file), ex)
+        return records
+
+    def _compact(self):
+        """
+        Writes snapshot to temporary file and renames it to hash file, then empties journal. Must be called under lock.
+        If program stops in the middle, journal is applied again at next start, which gives the same result.
+        """
+        tmp_file = self.hash_file + '.tmp'
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as text_file:
+                text_file.write(yaml.dump(self.hashes))
+                text_file.flush()
+                os.fsync(text_file.fileno())
+            os.replace(tmp_file, self.hash_file)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            self._remove_journal()
+        except OSError as ex:
+            from creatorTools.Exceptions import BookException
+            raise BookException('Not able to write hash file: {} '.format(self.hash_file), ex)
+        self._journal_records = 0
+
+    def _remove_journal(self):
+        try:
+            os.remove(self.journal_file)
+        except FileNotFoundError:
+            pass
 
     @staticmethod
     def calc_hash(hashed_string):
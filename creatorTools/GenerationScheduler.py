@@ -0,0 +1,185 @@
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from creatorTools.BookFiles import BookFiles
+from creatorTools.GlobalConfig import GlobalConfig
+from creatorTools.Metrics import Metrics
+from creatorTools.ReaderLog import ReaderLog
+
+
+class GenerationScheduler:
+    """
+    Class generating files of all books together, so that time of whole run (makespan) is short.
+    First all books are parsed and files to generate are collected. Asynchronous tasks are started from the longest
+    one (longest processing time first), as they take most of time, and no more than polly_async_workers tasks
+    run at the same time. Synchronous files are generated by polly_sync_workers threads while tasks run.
+    Time of every file is estimated from length of its text - estimated and actual time of run are shown at the end,
+    so that parameters of estimation can be tuned.
+    """
+
+    def __init__(self, task_manager):
+        """
+        :param task_manager: AsyncTaskManager that waits for asynchronous generation
+        """
+        self.task_manager = task_manager
+        task_manager.on_file_finished = self._file_finished
+        self._async_slots = threading.Semaphore(GlobalConfig.get_async_workers())
+        self._jobs = []     # maps {'book', 'mp3', 'size', 'sync', 'estimate', 'start', 'end', 'cached'}
+        self._task_jobs = {}    # {id of mp3 object: job} for started asynchronous tasks
+        self._start = None
+        self._estimates = None  # (makespan, synchronous makespan, asynchronous makespan, makespan in file order)
+
+    def run(self, book_configs):
+        """
+        Generates files of books. It is producer for AsyncTaskManager, so it runs in separate thread.
+        :param book_configs: yaml files of changed books
+        """
+        books = self._prepare(book_configs)
+        sync_jobs = sorted((job for job in self._jobs if job['sync']), key=lambda job: job['estimate'], reverse=True)
+        # tasks resumed from previous run are already running, so they are watched first
+        async_jobs = sorted((job for job in self._jobs if not job['sync']),
+                            key=lambda job: (job['mp3'].task_id is None, -job['estimate']))
+        sync_workers = GlobalConfig.get_sync_workers()
+        sync_makespan = GenerationScheduler._makespan([job['estimate'] for job in sync_jobs], sync_workers)
+        async_makespan = GenerationScheduler._makespan([job['estimate'] for job in async_jobs],
+                                                       GlobalConfig.get_async_workers())
+        self._estimates = (max(sync_makespan, async_makespan), sync_makespan, async_makespan,
+                           GenerationScheduler._file_order_makespan(self._jobs, sync_workers))
+        ReaderLog.log_par('Generating {} files synchronously and {} asynchronously, estimated time {:.0f} s.'
+                          .format(len(sync_jobs), len(async_jobs), self._estimates[0]))
+        self._start = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=sync_workers)
+        try:
+            futures = [executor.submit(self._generate_sync, job) for job in sync_jobs]
+            for job in async_jobs:
+                self._wait_for_slot()
+                self._start_async(job)
+            for future in as_completed(futures):
+                future.result()
+        finally:
+            # in case of error files not started yet are not generated
+            executor.shutdown(wait=True, cancel_futures=True)
+        # books waiting for asynchronous tasks are finished by caller, when their files are downloaded
+        waiting = {id(job['book']) for job in self._task_jobs.values()}
+        for book in books:
+            if id(book) not in waiting:
+                book.clear_book_dir()
+                book.save_hashes()
+                book.create_single_file()
+                book.save_manifest()
+
+    def _prepare(self, book_configs):
+        """
+        Parses books and collects their files to generate.
+        :return: list of BookFiles objects
+        """
+        sync_speed, async_speed, async_latency = GlobalConfig.get_schedule_estimates()
+        books = []
+        for book_config in book_configs:
+            ReaderLog.log_par('Processing audiobook defined in file {}'.format(book_config))
+            book = BookFiles(book_config)
+            book.parse_book_file()
+            book.print_generated()
+            for mp3, size in book.prepare_mp3():
+                sync = BookFiles.is_generated_synchronously(size)
+                estimate = size / sync_speed if sync else async_latency + size / async_speed
+                self._jobs.append({'book': book, 'mp3': mp3, 'size': size, 'sync': sync, 'estimate': estimate,
+                                   'start': None, 'end': None, 'cached': False})
+            books.append(book)
+        return books
+
+    def _generate_sync(self, job):
+        job['start'] = time.monotonic()
+        job['mp3'].save_mp3()
+        job['end'] = time.monotonic()
+        ReaderLog.log('Processing: {} ... finished.'.format(job['mp3'].file_tile))
+
+    def _start_async(self, job):
+        book, mp3 = job['book'], job['mp3']
+        job['start'] = time.monotonic()
+        book.schedule_mp3(mp3)
+        if mp3.task_id is None:
+            # file was taken from cache
+            job['end'] = time.monotonic()
+            job['cached'] = True
+            self._async_slots.release()
+            ReaderLog.log('Processing: {} ... finished.'.format(mp3.file_tile))
+            return
+        self._task_jobs[id(mp3)] = job
+        ReaderLog.log('Processing: {} ... started asynchronous generation. '.format(mp3.file_tile))
+        self.task_manager.add_task(book, mp3)
+
+    def _wait_for_slot(self):
+        while not self._async_slots.acquire(timeout=1):
+            if self.task_manager.error is not None:
+                # watching of tasks stopped, so slots are not released anymore
+                raise self.task_manager.error
+
+    def _file_finished(self, book, mp3):
+        """
+        Called by task manager when asynchronous task is finished (also with error).
+        """
+        job = self._task_jobs.get(id(mp3))
+        if job is not None and job['end'] is None:
+            job['end'] = time.monotonic()
+            self._async_slots.release()
+
+    def report(self):
+        """
+        Shows estimated and actual time of generation, and speed of reading measured for synchronous files
+        and asynchronous tasks.
+        """
+        if self._start is None or len(self._jobs) == 0:
+            return
+        makespan, sync_makespan, async_makespan, file_order_makespan = self._estimates
+        sync_jobs = [job for job in self._jobs if job['sync'] and job['end'] is not None]
+        async_jobs = [job for job in self._jobs if not job['sync'] and job['end'] is not None and not job['cached']]
+        actual = max((job['end'] for job in self._jobs if job['end'] is not None), default=self._start) - self._start
+        ReaderLog.log_par('Time of generation: estimated {:.0f} s, actual {:.0f} s '
+                          '(estimated in order of book files: {:.0f} s).'.format(makespan, actual, file_order_makespan))
+        if len(sync_jobs) > 0:
+            sync_seconds = sum(job['end'] - job['start'] for job in sync_jobs)
+            ReaderLog.log('Synchronous files: {}, estimated {:.0f} s, actual {:.0f} s, {:.0f} characters/s '
+                          'per request (polly_sync_speed: {:.0f}).'
+                          .format(len(sync_jobs), sync_makespan,
+                                  max(job['end'] for job in sync_jobs) - self._start,
+                                  sum(job['size'] for job in sync_jobs) / max(sync_seconds, 1e-6),
+                                  GlobalConfig.get_schedule_estimates()[0]))
+        if len(async_jobs) > 0:
+            ReaderLog.log('Asynchronous tasks: {}, estimated {:.0f} s, actual {:.0f} s, average task {:.0f} s '
+                          '(estimated {:.0f} s).'
+                          .format(len(async_jobs), async_makespan,
+                                  max(job['end'] for job in async_jobs) - self._start,
+                                  sum(job['end'] - job['start'] for job in async_jobs) / len(async_jobs),
+                                  sum(job['estimate'] for job in async_jobs) / len(async_jobs)))
+        Metrics.gauge('makespan_estimated_seconds', round(makespan, 3))
+        Metrics.gauge('makespan_actual_seconds', round(actual, 3))
+
+    @staticmethod
+    def _makespan(durations, workers):
+        """
+        Returns time in which jobs are finished, when every job is started in given order by first free worker.
+        """
+        ends = [0.0] * max(1, min(workers, len(durations)))
+        for duration in durations:
+            heapq.heapreplace(ends, ends[0] + duration)
+        return max(ends)
+
+    @staticmethod
+    def _file_order_makespan(jobs, sync_workers):
+        """
+        Returns estimated time of generation without scheduler: books one after another, tasks of book started
+        before its synchronous files, without limit of tasks running at the same time.
+        """
+        time_of_books = 0.0
+        end = 0.0
+        for book in dict.fromkeys(job['book'] for job in jobs):
+            book_jobs = [job for job in jobs if job['book'] is book]
+            for job in book_jobs:
+                if not job['sync']:
+                    end = max(end, time_of_books + job['estimate'])
+            time_of_books += GenerationScheduler._makespan([job['estimate'] for job in book_jobs if job['sync']],
+                                                           sync_workers)
+        return max(end, time_of_books)
@@ -1,3 +1,5 @@
+import threading
+
 import yaml
 
 
@@ -6,7 +8,12 @@ class GlobalConfig:
     Class with static data representing global configuration and methods that use it
     """
     _global_config = None
-    _s3_created = False  # set to true if s3 has been created
+    _aws_session = None
+    _aws_clients = {}   # {name of service: client}, clients are thread-safe and shared by all threads
+    _aws_clients_created = 0
+    _aws_lock = threading.Lock()
+    _polly_sync_slots = None    # semaphore limiting number of synchronous requests to Polly in flight
+    _google_rate_limiter = None     # limiter of requests to Google Translate shared by all threads
 
     @staticmethod
     def read_global_config(file):
@@ -24,19 +31,33 @@ class GlobalConfig:
             from creatorTools.Exceptions import GlobalException
             raise GlobalException('Not able to correctly parse config file: {} '.format(file), ex)
 
+    @staticmethod
+    def is_read():
+        return GlobalConfig._global_config is not None
+
     @staticmethod
     def get_reading_object(text_to_read, mp3_no_name, hash_of_text, belongs_to_book):
-        if GlobalConfig._global_config['reading_engine'] == 'aws polly':
-            from creatorTools.Mp3FileFromAwsPolly import Mp3FileFromAwsPolly
-            return Mp3FileFromAwsPolly(text_to_read, mp3_no_name, hash_of_text, belongs_to_book)
-        elif GlobalConfig._global_config['reading_engine'] == 'google translate':
-            from creatorTools.Mp3FileFromGoogleTranslate import Mp3FileFromGoogleTranslate
-            return Mp3FileFromGoogleTranslate(text_to_read, mp3_no_name, hash_of_text, belongs_to_book)
-        else:
-            from creatorTools.Exceptions import GlobalException
-            raise GlobalException(
-                f'Not correct value for reading_engine parameter: {GlobalConfig._global_config["reading_engine"]}',
-                None)
+        engine_class = GlobalConfig.get_reading_class()
+        return engine_class(text_to_read, mp3_no_name, hash_of_text, belongs_to_book)
+
+    @staticmethod
+    def get_reading_engine():
+        return GlobalConfig._global_config['reading_engine']
+
+    @staticmethod
+    def get_reading_class():
+        # module of engine is imported when it is used for the first time
+        from creatorTools.EngineRegistry import EngineRegistry
+        return EngineRegistry.get_engine_class(GlobalConfig._global_config['reading_engine'])
+
+    @staticmethod
+    def get_configured_engines():
+        """
+        Returns additional reading engines defined in global config: {name: 'module:Class'}.
+        """
+        if GlobalConfig._global_config is None:
+            return {}
+        return GlobalConfig._global_config.get('engines') or {}
 
     @staticmethod
     def get_aws_region():
@@ -60,37 +81,29 @@ class GlobalConfig:
         raise GlobalException('S3 bucket name contains not allowed characters.', None)
 
     @staticmethod
-    def create_s3_bucket():
-        # create bucket only if it doesn't exist
-        if GlobalConfig._s3_created:
-            return
-        try:
-            session = GlobalConfig.get_aws_session()
-            s3 = session.resource('s3', config=GlobalConfig.get_aws_config())
-            bucket = s3.Bucket(GlobalConfig.get_s3_bucket())
-            if bucket not in s3.buckets.all():
-                bucket.create(ACL='private',
-                              CreateBucketConfiguration={'LocationConstraint': GlobalConfig.get_aws_region()})
-        except Exception as ex:
-            from creatorTools.Exceptions import GlobalException
-            raise GlobalException('Error while creating bucket {}'
-                                  .format(GlobalConfig.get_s3_bucket()), ex)
-        GlobalConfig._s3_created = True
+    def is_s3_bucket_persistent():
+        """
+        Returns true if S3 bucket is kept between runs. Then files of each run use separate prefix of keys.
+        """
+        return bool(GlobalConfig._global_config.get('s3_persistent_bucket', False))
 
     @staticmethod
-    def delete_s3_bucket():
-        if not GlobalConfig._s3_created:
-            return
-        try:
-            session = GlobalConfig.get_aws_session()
-            s3 = session.resource('s3', config=GlobalConfig.get_aws_config())
-            bucket = s3.Bucket(GlobalConfig.get_s3_bucket())
-            bucket.objects.all().delete()
-            bucket.delete()
-        except Exception as ex:
-            from creatorTools.Exceptions import GlobalException
-            raise GlobalException('Error while deleting bucket {}'
-                                  .format(GlobalConfig.get_s3_bucket()), ex)
+    def get_s3_endpoint_url():
+        """
+        Returns address of S3 service, or None for AWS. It allows to use local S3 stand-in, i.e. moto server.
+        """
+        return GlobalConfig._global_config.get('s3_endpoint_url')
+
+    @staticmethod
+    def get_s3_download_concurrency():
+        return int(GlobalConfig._global_config.get('s3_download_concurrency', 10))
+
+    @staticmethod
+    def get_s3_chunk_size():
+        """
+        Returns size (in bytes) of parts of files downloaded from S3 concurrently.
+        """
+        return int(GlobalConfig._global_config.get('s3_chunk_size_mb', 8)) * 1024 * 1024
 
     @staticmethod
     def get_audiobooks():
@@ -102,19 +115,57 @@ class GlobalConfig:
         return Config(
             region_name=GlobalConfig.get_aws_region(),
             signature_version='v4',
+            max_pool_connections=GlobalConfig.get_aws_max_pool_connections(),
             retries={
                 'max_attempts': 10,
                 'mode': 'standard'
             }
         )
 
+    @staticmethod
+    def get_aws_max_pool_connections():
+        """
+        Returns size of pool of connections kept by each AWS client. By default it is big enough for all workers.
+        """
+        default = max(10, GlobalConfig.get_sync_workers())
+        return int(GlobalConfig._global_config.get('max_pool_connections', default))
+
     @staticmethod
     def get_aws_session():
-        from boto3 import Session
-        return Session(
-            aws_access_key_id=GlobalConfig.get_aws_key_id(),
-            aws_secret_access_key=GlobalConfig.get_aws_access_key()
-        )
+        """
+        Returns AWS session shared by whole application. It is created at first call.
+        """
+        with GlobalConfig._aws_lock:
+            if GlobalConfig._aws_session is None:
+                from boto3 import Session
+                GlobalConfig._aws_session = Session(
+                    aws_access_key_id=GlobalConfig.get_aws_key_id(),
+                    aws_secret_access_key=GlobalConfig.get_aws_access_key()
+                )
+            return GlobalConfig._aws_session
+
+    @staticmethod
+    def get_aws_client(service):
+        """
+        Returns long-lived client of AWS service, shared by all threads. It is created at first call.
+        :param service: name of service, i.e. 'polly' or 's3'
+        """
+        session = GlobalConfig.get_aws_session()
+        with GlobalConfig._aws_lock:
+            # creating clients from one session is not thread-safe
+            if service not in GlobalConfig._aws_clients:
+                endpoint_url = GlobalConfig.get_s3_endpoint_url() if service == 's3' else None
+                GlobalConfig._aws_clients[service] = session.client(service, config=GlobalConfig.get_aws_config(),
+                                                                    endpoint_url=endpoint_url)
+                GlobalConfig._aws_clients_created += 1
+            return GlobalConfig._aws_clients[service]
+
+    @staticmethod
+    def report_aws_clients():
+        if GlobalConfig._aws_clients_created > 0:
+            from creatorTools.ReaderLog import ReaderLog
+            ReaderLog.log('AWS clients created: {} ({}).'
+                          .format(GlobalConfig._aws_clients_created, ', '.join(sorted(GlobalConfig._aws_clients))))
 
     @staticmethod
     def get_max_sync_size():
@@ -124,10 +175,218 @@ class GlobalConfig:
                 from creatorTools.Exceptions import GlobalException
                 raise GlobalException('Value of param max_sync cant be bigger than 3000.', None)
             return max_s
-        elif GlobalConfig._global_config['reading_engine'] == 'google translate':
+        else:
             import sys
             return sys.maxsize   # no limit
 
     @staticmethod
     def get_check_delay():
         return int(GlobalConfig._global_config['check_delay'])
+
+    @staticmethod
+    def get_check_delay_max():
+        """
+        Returns maximal delay between checks of one asynchronous task. Delay grows up to it while task is not finished.
+        """
+        return int(GlobalConfig._global_config.get('check_delay_max', 60))
+
+    @staticmethod
+    def get_async_timeout():
+        """
+        Returns time (in seconds) after which waiting for asynchronous generation is stopped,
+        or None if there is no limit.
+        """
+        timeout = int(GlobalConfig._global_config.get('async_timeout', 0))
+        return timeout if timeout > 0 else None
+
+    @staticmethod
+    def get_google_workers():
+        workers = int(GlobalConfig._global_config.get('google_workers', 4))
+        if workers < 1:
+            from creatorTools.Exceptions import GlobalException
+            raise GlobalException('Value of param google_workers cant be smaller than 1.', None)
+        return workers
+
+    @staticmethod
+    def get_sync_workers():
+        """
+        Returns number of files generated synchronously at the same time.
+        Google Translate divides every file into fragments processed in parallel, so there it is always 1.
+        """
+        if GlobalConfig._global_config['reading_engine'] == 'aws polly':
+            workers = int(GlobalConfig._global_config.get('polly_sync_workers', 1))
+            if workers < 1:
+                from creatorTools.Exceptions import GlobalException
+                raise GlobalException('Value of param polly_sync_workers cant be smaller than 1.', None)
+            return workers
+        return 1
+
+    @staticmethod
+    def is_lpt_schedule_used():
+        """
+        Returns true if files of all books are generated by GenerationScheduler: asynchronous tasks are started
+        from the longest one, and synchronous files are generated while they run. Otherwise books are generated
+        one after another, with files in order of book file.
+        """
+        mode = GlobalConfig._global_config.get('polly_schedule', 'lpt')
+        if mode not in ('lpt', 'file_order'):
+            from creatorTools.Exceptions import GlobalException
+            raise GlobalException('Not correct value for polly_schedule parameter: {}'.format(mode), None)
+        return mode == 'lpt' and GlobalConfig.is_async_generation_used()
+
+    @staticmethod
+    def get_async_workers():
+        """
+        Returns maximal number of asynchronous tasks started by GenerationScheduler that are not finished yet.
+        """
+        workers = int(GlobalConfig._global_config.get('polly_async_workers', 10))
+        if workers < 1:
+            from creatorTools.Exceptions import GlobalException
+            raise GlobalException('Value of param polly_async_workers cant be smaller than 1.', None)
+        return workers
+
+    @staticmethod
+    def get_schedule_estimates():
+        """
+        Returns parameters used to estimate time of generation of file: characters per second read by one synchronous
+        request, characters per second read by asynchronous task and time (in seconds) of waiting for start of task.
+        """
+        config = GlobalConfig._global_config
+        return (float(config.get('polly_sync_speed', 1000)), float(config.get('polly_async_speed', 300)),
+                float(config.get('polly_async_latency', 20)))
+
+    @staticmethod
+    def get_queue_lease():
+        """
+        Returns time (in seconds) after which file of work queue is given to other worker, if worker generating it
+        doesnt renew its lease (i.e. it was killed).
+        """
+        return float(GlobalConfig._global_config.get('queue_lease', 60))
+
+    @staticmethod
+    def get_queue_idle_timeout():
+        """
+        Returns time (in seconds) after which worker of work queue ends, if there are no files to generate.
+        """
+        return float(GlobalConfig._global_config.get('queue_idle_timeout', 10))
+
+    @staticmethod
+    def get_queue_max_attempts():
+        """
+        Returns number of attempts of generation of file of work queue, after which file is failed.
+        """
+        return int(GlobalConfig._global_config.get('queue_max_attempts', 3))
+
+    @staticmethod
+    def get_tts_cache_dir():
+        """
+        Returns directory of cache of generated audio, or None if cache is not used.
+        """
+        return GlobalConfig._global_config.get('tts_cache_dir')
+
+    @staticmethod
+    def get_tts_cache_size():
+        """
+        Returns maximum size of cache of generated audio in bytes.
+        """
+        return int(float(GlobalConfig._global_config.get('tts_cache_size_mb', 1024)) * 1024 * 1024)
+
+    @staticmethod
+    def get_polly_sync_slots():
+        """
+        Returns semaphore shared by all threads that limits number of synchronous Polly requests in flight.
+        """
+        with GlobalConfig._aws_lock:
+            if GlobalConfig._polly_sync_slots is None:
+                GlobalConfig._polly_sync_slots = threading.BoundedSemaphore(GlobalConfig.get_sync_workers())
+            return GlobalConfig._polly_sync_slots
+
+    @staticmethod
+    def get_google_rate_limiter():
+        """
+        Returns limiter of rate of requests to Google Translate, shared by all threads. It is created at first call.
+        """
+        with GlobalConfig._aws_lock:
+            if GlobalConfig._google_rate_limiter is None:
+                from creatorTools.RateLimiter import RateLimiter
+                config = GlobalConfig._global_config
+                workers = GlobalConfig.get_google_workers()
+                GlobalConfig._google_rate_limiter = RateLimiter(
+                    'Google Translate',
+                    rate=float(config.get('google_rate', 0)),
+                    burst=float(config.get('google_burst', workers)),
+                    max_concurrency=workers,
+                    max_attempts=int(config.get('google_retries', 10)),
+                    retry_budget=int(config.get('google_retry_budget', 100)),
+                    backoff_base=float(config.get('google_backoff_base', 1)),
+                    backoff_max=float(config.get('google_backoff_max', 60)))
+            return GlobalConfig._google_rate_limiter
+
+    @staticmethod
+    def is_async_generation_used():
+        """
+        Returns true if text longer than max_sync is read asynchronously, with results saved in S3 bucket.
+        Otherwise such text is divided into chunks read synchronously.
+        """
+        if GlobalConfig._global_config['reading_engine'] != 'aws polly':
+            return False
+        mode = GlobalConfig._global_config.get('polly_long_text', 'chunks')
+        if mode not in ('chunks', 'async'):
+            from creatorTools.Exceptions import GlobalException
+            raise GlobalException('Not correct value for polly_long_text parameter: {}'.format(mode), None)
+        return mode == 'async'
+
+    @staticmethod
+    def is_book_mmap_used():
+        """
+        Returns true if book files are mapped to memory while parsing, instead of being read in chunks.
+        """
+        return bool(GlobalConfig._global_config.get('book_mmap', False))
+
+    @staticmethod
+    def get_hash_compact_every():
+        """
+        Returns number of records in journal of hashes after which it is merged into hash file.
+        """
+        return int(GlobalConfig._global_config.get('hash_compact_every', 100))
+
+    @staticmethod
+    def get_metrics_file():
+        """
+        Returns path of file where metrics (times of stages and counters) are written, or None if they are not written.
+        """
+        return GlobalConfig._global_config.get('metrics_file')
+
+    @staticmethod
+    def get_metrics_format():
+        """
+        Returns format of file with metrics: 'jsonl' - one JSON line per span, or 'prometheus' - textfile for
+        node exporter, with summary of all spans and counters.
+        """
+        metrics_format = GlobalConfig._global_config.get('metrics_format', 'jsonl')
+        if metrics_format not in ('jsonl', 'prometheus'):
+            from creatorTools.Exceptions import GlobalException
+            raise GlobalException('Not correct value for metrics_format parameter: {}'.format(metrics_format), None)
+        return metrics_format
+
+    @staticmethod
+    def get_watch_interval():
+        """
+        Returns time (in seconds) between checks of files in watch mode, when inotify is not available.
+        """
+        return float(GlobalConfig._global_config.get('watch_interval', 1))
+
+    @staticmethod
+    def get_watch_debounce():
+        """
+        Returns time (in seconds) without changes of files after which changed books are generated in watch mode.
+        """
+        return float(GlobalConfig._global_config.get('watch_debounce', 0.5))
+
+    @staticmethod
+    def is_output_synced():
+        """
+        Returns true if every MP3 file is written to disk (fsync) before it is renamed to its name
+        and its hash is saved.
+        """
+        return bool(GlobalConfig._global_config.get('output_fsync', True))
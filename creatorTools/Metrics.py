@@ -0,0 +1,241 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from creatorTools.GlobalConfig import GlobalConfig
+
+
+class Metrics:
+    """
+    Class with static data collecting timing spans of stages of generation and counters (i.e. number of requests).
+    Depending on global config, every span is written as one JSON line, or summary of all spans and counters
+    is written as Prometheus textfile (rewritten atomically every few seconds and at the end of run).
+    Spans and counters are collected also when no file is configured - they are shown in summary at the end.
+    """
+    TEXTFILE_INTERVAL = 10  # minimal number of seconds between writes of Prometheus textfile
+
+    _opened = False
+    _file = None        # path of file with metrics, None if metrics are not written
+    _format = None      # 'jsonl' or 'prometheus'
+    _jsonl = None       # opened JSON lines file
+    _worker = False     # true in worker process - Prometheus textfile is written only by main process
+    _spans = {}         # {stage: [number of spans, total seconds, maximal seconds]}
+    _counters = {}      # {name: value}
+    _gauges = {}        # {name: value}, last value is kept
+    _last_write = 0.0
+    _lock = threading.Lock()
+    _textfile_lock = threading.Lock()   # only one thread writes Prometheus textfile at the same time
+
+    @staticmethod
+    @contextmanager
+    def span(stage, **labels):
+        """
+        Measures time of block of code as one span of stage, i.e. with Metrics.span('parse_book_file'): ...
+        :param stage: name of stage
+        :param labels: additional data written to JSON line, i.e. name of file
+        """
+        start = time.time()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            Metrics.record(stage, time.perf_counter() - started, start, **labels)
+
+    @staticmethod
+    def record(stage, seconds, start=None, **labels):
+        """
+        Adds span of stage measured outside of this class.
+        :param stage: name of stage
+        :param seconds: duration of span
+        :param start: time (epoch) when span started, by default it is calculated from duration
+        """
+        Metrics._open()
+        with Metrics._lock:
+            stats = Metrics._spans.setdefault(stage, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            if Metrics._jsonl is not None:
+                line = dict(labels, type='span', stage=stage, pid=os.getpid(),
+                            start=round(start if start is not None else time.time() - seconds, 6),
+                            seconds=round(seconds, 6))
+                Metrics._write_line(line)
+        Metrics._write_textfile_periodically()
+
+    @staticmethod
+    def count(name, value=1):
+        """
+        Increases counter, i.e. Metrics.count('requests').
+        """
+        with Metrics._lock:
+            Metrics._counters[name] = Metrics._counters.get(name, 0) + value
+
+    @staticmethod
+    def gauge(name, value):
+        """
+        Sets current value of gauge, i.e. Metrics.gauge('concurrency_limit', 4).
+        """
+        Metrics._open()
+        with Metrics._lock:
+            Metrics._gauges[name] = value
+            if Metrics._jsonl is not None:
+                Metrics._write_line({'type': 'gauge', 'name': name, 'value': value, 'pid': os.getpid(),
+                                     'time': round(time.time(), 6)})
+
+    @staticmethod
+    def get_counter(name):
+        with Metrics._lock:
+            return Metrics._counters.get(name, 0)
+
+    @staticmethod
+    def set_worker_process():
+        """
+        Marks process as worker - its spans and counters are passed to main process with snapshot and merge.
+        """
+        Metrics._worker = True
+
+    @staticmethod
+    def snapshot(reset=False):
+        """
+        Returns all spans and counters collected so far, i.e. to pass them from worker process to main process.
+        :param reset: if true, spans and counters are cleared
+        """
+        with Metrics._lock:
+            snapshot = {'spans': {stage: list(stats) for stage, stats in Metrics._spans.items()},
+                        'counters': dict(Metrics._counters), 'gauges': dict(Metrics._gauges)}
+            if reset:
+                Metrics._spans = {}
+                Metrics._counters = {}
+                Metrics._gauges = {}
+            return snapshot
+
+    @staticmethod
+    def merge(snapshot):
+        """
+        Adds spans and counters returned by snapshot in other process.
+        """
+        with Metrics._lock:
+            for stage, (number, total, maximum) in snapshot['spans'].items():
+                stats = Metrics._spans.setdefault(stage, [0, 0.0, 0.0])
+                stats[0] += number
+                stats[1] += total
+                stats[2] = max(stats[2], maximum)
+            for name, value in snapshot['counters'].items():
+                Metrics._counters[name] = Metrics._counters.get(name, 0) + value
+            Metrics._gauges.update(snapshot['gauges'])
+
+    @staticmethod
+    def close():
+        """
+        Writes final values of counters and closes file with metrics.
+        """
+        if not Metrics._opened and len(Metrics._spans) == 0 and len(Metrics._counters) == 0:
+            return  # nothing was measured, i.e. run was stopped by error in global config
+        Metrics._open()
+        with Metrics._lock:
+            if Metrics._jsonl is not None:
+                if not Metrics._worker:
+                    for name, value in sorted(Metrics._counters.items()):
+                        Metrics._write_line({'type': 'counter', 'name': name, 'value': value, 'time': time.time()})
+                Metrics._jsonl.close()
+                Metrics._jsonl = None
+        if Metrics._format == 'prometheus' and not Metrics._worker:
+            Metrics._write_textfile()
+
+    @staticmethod
+    def report():
+        from creatorTools.ReaderLog import ReaderLog
+        with Metrics._lock:
+            if len(Metrics._spans) == 0:
+                return
+            stages = ', '.join('{} {:.2f} s'.format(stage, stats[1])
+                               for stage, stats in sorted(Metrics._spans.items(), key=lambda item: -item[1][1]))
+            counters = ', '.join('{} {}'.format(name, value) for name, value
+                                 in sorted(list(Metrics._counters.items()) + list(Metrics._gauges.items())))
+        ReaderLog.log('Time of stages (summed over threads): {}.'.format(stages))
+        if counters != '':
+            ReaderLog.log('Counters: {}.'.format(counters))
+
+    @staticmethod
+    def _open():
+        if Metrics._opened:
+            return
+        with Metrics._lock:
+            if Metrics._opened:
+                return
+            Metrics._file = GlobalConfig.get_metrics_file()
+            Metrics._format = GlobalConfig.get_metrics_format()
+            if Metrics._file is not None and Metrics._format == 'jsonl':
+                try:
+                    # many processes append to the same file - every line is written with one call
+                    Metrics._jsonl = open(Metrics._file, 'a', encoding='utf-8')
+                except OSError as ex:
+                    from creatorTools.Exceptions import GlobalException
+                    raise GlobalException('Not able to open file with metrics: {} '.format(Metrics._file), ex)
+            Metrics._opened = True
+
+    @staticmethod
+    def _write_line(line):
+        # must be called under lock
+        Metrics._jsonl.write(json.dumps(line) + '\n')
+        Metrics._jsonl.flush()
+
+    @staticmethod
+    def _write_textfile_periodically():
+        if Metrics._format != 'prometheus' or Metrics._file is None or Metrics._worker:
+            return
+        if time.monotonic() - Metrics._last_write >= Metrics.TEXTFILE_INTERVAL:
+            Metrics._write_textfile()
+
+    @staticmethod
+    def _write_textfile():
+        """
+        Writes all spans and counters in Prometheus text format. File is replaced atomically,
+        so node exporter never reads partially written file. Threads write it one after another,
+        so older values never replace newer ones.
+        """
+        if Metrics._file is None:
+            return
+        with Metrics._textfile_lock:
+            with Metrics._lock:
+                Metrics._last_write = time.monotonic()
+                lines = ['# HELP audiobook_stage_seconds_total Time spent in stage, summed over threads.',
+                         '# TYPE audiobook_stage_seconds_total counter']
+                lines += ['audiobook_stage_seconds_total{{stage="{}"}} {:.6f}'.format(stage, stats[1])
+                          for stage, stats in sorted(Metrics._spans.items())]
+                lines += ['# HELP audiobook_stage_spans_total Number of spans of stage.',
+                          '# TYPE audiobook_stage_spans_total counter']
+                lines += ['audiobook_stage_spans_total{{stage="{}"}} {}'.format(stage, stats[0])
+                          for stage, stats in sorted(Metrics._spans.items())]
+                lines += ['# HELP audiobook_stage_max_seconds Longest span of stage.',
+                          '# TYPE audiobook_stage_max_seconds gauge']
+                lines += ['audiobook_stage_max_seconds{{stage="{}"}} {:.6f}'.format(stage, stats[2])
+                          for stage, stats in sorted(Metrics._spans.items())]
+                for name, value in sorted(Metrics._counters.items()):
+                    lines += ['# TYPE audiobook_{}_total counter'.format(name),
+                              'audiobook_{}_total {}'.format(name, value)]
+                for name, value in sorted(Metrics._gauges.items()):
+                    lines += ['# TYPE audiobook_{} gauge'.format(name),
+                              'audiobook_{} {}'.format(name, value)]
+                lines += ['# TYPE audiobook_last_update_seconds gauge',
+                          'audiobook_last_update_seconds {:.3f}'.format(time.time())]
+            try:
+                # temporary file is unique, so writers in other processes (i.e. workers of queue) dont mix their data
+                handle, tmp_file = tempfile.mkstemp(prefix=os.path.basename(Metrics._file) + '.',
+                                                    suffix='.tmp', dir=os.path.dirname(os.path.abspath(Metrics._file)))
+                try:
+                    with os.fdopen(handle, 'w', encoding='utf-8') as text_file:
+                        text_file.write('\n'.join(lines) + '\n')
+                    # mkstemp creates file readable only by owner, node exporter can run as other user
+                    os.chmod(tmp_file, 0o644)
+                    os.replace(tmp_file, Metrics._file)
+                except OSError:
+                    os.remove(tmp_file)
+                    raise
+            except OSError as ex:
+                # metrics dont stop generation
+                from creatorTools.ReaderLog import ReaderLog
+                ReaderLog.log('[WARNING] Not able to write metrics to file {}: {}'.format(Metrics._file, ex))
@@ -0,0 +1,196 @@
+import os
+import shutil
+import subprocess
+import threading
+from collections import namedtuple
+
+from creatorTools.Exceptions import Mp3Exception
+from creatorTools.Metrics import Metrics
+
+# parameters of one frame of MPEG audio: layer (1-3), sample rate in Hz, number of channels, length of frame in bytes
+FrameHeader = namedtuple('FrameHeader', ['layer', 'sample_rate', 'channels', 'length'])
+
+
+class FormatChanged(Exception):
+    """
+    Raised when frame with different sample rate or channel layout is found in the middle of joined data
+    """
+
+
+class Mp3Concatenation:
+    """
+    Class joining many MP3 files into one.
+    If all files have the same sample rate and channel layout, their frames are copied one after another,
+    without decoding. Otherwise files are decoded and encoded again by ffmpeg, as a stream.
+    In both cases only small part of audio is kept in memory.
+    """
+
+    _BITRATES = {  # kbit/s, key is (MPEG1, layer)
+        (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+        (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    }
+    _SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+    _COPY_CHUNK = 64 * 1024
+
+    @staticmethod
+    def concatenate(paths, out_file):
+        """
+        Writes audio from all files, in given order, to output.
+        :param paths: list of full paths of MP3 files
+        :param out_file: binary file object, opened for writing, to which MP3 data is written
+        """
+        with Metrics.span('concatenate', files=len(paths)):
+            if len(paths) == 0:
+                raise Mp3Exception('No MP3 data to join.', None)
+            formats = [Mp3Concatenation.file_format(path) for path in paths]
+            if None not in formats and len(set(formats)) == 1:
+                start = out_file.tell()
+                try:
+                    for path in paths:
+                        Mp3Concatenation._copy_frames(path, out_file, formats[0])
+                    return
+                except FormatChanged:
+                    # format is different inside of some file - data copied so far is dropped
+                    out_file.seek(start)
+                    out_file.truncate()
+                except OSError as ex:
+                    raise Mp3Exception('Not able to join MP3 files.', ex)
+            known = [f for f in formats if f is not None]
+            sample_rate = max([f[1] for f in known], default=24000)
+            channels = max([f[2] for f in known], default=1)
+            Mp3Concatenation._reencode(paths, out_file, sample_rate, channels)
+
+    @staticmethod
+    def file_format(path):
+        """
+        Reads format of audio from first frame of MP3 file.
+        :param path: full path of file
+        :return: tuple (layer, sample rate, channels), or None if file contains no MPEG audio frames
+        """
+        try:
+            with open(path, 'rb') as file:
+                for header, _ in Mp3Concatenation.frames(file):
+                    return header.layer, header.sample_rate, header.channels
+        except OSError as ex:
+            raise Mp3Exception('Not able to read MP3 file: {} '.format(path), ex)
+        return None
+
+    @staticmethod
+    def frames(file):
+        """
+        Generator of MPEG audio frames from file. ID3 tags and data that are not frames are skipped.
+        :param file: binary file object, opened for reading
+        :return: tuples (FrameHeader, bytes of whole frame)
+        """
+        file.seek(0, os.SEEK_END)
+        end = file.tell()
+        if end >= 128:
+            file.seek(end - 128)
+            if file.read(3) == b'TAG':
+                end -= 128   # ID3v1 tag at the end of file
+        file.seek(0)
+        head = file.read(10)
+        pos = 0
+        if len(head) == 10 and head[:3] == b'ID3':
+            # ID3v2 tag at the beginning of file, size is stored as 'syncsafe' integer
+            size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+            pos = 10 + size + (10 if head[5] & 0x10 else 0)
+        while pos + 4 <= end:
+            file.seek(pos)
+            header = Mp3Concatenation.parse_header(file.read(4))
+            if header is None or pos + header.length > end:
+                pos += 1    # lost synchronization - looking for next frame
+                continue
+            file.seek(pos)
+            yield header, file.read(header.length)
+            pos += header.length
+
+    @staticmethod
+    def parse_header(data):
+        """
+        Parses four bytes of header of MPEG audio frame.
+        :param data: bytes
+        :return: FrameHeader, or None if bytes are not valid header
+        """
+        if len(data) < 4 or data[0] != 0xFF or (data[1] & 0xE0) != 0xE0:
+            return None
+        version = (data[1] >> 3) & 0x03     # 3 - MPEG1, 2 - MPEG2, 0 - MPEG2.5
+        layer = 4 - ((data[1] >> 1) & 0x03)
+        bitrate_index = data[2] >> 4
+        sample_rate_index = (data[2] >> 2) & 0x03
+        if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+            return None
+        mpeg1 = version == 3
+        bitrate = Mp3Concatenation._BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+        sample_rate = Mp3Concatenation._SAMPLE_RATES[version][sample_rate_index]
+        padding = (data[2] >> 1) & 0x01
+        if layer == 1:
+            length = (12 * bitrate // sample_rate + padding) * 4
+        elif layer == 3 and not mpeg1:
+            length = 72 * bitrate // sample_rate + padding
+        else:
+            length = 144 * bitrate // sample_rate + padding
+        channels = 1 if (data[3] >> 6) == 3 else 2
+        return FrameHeader(layer, sample_rate, channels, length)
+
+    @staticmethod
+    def _copy_frames(path, out_file, audio_format):
+        with open(path, 'rb') as file:
+            first = True
+            for header, frame in Mp3Concatenation.frames(file):
+                if (header.layer, header.sample_rate, header.channels) != audio_format:
+                    raise FormatChanged()
+                if first and Mp3Concatenation._is_info_frame(frame):
+                    # Xing/Info/VBRI frame describes only this file, it would be wrong for joined data
+                    first = False
+                    continue
+                first = False
+                out_file.write(frame)
+
+    @staticmethod
+    def _is_info_frame(frame):
+        return b'Xing' in frame[4:64] or b'Info' in frame[4:64] or frame[36:40] == b'VBRI'
+
+    @staticmethod
+    def _reencode(paths, out_file, sample_rate, channels):
+        """
+        Decodes all files to raw samples with common sample rate and channels and encodes them again to one MP3.
+        Data flows through pipes between ffmpeg processes, so whole audio is never kept in memory.
+        """
+        from pydub.utils import get_encoder_name
+        ffmpeg = get_encoder_name()
+        raw_format = ['-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels)]
+        try:
+            encoder = subprocess.Popen([ffmpeg, '-loglevel', 'error'] + raw_format + ['-i', 'pipe:0', '-f', 'mp3',
+                                                                                       'pipe:1'],
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        except OSError as ex:
+            raise Mp3Exception('Not able to start {} to join MP3 files with different formats.'.format(ffmpeg), ex)
+        # output of encoder is read in separate thread, so pipes never block each other
+        writer = threading.Thread(target=shutil.copyfileobj,
+                                  args=(encoder.stdout, out_file, Mp3Concatenation._COPY_CHUNK))
+        writer.start()
+        error = None
+        try:
+            for path in paths:
+                decoder = subprocess.Popen([ffmpeg, '-loglevel', 'error', '-i', path] + raw_format + ['pipe:1'],
+                                           stdout=subprocess.PIPE)
+                shutil.copyfileobj(decoder.stdout, encoder.stdin, Mp3Concatenation._COPY_CHUNK)
+                decoder.stdout.close()
+                if decoder.wait() != 0:
+                    error = Mp3Exception('Not able to decode MP3 file: {} '.format(path), None)
+                    break
+        except OSError as ex:
+            error = Mp3Exception('Not able to join MP3 files with different formats.', ex)
+        finally:
+            encoder.stdin.close()
+            writer.join()
+            encoder.stdout.close()
+            if encoder.wait() != 0 and error is None:
+                error = Mp3Exception('Encoding of joined MP3 files failed.', None)
+        if error is not None:
+            raise error
@@ -13,6 +13,10 @@ class Mp3File(ABC):
         self.file_name = None
         self.file_tile = None
         self.book = belongs_to_book
+        self.source_line = None     # number of line in book file where section of this file starts
+        self.source_column = 1      # column of book file where text of section starts
+        self.source_breaks = []     # positions of new lines in text of section, see BookSection
+        self.tagged = True  # false for audio generated by queue worker, coordinator adds tag when it publishes file
 
     @abstractmethod
     def encode_to_required_format(self):
@@ -27,24 +31,155 @@ class Mp3File(ABC):
         pass
 
     @abstractmethod
-    def check_save_task(self):
+    def check_save_task(self, task_status=None):
         pass
 
-    def _save_metadata(self, full_path):
-        # set proper values to MP3 tags
+    def set_source(self, section):
+        """
+        Remembers where section of this file is in book file, so that errors in its text show line and column.
+        :param section: BookSection object
+        """
+        self.source_line = section.line
+        # text of section starts after @@, name of file and @
+        self.source_column = len(section.name) + 4
+        self.source_breaks = section.breaks
+
+    def validate(self):
+        """
+        Checks if text can be read, without calling reading engine. Raises exception describing problem.
+        """
+        self.encode_to_required_format()
+
+    @staticmethod
+    @abstractmethod
+    def supported_languages():
+        """
+        Returns codes of languages that can be used in book file, separated by spaces.
+        """
+
+    def _compile_markup(self, languages):
+        """
+        Divides text to read into spans in different languages.
+        :param languages: codes of languages supported by engine
+        :return: list of Span objects
+        """
+        from creatorTools.BookMarkup import BookMarkup, MarkupError
+        try:
+            return BookMarkup.compile(self.raw_text, languages)
+        except MarkupError as ex:
+            from creatorTools.Exceptions import BookException
+            position = ''
+            if self.source_line is not None:
+                position = ', line {}, column {}'.format(*BookMarkup.line_column(
+                    ex.offset, self.source_line, self.source_column, self.source_breaks))
+            raise BookException('Syntax error({}) in text of book for file: {}{}: \'{}\''
+                                .format(ex.message, self.file_name, position,
+                                        self.raw_text[ex.offset:ex.offset + 20]), None)
+
+    def _publish(self, write_audio):
+        """
+        Creates tagged MP3 file in result directory with one write. ID3 tag is prepared in memory and written
+        to temporary file in result directory, audio is written after it by write_audio. Temporary file is renamed
+        to name of MP3 file (atomically) and only then hash of file is saved, so that interrupted run never leaves
+        file without tags or with part of audio.
+        :param write_audio: function with one parameter - binary file object, opened for writing. It can return
+                            False if it has no audio, then nothing is created.
+        :return: true if file was created
+        """
+        import os
+        from creatorTools.GlobalConfig import GlobalConfig
+        from creatorTools.Metrics import Metrics
+        output = os.path.join(self.book.get_result_dir(), self.file_name)
+        # name ends with .tmp, so it is removed like other unknown files if program is stopped while writing it
+        tmp_output = output + '.tmp'
+        tag = self._id3_tag() if self.tagged else b''
+        synced = GlobalConfig.is_output_synced()
+        try:
+            file = open(tmp_output, 'wb')
+            try:
+                file.write(tag)
+                written = write_audio(file) is not False
+                if written:
+                    with Metrics.span('publish', file=self.file_name):
+                        file.flush()
+                        if synced:
+                            os.fsync(file.fileno())
+                        file.close()
+                        os.replace(tmp_output, output)
+                        if synced:
+                            Mp3File._sync_directory(self.book.get_result_dir())
+            finally:
+                file.close()
+        except BaseException as ex:
+            Mp3File._remove(tmp_output)
+            if isinstance(ex, OSError):
+                from creatorTools.Exceptions import Mp3Exception
+                raise Mp3Exception('Not able to write MP3 file: {} '.format(self.file_name), ex)
+            raise
+        if not written:
+            Mp3File._remove(tmp_output)
+            return False
+        Metrics.count('files_generated')
+        # save hash
+        self.book.update_and_save_hashes(self.file_tile, self.raw_text_hash)
+        return True
+
+    def publish_audio(self, audio_path):
+        """
+        Creates tagged MP3 file from audio generated by other process (queue worker) and saves its hash.
+        :param audio_path: path of MP3 file without tags
+        """
+        import shutil
+
+        def copy_audio(out_file):
+            with open(audio_path, 'rb') as audio:
+                shutil.copyfileobj(audio, out_file)
+        return self._publish(copy_audio)
+
+    def _id3_tag(self):
+        """
+        Returns ID3 tag of file (proper values of MP3 tags), prepared in memory.
+        """
+        import io
+        from creatorTools.Metrics import Metrics
         try:
-            from mutagen.mp3 import MP3
             from mutagen.easyid3 import EasyID3
-            mp3 = MP3(full_path, ID3=EasyID3)
-            mp3['album'] = self.book.get_mp3_tag('Album')
-            mp3['artist'] = self.book.get_mp3_tag('Artist')
-            mp3['albumartist'] = self.book.get_mp3_tag('AlbumArtist')
-            mp3['tracknumber'] = self.file_no
-            mp3['title'] = self.file_tile.replace('_', ' ').title()
-            mp3['date'] = self.book.get_mp3_tag('AlbumDate')
-            mp3.save()
+            with Metrics.span('save_metadata', file=self.file_name):
+                tag = EasyID3()
+                tag['album'] = self.book.get_mp3_tag('Album')
+                tag['artist'] = self.book.get_mp3_tag('Artist')
+                tag['albumartist'] = self.book.get_mp3_tag('AlbumArtist')
+                tag['tracknumber'] = self.file_no
+                tag['title'] = self.file_tile.replace('_', ' ').title()
+                tag['date'] = self.book.get_mp3_tag('AlbumDate')
+                data = io.BytesIO()
+                tag.save(data)
+                return data.getvalue()
         except Exception as ex:
             from creatorTools.Exceptions import Mp3Exception
             raise Mp3Exception('Updating ID3 tags for file {} failed.'.format(self.file_name), ex)
-        # save hash
-        self.book.update_and_save_hashes(self.file_tile, self.raw_text_hash)
+
+    @staticmethod
+    def _remove(path):
+        import os
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _sync_directory(directory):
+        """
+        Saves durably entry of renamed file in directory. It is not possible on all systems (i.e. Windows).
+        """
+        import os
+        try:
+            descriptor = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(descriptor)
+        except OSError:
+            pass
+        finally:
+            os.close(descriptor)
@@ -1,10 +1,15 @@
+from creatorTools.EngineLanguages import PollyLanguages
 from creatorTools.GlobalConfig import GlobalConfig
+from creatorTools.Metrics import Metrics
 import os
 import re
-from botocore.exceptions import BotoCoreError, ClientError
+import shutil
 from contextlib import closing
+from creatorTools.Mp3Concatenation import Mp3Concatenation
 from creatorTools.Mp3File import Mp3File
 from creatorTools.ReaderLog import ReaderLog
+from creatorTools.S3Transfer import S3Transfer
+from creatorTools.TtsCache import TtsCache
 
 
 class Mp3FileFromAwsPolly(Mp3File):
@@ -14,6 +19,8 @@ class Mp3FileFromAwsPolly(Mp3File):
     It uses https://docs.aws.amazon.com/polly/latest/dg/StartSpeechSynthesisTaskSamplePython.html
     as method 'synthesize_speech' has upper limit of 3000 characters
     """
+    # SSML tags that can be used in text of books, all other special characters of XML are escaped
+    _SSML_TAGS = re.compile(r'<break(\s[^<>]*)?/>|</?(emphasis|prosody|say-as|sub)(\s[^<>]*)?>|</?[ps]>')
 
     def __init__(self, text_to_read, mp3_no_name, hash_of_text, belongs_to_book):
         """
@@ -28,90 +35,151 @@ class Mp3FileFromAwsPolly(Mp3File):
         self.file_no = mp3_no_name[0]
         self.file_tile = mp3_no_name[1].split('.')[0]  # only name of file, no number and no extension
         self.file_name = mp3_no_name[0] + '-' + mp3_no_name[1]  # filename of mp3 file
-        self.def_voice = Languages.get_voice(self.book.get_default_language().upper())
+        self.def_voice = PollyLanguages.get_voice(self.book.get_default_language().upper())
         self.task_id = None     # task id for Polly is kept here if asynchronous generation is used
+        self.s3_key = None      # key of file generated by task in S3 bucket
 
     def encode_to_required_format(self):
         """
         Encodes text to format required by polly engine.
         :return: length of encoded text, or exception if failure (i.e. wrong syntax)
         """
-        # counting signs @ - there must be even number of them
-        no_of_sections = len(re.findall(Languages.get_regex_lang(), self.raw_text))
-        no_of_marks = len(re.findall('@', self.raw_text))
-        if no_of_marks != no_of_sections * 2:
-            from creatorTools.Exceptions import BookException
-            raise BookException('Syntax error(not matching @) in text of book for file: {} '.format(self.file_name),
-                                None)
-        # replacing names of section with strings required by polly
-        for lang, p_code in Languages.table_of_languages().items():
-            polly_beginning = re.sub('XX', p_code, '<lang xml:lang="XX">')
-            self.polly_text = re.sub('@{}'.format(lang.upper()), polly_beginning, self.polly_text)
-        # ends are the same everywhere
-        polly_end = '</lang>'
-        self.polly_text = re.sub(r'@[^a-z^A-Z]', polly_end, self.polly_text)
-        self.polly_text = '<speak>' + self.polly_text + '</speak>'
-        remains = re.search('@', self.polly_text)
-        if remains is not None:
-            from creatorTools.Exceptions import BookException
-            start_pos = remains.span()[0]
-            end_pos = min(len(self.polly_text), start_pos + 6)
-            raise BookException('Syntax error(string: {}) in text of book for file: {} '
-                                .format(self.polly_text[start_pos:end_pos], self.file_name), None)
+        languages = PollyLanguages.table_of_languages()
+        # sections in other languages are put into tags required by polly
+        parts = ['<speak>']
+        for span in self._compile_markup(list(languages)):
+            if span.lang is None:
+                parts.append(Mp3FileFromAwsPolly.escape_text(span.text))
+            else:
+                parts.append('<lang xml:lang="{}">{}</lang>'
+                             .format(languages[span.lang], Mp3FileFromAwsPolly.escape_text(span.text)))
+        parts.append('</speak>')
+        self.polly_text = ''.join(parts)
         return len(self.polly_text)
 
+    def validate(self):
+        """
+        Checks syntax of text and, if it is read synchronously, if it can be divided into chunks.
+        """
+        size = self.encode_to_required_format()
+        if size <= GlobalConfig.get_max_sync_size() or not GlobalConfig.is_async_generation_used():
+            Mp3FileFromAwsPolly.split_ssml(self.polly_text, GlobalConfig.get_max_sync_size())
+
     def save_mp3(self):
         """
         Encodes text to mp3. Uses synchronous method that has upper limit of converting 3000 characters.
+        Longer text is divided into chunks that are converted in parallel and joined into one file.
         :return: nothing
         """
-        session = GlobalConfig.get_aws_session()
-        polly = session.client("polly", config=GlobalConfig.get_aws_config())
+        if not os.path.isdir(self.book.get_result_dir()):
+            os.mkdir(self.book.get_result_dir())
+        chunks = Mp3FileFromAwsPolly.split_ssml(self.polly_text, GlobalConfig.get_max_sync_size())
+        if len(chunks) == 1:
+            # audio is written directly to output, after ID3 tag
+            self._publish(lambda out_file: self._synthesize_cached(chunks[0], out_file))
+        else:
+            self._synthesize_chunks(chunks)
+        ReaderLog.log_inline('saved: {} ... '.format(os.path.join(self.book.get_result_dir(), self.file_name)))
+
+    def _synthesize_chunks(self, chunks):
+        """
+        Converts chunks of SSML text in parallel and joins them into one MP3 file.
+        :param chunks: list of SSML texts, each no longer than 3000 characters
+        """
+        import tempfile
+        from concurrent.futures import ThreadPoolExecutor
+        tempdir = tempfile.mkdtemp(prefix="audiobookreader-")
+        executor = ThreadPoolExecutor(max_workers=GlobalConfig.get_sync_workers())
         try:
-            # Request speech synthesis
-            response = polly.synthesize_speech(Text=self.polly_text, OutputFormat="mp3",
-                                               VoiceId=self.def_voice, TextType='ssml')
-        except (BotoCoreError, ClientError) as error:
-            from creatorTools.Exceptions import Mp3Exception
-            raise Mp3Exception('Error from AWS while generating MP3 file: {} '.format(self.file_name), error)
+            chunk_files = [os.path.join(tempdir, 'chunk{:0>4d}.mp3'.format(no)) for no in range(len(chunks))]
+            for future in [executor.submit(self._synthesize_chunk, chunk, chunk_file)
+                           for chunk, chunk_file in zip(chunks, chunk_files)]:
+                future.result()
+            self._publish(lambda out_file: Mp3Concatenation.concatenate(chunk_files, out_file))
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            shutil.rmtree(tempdir)
 
-        # Access the audio stream from the response
-        if "AudioStream" in response:
-            if not os.path.isdir(self.book.get_result_dir()):
-                os.mkdir(self.book.get_result_dir())
-            # Note: Closing the stream is important because the service throttles on the
-            # number of parallel connections. Here we are using contextlib.closing to
-            # ensure the close method of the stream object will be called automatically
-            # at the end of the with statement's scope.
-            with closing(response["AudioStream"]) as stream:
-                output = os.path.join(self.book.get_result_dir(), self.file_name)
-                try:
-                    # Open a file for writing the output as a binary stream
-                    with open(output, "wb") as file:
-                        file.write(stream.read())
-                except IOError as error:
-                    from creatorTools.Exceptions import Mp3Exception
-                    raise Mp3Exception('Not able to write MP3 file: {} '.format(self.file_name), error)
-                ReaderLog.log_inline('saved: {} ... '.format(output))
-        else:
+    def _synthesize_chunk(self, ssml, chunk_file):
+        try:
+            with open(chunk_file, 'wb') as out_file:
+                self._synthesize_cached(ssml, out_file)
+        except OSError as error:
             from creatorTools.Exceptions import Mp3Exception
-            raise Mp3Exception('The response for generating {} didnt contain audio data'.format(self.file_name), None)
-        self._save_metadata(output)
+            raise Mp3Exception('Not able to write MP3 file: {} '.format(chunk_file), error)
+
+    def _synthesize_cached(self, ssml, out_file):
+        if not TtsCache.fetch('aws polly', self.def_voice, ssml, out_file):
+            start = out_file.tell()
+            self._synthesize(ssml, out_file)
+            out_file.flush()
+            TtsCache.store('aws polly', self.def_voice, ssml, out_file.name, offset=start)
+
+    def _synthesize(self, ssml, out_file):
+        """
+        Converts SSML text to MP3 file using synchronous method. Audio is copied from response to file in parts.
+        :param ssml: text to read, no longer than 3000 characters
+        :param out_file: binary file object to which audio is written
+        """
+        from botocore.exceptions import BotoCoreError, ClientError
+        polly = GlobalConfig.get_aws_client('polly')
+        # number of requests in flight is limited for whole application
+        with GlobalConfig.get_polly_sync_slots():
+            try:
+                # Request speech synthesis
+                Metrics.count('requests')
+                with Metrics.span('polly_synthesize_speech', file=self.file_name):
+                    response = polly.synthesize_speech(Text=ssml, OutputFormat="mp3",
+                                                       VoiceId=self.def_voice, TextType='ssml')
+            except (BotoCoreError, ClientError) as error:
+                from creatorTools.Exceptions import Mp3Exception
+                raise Mp3Exception('Error from AWS while generating MP3 file: {} '.format(self.file_name), error)
+
+            # Access the audio stream from the response
+            if "AudioStream" in response:
+                # Note: Closing the stream is important because the service throttles on the
+                # number of parallel connections. Here we are using contextlib.closing to
+                # ensure the close method of the stream object will be called automatically
+                # at the end of the with statement's scope.
+                with closing(response["AudioStream"]) as stream:
+                    try:
+                        start = out_file.tell()
+                        with Metrics.span('polly_read_stream', file=self.file_name):
+                            shutil.copyfileobj(stream, out_file)
+                        Metrics.count('characters_synthesized', len(ssml))
+                        Metrics.count('bytes_downloaded', out_file.tell() - start)
+                    except IOError as error:
+                        from creatorTools.Exceptions import Mp3Exception
+                        raise Mp3Exception('Not able to write MP3 file: {} '.format(self.file_name), error)
+            else:
+                from creatorTools.Exceptions import Mp3Exception
+                raise Mp3Exception('The response for generating {} didnt contain audio data'
+                                   .format(self.file_name), None)
 
     def schedule_mp3_generation(self):
         """
         Schedules asynchronous generation of mp3 file.
-        File is generated as: https://s3.eu-west-1.amazonaws.com/<BUCKET>/<TaskId>.mp3
+        File is generated as: https://s3.eu-west-1.amazonaws.com/<BUCKET>/<PREFIX><TaskId>.mp3
+        If the same text was already read and is present in cache, file is saved immediately and no task is started.
         :return: id of task returned by start_speech_synthesis_task
         """
-        session = GlobalConfig.get_aws_session()
-        polly = session.client("polly", config=GlobalConfig.get_aws_config())
+        if not os.path.isdir(self.book.get_result_dir()):
+            os.mkdir(self.book.get_result_dir())
+        if self._publish(lambda out_file: TtsCache.fetch('aws polly', self.def_voice, self.polly_text, out_file)):
+            ReaderLog.log_inline('taken from cache: {} ... '.format(
+                os.path.join(self.book.get_result_dir(), self.file_name)))
+            return
+        from botocore.exceptions import BotoCoreError, ClientError
+        polly = GlobalConfig.get_aws_client('polly')
         try:
             # Request speech synthesis
-            GlobalConfig.create_s3_bucket()
-            response = polly.start_speech_synthesis_task(Text=self.polly_text, OutputFormat="mp3",
-                                                         VoiceId=self.def_voice, TextType='ssml',
-                                                         OutputS3BucketName=GlobalConfig.get_s3_bucket())
+            S3Transfer.prepare_bucket()
+            Metrics.count('requests')
+            with Metrics.span('polly_start_task', file=self.file_name):
+                response = polly.start_speech_synthesis_task(Text=self.polly_text, OutputFormat="mp3",
+                                                             VoiceId=self.def_voice, TextType='ssml',
+                                                             OutputS3BucketName=GlobalConfig.get_s3_bucket(),
+                                                             OutputS3KeyPrefix=S3Transfer.get_key_prefix())
         except (BotoCoreError, ClientError) as error:
             from creatorTools.Exceptions import Mp3Exception
             raise Mp3Exception('Error from AWS while generating MP3 file: {} '.format(self.file_name), error)
@@ -120,65 +188,205 @@ class Mp3FileFromAwsPolly(Mp3File):
         except Exception as error:
             from creatorTools.Exceptions import Mp3Exception
             raise Mp3Exception('Error from AWS while getting id for task for: {} '.format(self.file_name), error)
+        Metrics.count('characters_synthesized', len(self.polly_text))
         self.task_id = task_id
+        self.s3_key = S3Transfer.get_key_prefix() + task_id + '.mp3'
         ReaderLog.log_inline('scheduled task: {} ... '.format(task_id))
 
-    def check_save_task(self):
+    @staticmethod
+    def escape_text(text):
+        """
+        Escapes special characters of XML in text, but keeps SSML tags allowed in books (i.e. <break time="1s"/>).
+        :param text: text of book
+        :return: text that can be put into SSML document
+        """
+        from xml.sax.saxutils import escape
+        parts = []
+        position = 0
+        for tag in Mp3FileFromAwsPolly._SSML_TAGS.finditer(text):
+            parts.append(escape(text[position:tag.start()]))
+            parts.append(tag.group())
+            position = tag.end()
+        parts.append(escape(text[position:]))
+        return ''.join(parts)
+
+    @staticmethod
+    def supported_languages():
+        return PollyLanguages.supported_languages()
+
+    def check_save_task(self, task_status=None):
         """
         Checks if given task is finished and eventually downloads mp3 file
+        :param task_status: description of task taken from list_tasks, if None it is read from AWS
         :return: true if all is ok, and file is saved, false if file is not ready yet, throws exception
         """
-        session = GlobalConfig.get_aws_session()
-        polly = session.client("polly", config=GlobalConfig.get_aws_config())
-        task_status = polly.get_speech_synthesis_task(TaskId=self.task_id)
-        status = task_status['SynthesisTask']['TaskStatus']
+        if task_status is None:
+            from botocore.exceptions import BotoCoreError, ClientError
+            polly = GlobalConfig.get_aws_client('polly')
+            Metrics.count('requests')
+            try:
+                task_status = polly.get_speech_synthesis_task(TaskId=self.task_id)['SynthesisTask']
+            except (BotoCoreError, ClientError) as error:
+                from creatorTools.Exceptions import Mp3Exception
+                raise Mp3Exception('Error from AWS while reading synthesis task {} of file {}.'
+                                   .format(self.task_id, self.file_name), error)
+        status = task_status['TaskStatus']
         if status == 'failed':
             from creatorTools.Exceptions import Mp3Exception
             raise Mp3Exception('Status failed returned by AWS while batch generating MP3 file: {} Reason is: {}'
-                               .format(self.file_name, task_status['SynthesisTask']['TaskStatusReason']), None)
+                               .format(self.file_name, task_status.get('TaskStatusReason')), None)
         if status == 'scheduled' or status == 'inProgress':
             return False
         if status == 'completed':
-            output = os.path.join(self.book.get_result_dir(), self.file_name)
-            try:
-                s3_client = session.client('s3', config=GlobalConfig.get_aws_config())
-                s3_client.download_file(GlobalConfig.get_s3_bucket(), self.task_id+'.mp3', output)
-                ReaderLog.log('Downloaded file: {} ... '.format(output))
-            except Exception as ex:
-                from creatorTools.Exceptions import Mp3Exception
-                raise Mp3Exception('Error while downloading file {} from AWS S3 bucket {} key {}'
-                                   .format(self.file_name, GlobalConfig.get_s3_bucket(), self.task_id+'.mp3'), ex)
-            self._save_metadata(output)
+            self._publish(self._download)
+            ReaderLog.log('Downloaded file: {} ... '.format(os.path.join(self.book.get_result_dir(), self.file_name)))
             self.task_id = None
             return True
         from creatorTools.Exceptions import Mp3Exception
         raise Mp3Exception('Unknown status {} returned by AWS while batch generating MP3 file: {} '
                            .format(status, self.file_name), None)
 
-
-class Languages:
-    """"
-    class translates codes of languages used in 'book' file to language codes used by polly:
-    https://docs.aws.amazon.com/polly/latest/dg/voicelist.html
-    """
+    def _download(self, out_file):
+        """
+        Downloads file generated by task from S3 bucket and puts it into cache.
+        :param out_file: binary file object to which audio is written
+        """
+        try:
+            start = out_file.tell()
+            S3Transfer.download(self.s3_key, out_file)
+            out_file.flush()
+            TtsCache.store('aws polly', self.def_voice, self.polly_text, out_file.name, offset=start)
+        except Exception as ex:
+            from creatorTools.Exceptions import Mp3Exception
+            raise Mp3Exception('Error while downloading file {} from AWS S3 bucket {} key {}'
+                               .format(self.file_name, GlobalConfig.get_s3_bucket(), self.s3_key), ex)
 
     @staticmethod
-    def table_of_languages():
-        return {'PL': 'pl-PL', 'ENG': 'en-GB', 'US': 'en-US',
-                'GER': 'de-DE', 'FR': 'fr-FR', 'ES': 'es-ES',
-                'IT': 'it-IT'}
+    def split_ssml(ssml, limit):
+        """
+        Divides SSML text (as created by encode_to_required_format) into chunks not longer than limit.
+        Text is divided at ends of sentences, or at spaces if sentence is too long. If chunk ends inside of
+        section in other language (or inside of SSML tag like <p> or <emphasis>), tags are closed at its end and
+        opened again at start of next chunk.
+        Chunk ends after sentence chosen by hash of its text (on average every limit/2 characters), not after
+        fixed number of characters, so that change of one sentence changes only its chunk - other chunks are the same
+        as before and they are taken from cache.
+        :param ssml: SSML text
+        :param limit: maximal length of chunk
+        :return: list of SSML texts
+        """
+        if len(ssml) <= limit:
+            return [ssml]
+        speak_start, speak_end = '<speak>', '</speak>'
+        body = ssml[len(speak_start):len(ssml) - len(speak_end)]
+        chunks = []
+        current = []    # parts of current chunk
+        current_len = 0
+        current_text = False    # true if current chunk contains any text to read
+        open_tags = []  # tags open at the end of current chunk, i.e. <lang>
 
-    @staticmethod
-    def get_voice(lang_code):
-        voices = {'PL': 'Jacek', 'ENG': 'Brian', 'US': 'Joey',
-                  'GER': 'Hans', 'FR': 'Mathieu', 'ES': 'Miguel',
-                  'IT': 'Giorgio'}
-        return voices[lang_code]
+        def end_tag(tag):
+            return '</{}>'.format(re.match(r'<([\w-]+)', tag).group(1))
+
+        def reserved():
+            return len(speak_start) + len(speak_end) + sum(len(end_tag(tag)) for tag in open_tags)
+
+        def opened():
+            return sum(len(tag) for tag in open_tags)
+
+        def flush():
+            nonlocal current, current_len, current_text
+            if current_text:
+                chunks.append(speak_start + ''.join(current)
+                              + ''.join(end_tag(tag) for tag in reversed(open_tags)) + speak_end)
+            current = list(open_tags)
+            current_len = opened()
+            current_text = False
+
+        def add(part, is_text):
+            nonlocal current_len, current_text
+            current.append(part)
+            current_len += len(part)
+            current_text = current_text or (is_text and part.strip() != '')
+
+        # special characters of XML in text are escaped, so < and > are found only in tags
+        for part in re.split(r'(<[^<>]*>)', body):
+            if part.startswith('</'):
+                add(part, False)
+                if open_tags:
+                    open_tags.pop()
+            elif part.startswith('<'):
+                closed = part.endswith('/>')
+                if current_len + len(part) + (0 if closed else len(end_tag(part))) + reserved() > limit:
+                    flush()
+                add(part, False)
+                if not closed:
+                    open_tags.append(part)
+            else:
+                for sentence in re.split(r'(?<=[.!?;])(?=\s)', part):
+                    boundary = Mp3FileFromAwsPolly._is_chunk_boundary(sentence, limit)
+                    pieces = [sentence]
+                    if len(sentence) + opened() + reserved() > limit:
+                        # sentence doesnt fit into empty chunk - it is divided at spaces
+                        pieces = re.split(r'(?=\s)', sentence)
+                    for piece in pieces:
+                        if current_len + len(piece) + reserved() > limit:
+                            flush()
+                            if current_len + len(piece) + reserved() > limit:
+                                from creatorTools.Exceptions import BookException
+                                raise BookException('Fragment of text \'{}...\' cant be divided into parts shorter '
+                                                    'than {} characters.'.format(piece[:40], limit), None)
+                        add(piece, True)
+                    if boundary:
+                        flush()
+        flush()
+        return chunks
 
     @staticmethod
-    def get_regex_lang():
-        return r'@(PL|ENG|US|GER|FR|ES|IT)[^@]*@'
+    def _is_chunk_boundary(sentence, limit):
+        """
+        Returns true if chunk should end after sentence. Probability is proportional to length of sentence,
+        so that chunks have limit/2 characters on average.
+        """
+        import zlib
+        text = sentence.strip()
+        return zlib.crc32(text.encode('utf-8')) < len(text) / (limit / 2) * 2 ** 32
 
     @staticmethod
-    def supported_languages():
-        return 'PL ENG US GER FR ES IT'
+    def list_tasks(task_ids):
+        """
+        Reads descriptions of many asynchronous tasks at once. Tasks that are not finished are read from lists of
+        scheduled and running tasks (their length doesnt depend on history of account), tasks not found there
+        (finished in the meantime) are read one by one.
+        :param task_ids: set of ids of tasks
+        :return: map {task id: description of task} for tasks found (unknown tasks are not in map)
+        """
+        from botocore.exceptions import BotoCoreError, ClientError
+        polly = GlobalConfig.get_aws_client('polly')
+        found = {}
+        try:
+            with Metrics.span('polly_list_tasks', tasks=len(task_ids)):
+                paginator = polly.get_paginator('list_speech_synthesis_tasks')
+                for status in ('scheduled', 'inProgress'):
+                    for page in paginator.paginate(Status=status, PaginationConfig={'PageSize': 100}):
+                        Metrics.count('requests')
+                        for task in page.get('SynthesisTasks', []):
+                            if task['TaskId'] in task_ids:
+                                found[task['TaskId']] = task
+                        if len(found) == len(task_ids):
+                            return found
+        except (BotoCoreError, ClientError) as error:
+            from creatorTools.Exceptions import Mp3Exception
+            raise Mp3Exception('Error from AWS while reading list of synthesis tasks.', error)
+        for task_id in set(task_ids) - set(found):
+            try:
+                Metrics.count('requests')
+                found[task_id] = polly.get_speech_synthesis_task(TaskId=task_id)['SynthesisTask']
+            except ClientError as error:
+                if error.response.get('Error', {}).get('Code') != 'SynthesisTaskNotFoundException':
+                    from creatorTools.Exceptions import Mp3Exception
+                    raise Mp3Exception('Error from AWS while reading synthesis task {}.'.format(task_id), error)
+            except BotoCoreError as error:
+                from creatorTools.Exceptions import Mp3Exception
+                raise Mp3Exception('Error from AWS while reading synthesis task {}.'.format(task_id), error)
+        return found
@@ -1,13 +1,14 @@
 import os
 import re
-import time
-
-from gtts.tokenizer import Tokenizer, tokenizer_cases
-from pydub import AudioSegment
-import gtts
 
+from creatorTools.EngineLanguages import GoogleLanguages
 from creatorTools.Exceptions import Mp3Exception
+from creatorTools.GlobalConfig import GlobalConfig
+from creatorTools.Metrics import Metrics
+from creatorTools.Mp3Concatenation import Mp3Concatenation
 from creatorTools.Mp3File import Mp3File
+from creatorTools.RateLimiter import FatalError, RetriesExhausted, Throttled
+from creatorTools.TtsCache import TtsCache
 
 
 class Mp3FileFromGoogleTranslate(Mp3File):
@@ -37,53 +38,38 @@ class Mp3FileFromGoogleTranslate(Mp3File):
         Encodes text to format required by google translate.
         :return: length of encoded text, or exception if failure (i.e. wrong syntax)
         """
-        # counting signs @ - there must be even number of them
-        no_of_sections = len(re.findall(Languages.get_regex_lang(), self.raw_text))
-        no_of_marks = len(re.findall('@', self.raw_text))
-        if no_of_marks != no_of_sections * 2:
-            from creatorTools.Exceptions import BookException
-            raise BookException('Syntax error(not matching @) in text of book for file: {} '.format(self.file_name),
-                                None)
-        # constructing tran_text map
-        file_list = self.raw_text.replace('===', '').split('@')
+        # constructing tran_text map, from spans of text in different languages
         file_no = 1
-        for fragment in file_list:
-            if re.match('.*\\w.*', fragment):
-                lang_found = None
-                final_text = ''
-                for lang in Languages.get_lang_tab():
-                    if fragment.startswith(lang):
-                        lang_found = lang
-                        final_text = fragment[3:]
-                        break
-                if lang_found is None:
-                    lang_found = self.def_lang
-                    final_text = fragment
-                self.tran_text[file_no] = [str(lang_found), str(final_text), None]
+        for span in self._compile_markup(GoogleLanguages.get_lang_tab()):
+            final_text = span.text.replace('===', '')
+            if re.search('\\w', final_text):
+                lang_found = span.lang if span.lang is not None else self.def_lang
+                self.tran_text[file_no] = [lang_found, final_text, None]
                 file_no += 1
         return 0  # size of text is not important
 
+    def validate(self):
+        """
+        Checks syntax of text and if it can be divided into parts not longer than 100 characters.
+        """
+        super().validate()
+        for fragment_id in self.tran_text:
+            self._split_fragment(fragment_id)
+
     def save_mp3(self):
         import tempfile
         tempdir = tempfile.mkdtemp(prefix="audiobookreader-")
         tr_exc = None
-        output = None
         try:
-            for fragment_no in self.tran_text.keys():
-                self._transcode(tempdir, fragment_no)
-            # concatenating MP3 files
-            playlist_songs = []
+            self._transcode_all(tempdir)
+            # concatenating MP3 files, frame by frame
+            fragment_files = []
             for fragment_no in sorted(self.tran_text.keys()):
-                for fragm_part_no in self.tran_text[fragment_no][2]:
-                    playlist_songs.append(AudioSegment.from_mp3(fragm_part_no))
-            first_song = playlist_songs.pop(0)
-            playlist = first_song
-            for song in playlist_songs:
-                playlist = playlist.append(song)
+                fragment_files.extend(self.tran_text[fragment_no][2])
             if not os.path.isdir(self.book.get_result_dir()):
                 os.mkdir(self.book.get_result_dir())
-            output = os.path.join(self.book.get_result_dir(), self.file_name)
-            playlist.export(output, format='mp3')
+            # ID3 tag and audio are written once, file is renamed to its name and then its hash is saved
+            self._publish(lambda out_file: Mp3Concatenation.concatenate(fragment_files, out_file))
         except Exception as ex:
             tr_exc = ex
         finally:
@@ -91,20 +77,55 @@ class Mp3FileFromGoogleTranslate(Mp3File):
             shutil.rmtree(tempdir)
             if tr_exc is not None:
                 raise tr_exc
-        # save ID3 and hash
-        self._save_metadata(output)
 
     def schedule_mp3_generation(self):
         from creatorTools.Exceptions import GlobalException
         raise GlobalException('Scheduling async generation not supported for Google Translate.', None)
 
-    def check_save_task(self):
+    @staticmethod
+    def supported_languages():
+        return GoogleLanguages.supported_languages()
+
+    def check_save_task(self, task_status=None):
         from creatorTools.Exceptions import GlobalException
         raise GlobalException('Async generation not supported for Google Translate.', None)
 
-    def _transcode(self, directory, fragment_id):
-        full_name = os.path.join(directory, "voice" + "{:0>4d}".format(fragment_id))
-        # preparing list of divided parts of text
+    def _transcode_all(self, directory):
+        """
+        Synthesizes all fragments of text concurrently, using pool of workers of size configured in global config.
+        Names of temporary files are put into tran_text in the original order of fragments.
+        :param directory: directory where temporary files are stored
+        """
+        jobs = []  # list of tuples: (fragment_id, text, save_name)
+        for fragment_id in sorted(self.tran_text.keys()):
+            self.tran_text[fragment_id][2] = []
+            full_name = os.path.join(directory, "voice" + "{:0>4d}".format(fragment_id))
+            for frag_count, final_frag in enumerate(self._split_fragment(fragment_id), start=1):
+                jobs.append((fragment_id, final_frag, full_name + "_{:0>4d}.mp3".format(frag_count)))
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+        executor = ThreadPoolExecutor(max_workers=GlobalConfig.get_google_workers())
+        try:
+            futures = [executor.submit(self._transcode, final_frag, self.tran_text[fragment_id][0], save_name)
+                       for fragment_id, final_frag, save_name in jobs]
+            wait(futures, return_when=FIRST_EXCEPTION)
+            for (fragment_id, final_frag, save_name), future in zip(jobs, futures):
+                exc = future.exception()
+                if isinstance(exc, Mp3Exception):
+                    raise exc
+                elif exc is not None:
+                    raise Mp3Exception('Failed to get sound from Google Translate for text: \'{}\''
+                                       .format(final_frag), exc)
+                self.tran_text[fragment_id][2].append(save_name)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _split_fragment(self, fragment_id):
+        """
+        Divides text of fragment into parts accepted by Google Translate (not longer than 100 characters).
+        :param fragment_id: id of fragment in tran_text
+        :return: list of parts of text
+        """
+        from gtts.tokenizer import Tokenizer, tokenizer_cases
         raw_text = re.sub(r' +', ' ', self.tran_text[fragment_id][1].strip())
         toke_list = Tokenizer([
             tokenizer_cases.colon,
@@ -115,54 +136,54 @@ class Mp3FileFromGoogleTranslate(Mp3File):
             tmp_tok = toke.strip()
             if any(c.isalpha() for c in tmp_tok):   # token must contain at least one letter to read
                 while len(tmp_tok) > 100:
-                    space_pos = toke.find(' ', 60)
-                    if space_pos == -1:
+                    # part is divided at last space, so that it is as long as possible
+                    space_pos = tmp_tok.rfind(' ', 0, 101)
+                    if ' ' not in tmp_tok:
                         raise Mp3Exception('String \'{}\' is longer than 100 characters '
                                            'and contains no dot, colon or space do divide it.'.format(tmp_tok), None)
-                    if space_pos > 100:
+                    if space_pos == -1:
                         raise Mp3Exception('String \'{}\' is longer than 100 characters and contains '
                                            'no space do divide it in first 100 characters.'.format(tmp_tok), None)
                     final_text.append(tmp_tok[:space_pos].strip())
-                    tmp_tok = tmp_tok[space_pos:]
+                    tmp_tok = tmp_tok[space_pos:].strip()
                 if tmp_tok.strip() != '':
                     final_text.append(tmp_tok)
-        # processing all fragments of text
-        frag_count = 1
-        self.tran_text[fragment_id][2] = []
-        for final_frag in final_text:
-            counter = 10
-            converted = False
-            while counter > 0 and not converted:
-                try:
-                    tts = gtts.gTTS(text=final_frag, lang=Languages.get_google_lang(self.tran_text[fragment_id][0]))
-                    save_name = full_name + "_{:0>4d}.mp3".format(frag_count)
-                    tts.save(save_name)
-                    self.tran_text[fragment_id][2].append(save_name)
-                    converted = True
-                    frag_count += 1
-                except Exception as exc:
-                    print(exc)
-                    exit(1)
-                    counter -= 1
-                    if counter > 0:
-                        print("Error in converting returned by Google. Repeats remaining " + str(counter))
-                        time.sleep(1 + 22 / counter)
-                    else:
-                        raise Mp3Exception('Failed to get sound from Google Translate.', exc)
-            if not converted:
-                raise Mp3Exception('Unknown error during converting data by Google - 10 attempts failed.', None)
-
+        return final_text
 
-class Languages:
     @staticmethod
-    def get_regex_lang():
-        return r'@(PL|ENG|US|GER|FR|ES|IT)[^@]*@'
+    def _transcode(final_frag, lang, save_name):
+        """
+        Converts one part of text to MP3 file. Runs in worker thread.
+        :param final_frag: text to read, not longer than 100 characters
+        :param lang: language code used in book file
+        :param save_name: full path of MP3 file to create
+        """
+        import gtts
+        from gtts.tts import gTTSError
+        google_lang = GoogleLanguages.get_google_lang(lang)
+        if TtsCache.fetch('google translate', google_lang, final_frag, save_name):
+            return
 
-    @staticmethod
-    def get_lang_tab():
-        return ['PL', 'ENG', 'US', 'GER', 'FR', 'ES', 'IT']
+        def request():
+            Metrics.count('requests')
+            try:
+                with Metrics.span('google_request', lang=google_lang):
+                    tts = gtts.gTTS(text=final_frag, lang=google_lang)
+                    tts.save(save_name)
+            except gTTSError as exc:
+                status = exc.rsp.status_code if exc.rsp is not None else None
+                if status is not None and (status == 429 or status >= 500):
+                    raise Throttled(exc.msg) from exc
+                if status is not None and 400 <= status < 500 and status != 408:
+                    raise FatalError(exc) from exc
+                raise   # connection failed, or response without audio
+            except ValueError as exc:
+                raise FatalError(exc) from exc  # i.e. language not supported
 
-    @staticmethod
-    def get_google_lang(lang):
-        langs = {'PL': 'pl', 'ENG': 'en-GB', 'US': 'en', 'GER': 'de', 'FR': 'fr', 'ES': 'es', 'IT': 'it'}
-        return langs[lang]
+        try:
+            GlobalConfig.get_google_rate_limiter().call(request, 'text: \'{}\''.format(final_frag))
+        except (FatalError, RetriesExhausted) as exc:
+            raise Mp3Exception('Failed to get sound from Google Translate. {}'.format(exc), exc.cause)
+        Metrics.count('characters_synthesized', len(final_frag))
+        Metrics.count('bytes_downloaded', os.path.getsize(save_name))
+        TtsCache.store('google translate', google_lang, final_frag, save_name)
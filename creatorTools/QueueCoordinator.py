@@ -0,0 +1,127 @@
+import os
+import subprocess
+import sys
+import time
+
+from creatorTools.BookFiles import BookFiles
+from creatorTools.GlobalConfig import GlobalConfig
+from creatorTools.ReaderLog import ReaderLog
+from creatorTools.WorkQueue import WorkQueue
+
+
+class QueueCoordinator:
+    """
+    Class generating books with workers of work queue, which can run in many processes and on many hosts.
+    Files to generate are put into queue as work items (text, hash of text, engine and target file). Audio generated
+    by workers is published by coordinator: tagged MP3 file is created in result directory and hash of file is saved,
+    so that only coordinator writes files of books. If coordinator is stopped, next run takes audio already generated
+    for the same texts from queue.
+    """
+
+    POLL_INTERVAL = 1   # seconds between checks of queue
+
+    def __init__(self, config_file, queue_file, workers):
+        """
+        :param config_file: path of global config, given to local workers
+        :param queue_file: path of queue
+        :param workers: number of workers started by coordinator on local host
+        """
+        self.config_file = config_file
+        self.queue = WorkQueue(queue_file)
+        self.workers = workers
+        self._processes = []
+        self._books = {}    # {yaml file of book: BookFiles object}
+
+    def run(self, book_configs):
+        """
+        Generates books and waits until all their files are published.
+        :param book_configs: yaml files of changed books
+        :return: exit code
+        """
+        all_files = self._submit(book_configs)
+        self._start_workers()
+        published = 0
+        failed = 0
+        try:
+            while True:
+                for item in self.queue.finished_items(list(self._books)):
+                    if self._publish(item):
+                        published += 1
+                    else:
+                        failed += 1
+                if self.queue.count_open(list(self._books)) == 0:
+                    break
+                if len(self._processes) > 0 and all(process.poll() is not None for process in self._processes):
+                    from creatorTools.Exceptions import GlobalException
+                    raise GlobalException('All workers ended, {} files not generated.'
+                                          .format(all_files - published - failed), None)
+                ReaderLog.progress('Published {}/{} files.  '.format(published + failed, all_files))
+                time.sleep(QueueCoordinator.POLL_INTERVAL)
+        finally:
+            self._stop_workers()
+        for book in self._books.values():
+            book.clear_book_dir()
+            book.save_hashes()
+            book.create_single_file()
+            book.save_manifest()
+        ReaderLog.log_par('Queue finished: {} files published, {} failed.'.format(published, failed))
+        return 1 if failed > 0 else 0
+
+    def _submit(self, book_configs):
+        """
+        Parses books and puts their files into queue.
+        :return: number of files to generate
+        """
+        all_files = 0
+        for book_config in book_configs:
+            ReaderLog.log_par('Processing audiobook defined in file {}'.format(book_config))
+            book = BookFiles(book_config)
+            book.parse_book_file()
+            book.print_generated()
+            if not os.path.isdir(book.get_result_dir()):
+                os.mkdir(book.get_result_dir())
+            items = [{'name': name, 'file_no': mp3.file_no, 'file_name': mp3.file_name,
+                      'language': book.get_default_language(), 'engine': GlobalConfig.get_reading_engine(),
+                      'text': mp3.raw_text, 'text_hash': mp3.raw_text_hash,
+                      'target': os.path.join(book.get_result_dir(), mp3.file_name)}
+                     for name, mp3 in book.mp3_map.items()]
+            kept = self.queue.submit(book_config, items)
+            if kept > 0:
+                ReaderLog.log('{} files taken from queue of previous run.'.format(kept))
+            self._books[book_config] = book
+            all_files += len(items)
+        return all_files
+
+    def _publish(self, item):
+        """
+        Publishes generated file, or shows error of failed one.
+        :return: false if file failed
+        """
+        book = self._books[item['book']]
+        if item['state'] == WorkQueue.FAILED:
+            ReaderLog.log('[ERROR] File {} of book {} not generated: {}'
+                          .format(item['file_name'], item['book'], item['error']))
+            book.errors_in_async = True
+            # next run puts file into queue again, as its hash is not saved
+            self.queue.remove(item)
+            return False
+        book.mp3_map[item['name']].publish_audio(item['audio'])
+        self.queue.remove(item)
+        ReaderLog.log('Published file: {}'.format(item['target']))
+        return True
+
+    def _start_workers(self):
+        if self.workers == 0:
+            ReaderLog.log_par('Waiting for workers of queue {}.'.format(self.queue.queue_file))
+            return
+        creator = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'AudiobookCreator.py')
+        command = [sys.executable, creator, self.config_file, '--queue', self.queue.queue_file, '--worker']
+        self._processes = [subprocess.Popen(command) for _ in range(self.workers)]
+
+    def _stop_workers(self):
+        # workers are waiting for new files, so they are stopped without waiting for their idle timeout
+        for process in self._processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in self._processes:
+            process.wait()
@@ -0,0 +1,117 @@
+import os
+import socket
+import threading
+import time
+
+from creatorTools.Exceptions import ReaderException
+from creatorTools.GlobalConfig import GlobalConfig
+from creatorTools.Metrics import Metrics
+from creatorTools.ReaderLog import ReaderLog
+from creatorTools.WorkQueue import WorkQueue
+
+
+class QueueWorker:
+    """
+    Class generating files of work queue, until there are no files pending or being generated (by any worker)
+    for queue_idle_timeout seconds - worker waits also for files of other workers, which are generated again
+    if lease of their worker expires.
+    Audio of file is generated without tags into spool directory of item - it is published to result directory
+    of book (with tags and hash) by coordinator. Lease of item is renewed in separate thread while file is generated.
+    """
+
+    POLL_INTERVAL = 1   # seconds between checks of empty queue
+
+    def __init__(self, queue_file):
+        """
+        :param queue_file: path of queue, the same as given to coordinator
+        """
+        self.queue = WorkQueue(queue_file)
+        self.name = '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.generated = 0
+        self.failed = 0
+
+    def run(self):
+        """
+        Generates files until there is nothing to do.
+        :return: exit code, 1 if any file failed
+        """
+        lease = GlobalConfig.get_queue_lease()
+        idle_timeout = GlobalConfig.get_queue_idle_timeout()
+        max_attempts = GlobalConfig.get_queue_max_attempts()
+        ReaderLog.log_par('Worker {} waiting for files in queue {}.'.format(self.name, self.queue.queue_file))
+        idle_since = time.monotonic()
+        while True:
+            item = self.queue.claim(self.name, lease, max_attempts)
+            if item is None:
+                if self.queue.count_open() > 0:
+                    # file generated by other worker can be claimed when its lease expires
+                    idle_since = time.monotonic()
+                elif time.monotonic() - idle_since > idle_timeout:
+                    break
+                time.sleep(QueueWorker.POLL_INTERVAL)
+                continue
+            self._generate(item, lease, max_attempts)
+            idle_since = time.monotonic()
+        ReaderLog.log_par('Worker {} finished: {} files generated, {} failed.'
+                          .format(self.name, self.generated, self.failed))
+        return 1 if self.failed > 0 else 0
+
+    def _generate(self, item, lease, max_attempts):
+        stop_renewal = threading.Event()
+        renewal = threading.Thread(target=self._renew_lease, args=(item, lease, stop_renewal), daemon=True)
+        renewal.start()
+        spool_dir = self.queue.get_spool_dir(item)
+        try:
+            from creatorTools.EngineRegistry import EngineRegistry
+            os.makedirs(spool_dir, exist_ok=True)
+            engine_class = EngineRegistry.get_engine_class(item['engine'])
+            mp3 = engine_class(item['text'], [item['file_no'], item['name']], item['text_hash'],
+                               _SpoolBook(item['language'], spool_dir))
+            mp3.tagged = False
+            with Metrics.span('queue_item', file=item['file_name']):
+                mp3.encode_to_required_format()
+                mp3.save_mp3()
+        except (ReaderException, OSError) as ex:
+            message = ex.message if isinstance(ex, ReaderException) else str(ex)
+            self.failed += 1
+            ReaderLog.log('[ERROR] File {} of book {} not generated (attempt {}): {}'
+                          .format(item['file_name'], item['book'], item['attempts'], message))
+            self.queue.fail(item, message, max_attempts)
+            return
+        finally:
+            stop_renewal.set()
+            renewal.join()
+        if self.queue.complete(item, os.path.join(spool_dir, mp3.file_name)):
+            self.generated += 1
+            ReaderLog.log('Generated file {} of book {}.'.format(item['file_name'], item['book']))
+        else:
+            ReaderLog.log('[WARNING] Lease of file {} of book {} expired, it is generated by other worker.'
+                          .format(item['file_name'], item['book']))
+
+    def _renew_lease(self, item, lease, stop_renewal):
+        while not stop_renewal.wait(lease / 3):
+            try:
+                if not self.queue.renew(item, lease):
+                    return
+            except ReaderException as ex:
+                # lease expires if queue cant be written, then item is generated again
+                ReaderLog.log('[WARNING] Not able to renew lease of file {}: {}'.format(item['file_name'], ex.message))
+
+
+class _SpoolBook:
+    """
+    Book seen by file generated in worker: audio is written to spool directory, hash is saved by coordinator.
+    """
+
+    def __init__(self, language, spool_dir):
+        self.language = language
+        self.spool_dir = spool_dir
+
+    def get_default_language(self):
+        return self.language
+
+    def get_result_dir(self):
+        return self.spool_dir
+
+    def update_and_save_hashes(self, only_name, new_hash):
+        pass
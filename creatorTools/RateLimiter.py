@@ -0,0 +1,175 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from creatorTools.Metrics import Metrics
+from creatorTools.ReaderLog import ReaderLog
+
+
+class Throttled(Exception):
+    """
+    Raised inside of request called by RateLimiter.call when service answered that requests are too frequent
+    (HTTP 429) or that it is overloaded (HTTP 5xx).
+    """
+
+
+class RateLimiter:
+    """
+    Class limiting requests sent to reading engine by all threads.
+    Rate of requests is limited by token bucket. Number of requests in flight is adapted with AIMD:
+    it grows by one after every 'limit' successful requests, and it is halved when service throttles requests.
+    Failed requests are repeated with exponential backoff with full jitter. Number of repeats of one request
+    is limited, and number of repeats in whole run is limited by budget, so that run stops instead of being banned.
+    """
+
+    def __init__(self, name, rate, burst, max_concurrency, max_attempts, retry_budget, backoff_base, backoff_max,
+                 clock=time.monotonic, sleep=time.sleep, rng=random):
+        """
+        :param name: name of service, used in log
+        :param rate: requests per second, 0 means no limit
+        :param burst: maximal number of requests sent at once, after time without requests
+        :param max_concurrency: maximal number of requests in flight, it is also initial one
+        :param max_attempts: maximal number of attempts of one request
+        :param retry_budget: maximal number of repeated requests in whole run
+        :param backoff_base: delay (in seconds) before first repeat, it is doubled for next ones
+        :param backoff_max: maximal delay before repeat
+        :param clock: function returning monotonic time in seconds, changed only by tests
+        :param sleep: function waiting given number of seconds before repeat, changed only by tests
+        :param rng: source of random delays (with method uniform), changed only by tests
+        """
+        self.name = name
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.retry_budget = retry_budget
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._sleep = sleep
+        self._rng = rng
+        self._tokens = self.burst
+        self._refilled = clock()
+        self._limit = float(max_concurrency)    # current number of requests allowed in flight
+        self._in_flight = 0
+        self._retries = 0
+        self._decreased = 0.0   # time of last decrease - requests sent before it dont decrease limit again
+        self._condition = threading.Condition()
+
+    def call(self, request, description):
+        """
+        Calls request, repeating it if it fails.
+        :param request: function without parameters. It raises Throttled if service limits requests,
+                        FatalError if repeating it makes no sense, or any other exception if request failed
+                        and it can be repeated.
+        :param description: description of request used in errors
+        :return: value returned by request
+        """
+        attempt = 1
+        while True:
+            try:
+                with self._slot():
+                    return request()
+            except FatalError:
+                raise
+            except Exception as ex:
+                if attempt >= self.max_attempts:
+                    raise RetriesExhausted('{} failed {} times for {}.'.format(self.name, attempt, description), ex)
+                self._take_from_budget(description, ex)
+                delay = self._rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+                ReaderLog.log('Error returned by {} ({}). Repeating in {:.1f} s, attempts remaining {}.'
+                              .format(self.name, ex, delay, self.max_attempts - attempt))
+                with Metrics.span('retry_backoff'):
+                    self._sleep(delay)
+                attempt += 1
+
+    def get_limit(self):
+        with self._condition:
+            return int(self._limit)
+
+    @contextmanager
+    def _slot(self):
+        """
+        Waits until request can be sent, and adapts number of requests in flight to its result.
+        """
+        start = self._clock()
+        self._acquire()
+        sent = self._clock()
+        if sent - start > 0.001:
+            Metrics.record('rate_limit_wait', sent - start)
+        throttled = False
+        ok = False
+        try:
+            yield
+            ok = True
+        except Throttled:
+            throttled = True
+            raise
+        finally:
+            self._release(ok, throttled, sent)
+
+    def _acquire(self):
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+            if self.rate > 0:
+                # token bucket - tokens are added with configured rate, up to burst
+                while True:
+                    now = self._clock()
+                    self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+                    self._refilled = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        break
+                    # lock is released while waiting, so other threads can finish their requests
+                    self._condition.wait((1 - self._tokens) / self.rate)
+
+    def _release(self, ok, throttled, sent):
+        with self._condition:
+            self._in_flight -= 1
+            old_limit = int(self._limit)
+            if throttled:
+                Metrics.count('throttled')
+                if sent >= self._decreased:
+                    # multiplicative decrease, once for all requests that were in flight together
+                    self._limit = max(1.0, self._limit / 2)
+                    self._decreased = self._clock()
+            elif ok:
+                # additive increase: one more request in flight after 'limit' successful requests
+                self._limit = min(float(self.max_concurrency), self._limit + 1 / self._limit)
+            new_limit = int(self._limit)
+            self._condition.notify_all()
+        if new_limit != old_limit:
+            Metrics.gauge('concurrency_limit', new_limit)
+            if throttled:
+                ReaderLog.log('{} limits requests - number of requests in flight reduced to {}.'
+                              .format(self.name, new_limit))
+
+    def _take_from_budget(self, description, ex):
+        with self._condition:
+            self._retries += 1
+            retries = self._retries
+        Metrics.count('retries')
+        if retries > self.retry_budget:
+            raise RetriesExhausted('Budget of {} repeated requests to {} is used up, last failed for {}.'
+                                   .format(self.retry_budget, self.name, description), ex)
+
+
+class FatalError(Exception):
+    """
+    Raised inside of request called by RateLimiter.call if repeating the request makes no sense.
+    """
+    def __init__(self, cause):
+        super().__init__(str(cause))
+        self.cause = cause
+
+
+class RetriesExhausted(Exception):
+    """
+    Raised by RateLimiter.call when request cant be repeated anymore.
+    """
+    def __init__(self, message, cause):
+        super().__init__(message)
+        self.cause = cause
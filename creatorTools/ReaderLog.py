@@ -1,37 +1,72 @@
 import sys
+import threading
 
 
 class ReaderLog:
 
     _new_line = True
+    _lock = threading.RLock()   # messages can be logged from worker threads
+    _sink = None    # if set, complete lines are passed to this function instead of being printed
+    _pending = ''   # beginning of line collected by log_inline, used together with sink
+
+    @staticmethod
+    def set_sink(sink):
+        """
+        Redirects log, i.e. from worker process to main process. Only complete lines are passed to sink,
+        so lines from different processes are not mixed.
+        :param sink: function with one parameter - line of text, or None to print log again
+        """
+        with ReaderLog._lock:
+            ReaderLog._sink = sink
+            ReaderLog._pending = ''
 
     @staticmethod
     def log(message):
-        if not ReaderLog._new_line:
-            print('')
-        print(message)
-        ReaderLog._new_line = True
+        with ReaderLog._lock:
+            if ReaderLog._sink is not None:
+                ReaderLog._sink(ReaderLog._pending + str(message))
+                ReaderLog._pending = ''
+                return
+            if not ReaderLog._new_line:
+                print('')
+            print(message)
+            ReaderLog._new_line = True
 
     @staticmethod
     def log_par(message):
-        if not ReaderLog._new_line:
+        with ReaderLog._lock:
+            if ReaderLog._sink is not None:
+                if ReaderLog._pending != '':
+                    ReaderLog._sink(ReaderLog._pending)
+                ReaderLog._sink('')
+                ReaderLog._sink(str(message))
+                ReaderLog._pending = ''
+                return
+            if not ReaderLog._new_line:
+                print('')
             print('')
-        print('')
-        print(message)
-        ReaderLog._new_line = True
+            print(message)
+            ReaderLog._new_line = True
 
     @staticmethod
     def log_inline(message):
-        if not ReaderLog._new_line:
-            print('')
-        print(message, end='')
-        sys.stdout.flush()
-        ReaderLog._new_line = True
+        with ReaderLog._lock:
+            if ReaderLog._sink is not None:
+                ReaderLog._pending += str(message)
+                return
+            if not ReaderLog._new_line:
+                print('')
+            print(message, end='')
+            sys.stdout.flush()
+            ReaderLog._new_line = True
 
     @staticmethod
     def progress(message):
-        sys.stdout.write("\r")
-        sys.stdout.flush()
-        sys.stdout.write(message)
-        sys.stdout.flush()
-        ReaderLog._new_line = False
+        with ReaderLog._lock:
+            if ReaderLog._sink is not None:
+                return  # progress is shown only by main process
+            sys.stdout.write("\r")
+            sys.stdout.flush()
+            sys.stdout.write(message)
+            sys.stdout.flush()
+            ReaderLog._new_line = False
@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+import uuid
+
+from creatorTools.GlobalConfig import GlobalConfig
+from creatorTools.Metrics import Metrics
+
+
+class S3Transfer:
+    """
+    Class with static data handling S3 bucket that receives files generated asynchronously by Polly.
+    Bucket is either created for one run and deleted at its end, or it is persistent and each run
+    keeps its files under separate prefix of keys. Every file is deleted from bucket right after it is downloaded.
+    """
+    _bucket_ready = False   # set to true if bucket has been checked or created in this run
+    _bucket_used = False    # set to true if files were put into bucket or taken from it in this run (also resumed)
+    _run_prefix = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def prepare_bucket():
+        """
+        Creates bucket if it doesnt exist. Checks it only once per run.
+        """
+        from botocore.exceptions import BotoCoreError, ClientError
+        with S3Transfer._lock:
+            if S3Transfer._bucket_ready:
+                return
+            try:
+                if not S3Transfer.bucket_exists():
+                    s3 = GlobalConfig.get_aws_client('s3')
+                    params = {'Bucket': GlobalConfig.get_s3_bucket(), 'ACL': 'private'}
+                    if GlobalConfig.get_aws_region() != 'us-east-1':
+                        # us-east-1 is default location and it cant be given explicitly
+                        params['CreateBucketConfiguration'] = {'LocationConstraint': GlobalConfig.get_aws_region()}
+                    s3.create_bucket(**params)
+            except (BotoCoreError, ClientError) as ex:
+                from creatorTools.Exceptions import GlobalException
+                raise GlobalException('Error while creating bucket {}'.format(GlobalConfig.get_s3_bucket()), ex)
+            S3Transfer._bucket_ready = True
+            S3Transfer._bucket_used = True
+
+    @staticmethod
+    def bucket_exists():
+        """
+        Checks existence of bucket with one request, independently of number of buckets in account.
+        :return: true if bucket exists and it is available
+        """
+        from botocore.exceptions import ClientError
+        try:
+            GlobalConfig.get_aws_client('s3').head_bucket(Bucket=GlobalConfig.get_s3_bucket())
+            return True
+        except ClientError as ex:
+            if ex.response.get('Error', {}).get('Code') in ('404', 'NoSuchBucket'):
+                return False
+            raise
+
+    @staticmethod
+    def get_key_prefix():
+        """
+        Returns prefix of keys of files generated in this run. It is empty if bucket is deleted at the end of run.
+        """
+        if not GlobalConfig.is_s3_bucket_persistent():
+            return ''
+        with S3Transfer._lock:
+            if S3Transfer._run_prefix is None:
+                S3Transfer._run_prefix = 'audiobook-creator/{}-{}/'.format(time.strftime('%Y%m%d-%H%M%S'),
+                                                                            uuid.uuid4().hex[:8])
+            return S3Transfer._run_prefix
+
+    @staticmethod
+    def download(key, out_file):
+        """
+        Downloads file using multipart, concurrent transfer and deletes it from bucket.
+        Parts are written directly to their places in output file, after data already present in it.
+        :param key: key of file in bucket
+        :param out_file: binary file object opened for writing, file is written from its current position
+        """
+        from boto3.s3.transfer import TransferConfig
+        S3Transfer._bucket_used = True
+        s3 = GlobalConfig.get_aws_client('s3')
+        chunk = GlobalConfig.get_s3_chunk_size()
+        config = TransferConfig(multipart_threshold=chunk, multipart_chunksize=chunk,
+                                max_concurrency=GlobalConfig.get_s3_download_concurrency(), use_threads=True)
+        start = out_file.tell()
+        Metrics.count('requests', 2)
+        with Metrics.span('s3_download', key=key):
+            s3.download_fileobj(GlobalConfig.get_s3_bucket(), key, _OffsetFile(out_file, start), Config=config)
+        out_file.seek(0, os.SEEK_END)
+        Metrics.count('bytes_downloaded', out_file.tell() - start)
+        s3.delete_object(Bucket=GlobalConfig.get_s3_bucket(), Key=key)
+
+    @staticmethod
+    def delete(key):
+        """
+        Deletes file from bucket, if bucket and file exist. Errors are ignored - file is only not needed anymore.
+        :param key: key of file in bucket
+        """
+        from botocore.exceptions import BotoCoreError, ClientError
+        S3Transfer._bucket_used = True
+        try:
+            Metrics.count('requests')
+            GlobalConfig.get_aws_client('s3').delete_object(Bucket=GlobalConfig.get_s3_bucket(), Key=key)
+        except (BotoCoreError, ClientError):
+            pass
+
+    @staticmethod
+    def cleanup():
+        """
+        Removes files of this run that are still in bucket. Bucket is deleted, unless it is configured as persistent.
+        """
+        if not S3Transfer._bucket_used:
+            return
+        from botocore.exceptions import BotoCoreError, ClientError
+        bucket_name = GlobalConfig.get_s3_bucket()
+        try:
+            # run that only resumed tasks didnt check bucket, it could be deleted in the meantime
+            if not S3Transfer._bucket_ready and not S3Transfer.bucket_exists():
+                return
+            s3 = GlobalConfig.get_aws_client('s3')
+            paginator = s3.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=S3Transfer.get_key_prefix()):
+                objects = [{'Key': item['Key']} for item in page.get('Contents', [])]
+                if len(objects) > 0:
+                    s3.delete_objects(Bucket=bucket_name, Delete={'Objects': objects, 'Quiet': True})
+            if not GlobalConfig.is_s3_bucket_persistent():
+                s3.delete_bucket(Bucket=bucket_name)
+        except (BotoCoreError, ClientError) as ex:
+            from creatorTools.Exceptions import GlobalException
+            raise GlobalException('Error while deleting bucket {}'.format(bucket_name), ex)
+
+
+class _OffsetFile:
+    """
+    View of file object shifted by offset: position 0 of view is position offset of file.
+    Transfer writing parts of downloaded object at their positions doesnt overwrite data before offset.
+    """
+
+    def __init__(self, file, offset):
+        self._file = file
+        self._offset = offset
+
+    def seek(self, position, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            position += self._offset
+        return self._file.seek(position, whence) - self._offset
+
+    def tell(self):
+        return self._file.tell() - self._offset
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        return self._file.write(data)
@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+
+import yaml
+
+
+class TaskState:
+    """
+    Class representing file with asynchronous tasks of book that are not finished yet (kept next to hash file,
+    with extension .tasks). Task is saved when it is started and removed when its file is downloaded and its hash
+    is saved. If program is stopped while waiting for tasks, next run resumes them instead of starting them again.
+    """
+
+    def __init__(self, hash_file):
+        """
+        :param hash_file: path of hash file of book
+        """
+        self.state_file = hash_file + '.tasks'
+        self.tasks = {}     # {name of file: {'task_id', 's3_key', 'hash', 'file', 'started'}}
+        self._lock = threading.Lock()   # tasks are removed by threads downloading files
+
+    def read(self):
+        try:
+            with open(self.state_file, encoding='utf8') as state:
+                self.tasks = yaml.load(state, Loader=yaml.SafeLoader) or {}
+        except FileNotFoundError:
+            self.tasks = {}
+        except (OSError, yaml.YAMLError) as ex:
+            from creatorTools.Exceptions import BookException
+            raise BookException('Not able to read file with asynchronous tasks: {} '.format(self.state_file), ex)
+
+    def add(self, name, task_id, s3_key, text_hash, file):
+        """
+        Saves started task.
+        :param name: name of file, the same as in hash file
+        :param task_id: id of task
+        :param s3_key: key of generated file in bucket
+        :param text_hash: hash of text read by task
+        :param file: path of MP3 file created from result of task
+        """
+        with self._lock:
+            self.tasks[name] = {'task_id': task_id, 's3_key': s3_key, 'hash': text_hash, 'file': file,
+                                'started': time.strftime('%Y-%m-%d %H:%M:%S')}
+            self._write()
+
+    def remove(self, name):
+        """
+        Removes task of file, if there is any.
+        :return: removed task or None
+        """
+        with self._lock:
+            task = self.tasks.pop(name, None)
+            if task is not None:
+                self._write()
+            return task
+
+    def _write(self):
+        """
+        Writes tasks atomically, or removes file if there are no tasks. Must be called under lock.
+        """
+        try:
+            if len(self.tasks) == 0:
+                if os.path.isfile(self.state_file):
+                    os.remove(self.state_file)
+                return
+            tmp_file = self.state_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as state:
+                state.write(yaml.dump(self.tasks))
+                state.flush()
+                os.fsync(state.fileno())
+            os.replace(tmp_file, self.state_file)
+        except OSError as ex:
+            from creatorTools.Exceptions import BookException
+            raise BookException('Not able to write file with asynchronous tasks: {} '.format(self.state_file), ex)
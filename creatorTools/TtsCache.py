@@ -0,0 +1,214 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+from creatorTools.GlobalConfig import GlobalConfig
+from creatorTools.Metrics import Metrics
+from creatorTools.ReaderLog import ReaderLog
+
+
+class TtsCache:
+    """
+    Class with static data representing persistent on-disk cache of audio generated by reading engines.
+    Entry is identified by engine, voice (or language) and normalized text of fragment sent to engine.
+    Size of cache is limited - least recently used entries are removed first.
+    Time of last use of entry is kept as modification time of its file, so it survives between runs.
+    Directory can be shared by many processes (--jobs, workers of queue). Each of them reads directory again after
+    it stored 1/RESCAN_PART of maximum size, so entries of other processes are counted too and whole directory
+    exceeds maximum size by no more than 1/RESCAN_PART of it per process.
+    """
+    RESCAN_PART = 16
+    _opened = False
+    _directory = None   # None if cache is not configured
+    _max_size = 0
+    _entries = None     # {key: size of file}, ordered from least to most recently used
+    _size = 0
+    _stored = 0     # bytes stored by this process since directory was read
+    _hits = 0
+    _misses = 0
+    _evictions = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def fetch(engine, voice, text, target):
+        """
+        Copies cached audio for given fragment of text to target file.
+        :param engine: name of reading engine
+        :param voice: voice or language used by engine
+        :param text: text sent to engine
+        :param target: full path of file to create, or binary file object to which audio is written
+        :return: true if audio was found in cache and copied, false otherwise
+        """
+        if not TtsCache._open():
+            return False
+        key = TtsCache._key(engine, voice, text)
+        with TtsCache._lock:
+            if key not in TtsCache._entries:
+                TtsCache._misses += 1
+                Metrics.count('cache_misses')
+                return False
+            cache_path = TtsCache._path(key)
+            # copy is made under lock, so entry cant be evicted in the meantime by this process
+            start = None if isinstance(target, str) else target.tell()
+            try:
+                if start is None:
+                    shutil.copyfile(cache_path, target)
+                else:
+                    with open(cache_path, 'rb') as cached:
+                        shutil.copyfileobj(cached, target)
+            except OSError:
+                # entry was evicted by other process using the same directory (--jobs, workers of queue)
+                if start is not None:
+                    target.seek(start)
+                    target.truncate()
+                TtsCache._size -= TtsCache._entries.pop(key)
+                TtsCache._misses += 1
+                Metrics.count('cache_misses')
+                return False
+            TtsCache._entries.move_to_end(key)
+            TtsCache._hits += 1
+            Metrics.count('cache_hits')
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass    # order of entries is kept in memory anyway
+        return True
+
+    @staticmethod
+    def store(engine, voice, text, source_path, offset=0):
+        """
+        Puts audio generated for given fragment of text into cache. Removes least recently used entries if needed.
+        :param engine: name of reading engine
+        :param voice: voice or language used by engine
+        :param text: text sent to engine
+        :param source_path: full path of file with audio
+        :param offset: position in file where audio starts (i.e. after ID3 tag)
+        """
+        if not TtsCache._open():
+            return
+        key = TtsCache._key(engine, voice, text)
+        cache_path = TtsCache._path(key)
+        tmp_path = '{}.{}.{}.tmp'.format(cache_path, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(source_path, 'rb') as source, open(tmp_path, 'wb') as cached:
+                source.seek(offset)
+                shutil.copyfileobj(source, cached)
+            size = os.path.getsize(tmp_path)
+            with TtsCache._lock:
+                os.replace(tmp_path, cache_path)
+                TtsCache._size += size - TtsCache._entries.pop(key, 0)
+                TtsCache._entries[key] = size
+                TtsCache._stored += size
+                if TtsCache._stored > TtsCache._max_size / TtsCache.RESCAN_PART:
+                    # other processes could store their entries in the meantime
+                    TtsCache._read_directory()
+                TtsCache._evict()
+        except OSError as ex:
+            # cache is only an optimization - problems with it dont stop generation
+            ReaderLog.log('[WARNING] Not able to store audio in cache {}: {}'.format(TtsCache._directory, ex))
+
+    @staticmethod
+    def get_counters(reset=False):
+        """
+        Returns counters of cache (hits, misses, evictions), i.e. to pass them from worker process to main process.
+        :param reset: if true, counters are set to zero
+        """
+        with TtsCache._lock:
+            counters = TtsCache._hits, TtsCache._misses, TtsCache._evictions
+            if reset:
+                TtsCache._hits = TtsCache._misses = TtsCache._evictions = 0
+            return counters
+
+    @staticmethod
+    def add_counters(counters):
+        """
+        Adds counters returned by get_counters in other process.
+        """
+        if TtsCache._open():
+            with TtsCache._lock:
+                TtsCache._hits += counters[0]
+                TtsCache._misses += counters[1]
+                TtsCache._evictions += counters[2]
+
+    @staticmethod
+    def report():
+        if not TtsCache._opened or TtsCache._directory is None:
+            return
+        ReaderLog.log('Cache of generated audio: {} hits, {} misses, {} evicted, {:.1f} MB in {} entries.'
+                      .format(TtsCache._hits, TtsCache._misses, TtsCache._evictions,
+                              TtsCache._size / (1024 * 1024), len(TtsCache._entries)))
+
+    @staticmethod
+    def normalize(text):
+        return re.sub(r'\s+', ' ', text).strip()
+
+    @staticmethod
+    def _key(engine, voice, text):
+        key_text = '\0'.join([engine, voice, TtsCache.normalize(text)])
+        return hashlib.sha256(key_text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _path(key):
+        return os.path.join(TtsCache._directory, key[:2], key + '.mp3')
+
+    @staticmethod
+    def _open():
+        """
+        Reads content of cache directory when cache is used for the first time.
+        :return: true if cache is configured
+        """
+        if TtsCache._opened:
+            return TtsCache._directory is not None
+        with TtsCache._lock:
+            if not TtsCache._opened:
+                TtsCache._directory = GlobalConfig.get_tts_cache_dir()
+                TtsCache._max_size = GlobalConfig.get_tts_cache_size()
+                TtsCache._entries = OrderedDict()
+                if TtsCache._directory is not None:
+                    try:
+                        os.makedirs(TtsCache._directory, exist_ok=True)
+                        TtsCache._read_directory()
+                    except OSError as ex:
+                        from creatorTools.Exceptions import GlobalException
+                        raise GlobalException('Not able to read cache directory: {} '.format(TtsCache._directory), ex)
+                    TtsCache._evict()
+                TtsCache._opened = True
+        return TtsCache._directory is not None
+
+    @staticmethod
+    def _read_directory():
+        """
+        Reads entries of all processes from cache directory, ordered by time of last use.
+        """
+        found = []
+        for sub_dir in os.scandir(TtsCache._directory):
+            if not sub_dir.is_dir():
+                continue
+            for entry in os.scandir(sub_dir.path):
+                if entry.name.endswith('.mp3'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue    # evicted by other process
+                    found.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        TtsCache._entries = OrderedDict()
+        TtsCache._size = 0
+        TtsCache._stored = 0
+        for _, key, size in sorted(found):
+            TtsCache._entries[key] = size
+            TtsCache._size += size
+
+    @staticmethod
+    def _evict():
+        while TtsCache._size > TtsCache._max_size and len(TtsCache._entries) > 0:
+            key, size = TtsCache._entries.popitem(last=False)
+            TtsCache._size -= size
+            TtsCache._evictions += 1
+            try:
+                os.remove(TtsCache._path(key))
+            except OSError:
+                pass
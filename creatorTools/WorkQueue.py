@@ -0,0 +1,188 @@
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+
+
+class WorkQueue:
+    """
+    Class representing queue of files to generate, shared by coordinator and workers (also on other hosts, if file
+    of queue is on shared storage). Queue is SQLite database with one row per file of book (work item).
+    Worker claims item with lease - it has to renew lease while file is generated, otherwise item is claimed again
+    by other worker after lease expires (i.e. when worker is killed). Number of attempt is token of lease: only
+    worker holding current lease can renew or finish item.
+    Audio generated by workers is kept in spool directory next to queue, until coordinator publishes it.
+    Time of leases is read from clocks of hosts, so they should be synchronized.
+    """
+
+    PENDING = 'pending'
+    LEASED = 'leased'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, queue_file):
+        """
+        :param queue_file: path of SQLite database, it is created if it doesnt exist
+        """
+        self.queue_file = queue_file
+        self.spool_dir = queue_file + '.spool'
+        with self._transaction() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY AUTOINCREMENT, book TEXT NOT NULL, '
+                       'name TEXT NOT NULL, file_no TEXT, file_name TEXT, language TEXT, engine TEXT, text TEXT, '
+                       'text_hash TEXT, target TEXT, state TEXT NOT NULL, worker TEXT, lease_until REAL, '
+                       'attempts INTEGER NOT NULL DEFAULT 0, error TEXT, audio TEXT, UNIQUE (book, name))')
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Opens connection with write lock taken at start of transaction, so that two workers never claim the same item.
+        """
+        try:
+            db = sqlite3.connect(self.queue_file, timeout=60, isolation_level=None)
+        except sqlite3.Error as ex:
+            from creatorTools.Exceptions import GlobalException
+            raise GlobalException('Not able to open queue: {} '.format(self.queue_file), ex)
+        db.row_factory = sqlite3.Row
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as ex:
+            from creatorTools.Exceptions import GlobalException
+            raise GlobalException('Error of queue: {} '.format(self.queue_file), ex)
+        finally:
+            db.close()
+
+    def submit(self, book, items):
+        """
+        Adds files of book to queue. Item of the same file and text that is already in queue is kept (with audio
+        generated for previous run of coordinator), other items of book are removed.
+        :param book: yaml file of book
+        :param items: list of maps with keys: name, file_no, file_name, language, engine, text, text_hash, target
+        :return: number of items kept from previous run
+        """
+        wanted = {(item['name'], item['text_hash']): item for item in items}
+        kept = 0
+        with self._transaction() as db:
+            for row in db.execute('SELECT id, name, text_hash, state FROM items WHERE book = ?', (book,)).fetchall():
+                if row['state'] != WorkQueue.FAILED and wanted.pop((row['name'], row['text_hash']), None) is not None:
+                    kept += 1
+                    continue
+                db.execute('DELETE FROM items WHERE id = ?', (row['id'],))
+                self._remove_spool(row['id'])
+            for item in wanted.values():
+                db.execute('INSERT INTO items (book, name, file_no, file_name, language, engine, text, text_hash, '
+                           'target, state) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                           (book, item['name'], item['file_no'], item['file_name'], item['language'], item['engine'],
+                            item['text'], item['text_hash'], item['target'], WorkQueue.PENDING))
+        return kept
+
+    def claim(self, worker, lease_seconds, max_attempts):
+        """
+        Takes first pending item, or item whose lease expired. Item whose lease expired max_attempts times
+        (i.e. every worker generating it was killed) is marked as failed instead.
+        :param worker: name of worker
+        :param lease_seconds: time in which worker has to renew lease or finish item
+        :param max_attempts: maximal number of attempts of item
+        :return: map with columns of item (attempts is token of lease), or None if there is nothing to do
+        """
+        with self._transaction() as db:
+            # time is read after write lock is taken, waiting for lock cant shorten lease
+            now = time.time()
+            while True:
+                row = db.execute('SELECT * FROM items WHERE state = ? OR (state = ? AND lease_until < ?) ORDER BY id '
+                                 'LIMIT 1', (WorkQueue.PENDING, WorkQueue.LEASED, now)).fetchone()
+                if row is None:
+                    return None
+                if row['state'] == WorkQueue.PENDING or row['attempts'] < max_attempts:
+                    break
+                db.execute('UPDATE items SET state = ?, error = ? WHERE id = ?',
+                           (WorkQueue.FAILED, 'lease of worker {} expired in attempt {}'
+                            .format(row['worker'], row['attempts']), row['id']))
+            db.execute('UPDATE items SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1 '
+                       'WHERE id = ?', (WorkQueue.LEASED, worker, now + lease_seconds, row['id']))
+        item = dict(row)
+        item['attempts'] += 1
+        return item
+
+    def renew(self, item, lease_seconds):
+        """
+        :return: false if lease was lost (item was claimed by other worker)
+        """
+        return self._update(item, 'lease_until = ?', (time.time() + lease_seconds,))
+
+    def complete(self, item, audio):
+        """
+        Marks item as generated.
+        :param audio: path of generated audio (in spool directory)
+        :return: false if lease was lost - audio has to be ignored then
+        """
+        return self._update(item, 'state = ?, audio = ?, error = NULL', (WorkQueue.DONE, audio))
+
+    def fail(self, item, error, max_attempts):
+        """
+        Returns item to queue, or marks it as failed if it was tried max_attempts times.
+        :return: false if lease was lost
+        """
+        state = WorkQueue.FAILED if item['attempts'] >= max_attempts else WorkQueue.PENDING
+        return self._update(item, 'state = ?, error = ?', (state, error))
+
+    def _update(self, item, assignments, values):
+        with self._transaction() as db:
+            cursor = db.execute('UPDATE items SET {} WHERE id = ? AND state = ? AND attempts = ?'.format(assignments),
+                                values + (item['id'], WorkQueue.LEASED, item['attempts']))
+            return cursor.rowcount == 1
+
+    def finished_items(self, books):
+        """
+        :param books: yaml files of books
+        :return: list of maps with columns of items of books that are generated or failed
+        """
+        return self._select(books, 'state IN (?, ?)', (WorkQueue.DONE, WorkQueue.FAILED))
+
+    def count_open(self, books=None):
+        """
+        :param books: yaml files of books, or None for all items in queue
+        :return: number of items that are pending or being generated
+        """
+        condition = 'state IN (?, ?)'
+        values = (WorkQueue.PENDING, WorkQueue.LEASED)
+        if books is not None:
+            condition += ' AND book IN ({})'.format(', '.join('?' * len(books)))
+            values += tuple(books)
+        with self._transaction() as db:
+            return db.execute('SELECT COUNT(*) FROM items WHERE ' + condition, values).fetchone()[0]
+
+    def _select(self, books, condition, values):
+        if books is not None:
+            condition += ' AND book IN ({})'.format(', '.join('?' * len(books)))
+            values += tuple(books)
+        with self._transaction() as db:
+            return [dict(row) for row in db.execute('SELECT * FROM items WHERE ' + condition, values).fetchall()]
+
+    def remove(self, item):
+        """
+        Removes item from queue, together with its audio in spool directory.
+        """
+        with self._transaction() as db:
+            db.execute('DELETE FROM items WHERE id = ?', (item['id'],))
+        self._remove_spool(item['id'])
+
+    def get_spool_dir(self, item):
+        """
+        Returns directory where audio of item is generated. It is different for every lease, so that worker
+        which lost lease doesnt overwrite audio of other worker.
+        """
+        return os.path.join(self.spool_dir, '{}.{}'.format(item['id'], item['attempts']))
+
+    def _remove_spool(self, item_id):
+        if not os.path.isdir(self.spool_dir):
+            return
+        for directory in os.listdir(self.spool_dir):
+            if directory.split('.')[0] == str(item_id):
+                shutil.rmtree(os.path.join(self.spool_dir, directory), ignore_errors=True)
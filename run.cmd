@@ -1,4 +1,4 @@
 @echo off
 
 call .\venv\Scripts\activate.bat 
-call .\venv\Scripts\python.exe AudiobookCreator.py %1
+call .\venv\Scripts\python.exe AudiobookCreator.py %*
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+# tests are run from any directory, modules of program are imported from root of repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from creatorTools.GlobalConfig import GlobalConfig  # noqa: E402
+
+
+@pytest.fixture
+def global_config():
+    """
+    Sets global config used by tested code (map that can be changed by test) and clears data created from it.
+    """
+    from creatorTools.S3Transfer import S3Transfer
+    from creatorTools.TtsCache import TtsCache
+
+    def reset():
+        GlobalConfig._aws_session = None
+        GlobalConfig._aws_clients = {}
+        S3Transfer._bucket_ready = False
+        S3Transfer._bucket_used = False
+        S3Transfer._run_prefix = None
+        TtsCache._opened = False
+        TtsCache._size = 0
+    previous = GlobalConfig._global_config
+    GlobalConfig._global_config = {'reading_engine': 'google translate'}
+    reset()
+    yield GlobalConfig._global_config
+    GlobalConfig._global_config = previous
+    reset()
@@ -0,0 +1,76 @@
+import pytest
+
+from creatorTools.AsyncTaskManager import AsyncTaskManager
+
+
+class FakeTaskState:
+    def __init__(self):
+        self.removed = []
+
+    def remove(self, only_name):
+        self.removed.append(only_name)
+
+
+class FakeBook:
+    def __init__(self, files):
+        self.mp3_map = {mp3.file_tile: mp3 for mp3 in files}
+        self.errors_in_async = False
+        self.task_state = FakeTaskState()
+
+
+class FakeTask:
+    statuses = {}   # {task id: status returned by list_tasks}, tasks not in map are unknown to engine
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.file_tile = task_id
+        self.file_name = task_id + '.mp3'
+        self.polly_text = 'text'
+        self.saved = False
+
+    @staticmethod
+    def list_tasks(task_ids):
+        return {task_id: FakeTask.statuses[task_id] for task_id in task_ids if task_id in FakeTask.statuses}
+
+    def check_save_task(self, task_status=None):
+        assert task_status is not None, 'task unknown to engine is checked again'
+        self.saved = True
+        return True
+
+
+def test_task_unknown_to_engine_fails_only_its_file(global_config):
+    global_config.update({'check_delay': 0, 'check_delay_max': 0})
+    FakeTask.statuses = {'known': {'TaskStatus': 'completed'}}
+    known, unknown = FakeTask('known'), FakeTask('unknown')
+    book = FakeBook([known, unknown])
+    manager = AsyncTaskManager()
+    assert not manager.run(lambda task_manager: task_manager.add_book(book))
+    assert manager.error is None
+    assert known.saved and not unknown.saved
+    assert unknown.task_id is None
+    assert book.task_state.removed == ['unknown']
+
+
+class PollyClientWithoutTasks:
+    def get_speech_synthesis_task(self, TaskId):
+        from botocore.exceptions import ClientError
+        raise ClientError({'Error': {'Code': 'SynthesisTaskNotFoundException', 'Message': 'not found'}},
+                          'GetSpeechSynthesisTask')
+
+
+class PollyBook:
+    def get_default_language(self):
+        return 'PL'
+
+
+def test_error_of_aws_while_reading_task_is_error_of_file(global_config):
+    pytest.importorskip('botocore')
+    from creatorTools.Exceptions import Mp3Exception
+    from creatorTools.GlobalConfig import GlobalConfig
+    from creatorTools.Mp3FileFromAwsPolly import Mp3FileFromAwsPolly
+    GlobalConfig._aws_session = object()
+    GlobalConfig._aws_clients['polly'] = PollyClientWithoutTasks()
+    mp3 = Mp3FileFromAwsPolly('Tekst.', ['01', 'first.mp3'], 'hash', PollyBook())
+    mp3.task_id = 'missing'
+    with pytest.raises(Mp3Exception):
+        mp3.check_save_task()
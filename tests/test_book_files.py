@@ -0,0 +1,36 @@
+import os
+
+from creatorTools.BookFiles import BookFiles
+
+
+def test_clear_book_dir_keeps_files_of_book_and_files_being_written(tmp_path, global_config):
+    result_dir = tmp_path / 'result'
+    result_dir.mkdir()
+    (tmp_path / 'book.book').write_text('@@01-first.mp3@Ala ma kota.', encoding='utf-8')
+    (tmp_path / 'book.yaml').write_text(
+        'BookFile: "{0}/book.book"\nHashFile: "{0}/book.hsh"\nResultDir: "{0}/result"\nMainLanguage: "pl"\n'
+        .format(tmp_path.as_posix()), encoding='utf-8')
+    for file in ['01-first.mp3', '02-removed.mp3', '03-downloaded.mp3.tmp', 'cover.jpg']:
+        (result_dir / file).write_bytes(b'')
+    book = BookFiles(str(tmp_path / 'book.yaml'))
+    book.parse_book_file()
+    book.clear_book_dir()
+    assert sorted(os.listdir(result_dir)) == ['01-first.mp3', '03-downloaded.mp3.tmp', 'cover.jpg']
+
+
+def test_book_passed_to_other_process_is_not_read_again(tmp_path, global_config):
+    (tmp_path / 'book.book').write_text('@@01-first.mp3@Ala ma kota.', encoding='utf-8')
+    (tmp_path / 'book.yaml').write_text(
+        'BookFile: "{0}/book.book"\nHashFile: "{0}/book.hsh"\nResultDir: "{0}/result"\nMainLanguage: "pl"\n'
+        .format(tmp_path.as_posix()), encoding='utf-8')
+    book = BookFiles(str(tmp_path / 'book.yaml'))
+    book.parse_book_file()
+    book.file_hashes.hashes['first'] = 'hash'
+    state = book.get_state()
+    for file in ['book.book', 'book.yaml']:
+        os.remove(tmp_path / file)
+    copy = BookFiles(str(tmp_path / 'book.yaml'), state)
+    assert copy.file_hashes.hashes == {'first': 'hash'}
+    assert copy.mp3_all_present == ['01-first.mp3']
+    assert copy.manifest.captured == book.manifest.captured
+    assert copy.get_result_dir() == book.get_result_dir()
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from creatorTools.BookManifest import BookManifest
+
+
+@pytest.fixture
+def book(tmp_path):
+    result_dir = tmp_path / 'result'
+    result_dir.mkdir()
+    (tmp_path / 'book.yaml').write_text('BookFile: "book.book"\n', encoding='utf-8')
+    (tmp_path / 'book.book').write_text('@@01-first.mp3@Ala ma kota.', encoding='utf-8')
+    (tmp_path / 'book.hsh').write_text('first: hash\n', encoding='utf-8')
+    (result_dir / '01-first.mp3').write_bytes(b'')
+    manifest = BookManifest(str(tmp_path / 'book.yaml'))
+    manifest.capture(str(tmp_path / 'book.book'), str(result_dir), str(tmp_path / 'book.hsh'))
+    manifest.save(['01-first.mp3'])
+    return tmp_path
+
+
+def unchanged(book):
+    return BookManifest(str(book / 'book.yaml')).is_unchanged()
+
+
+def test_book_without_changes_is_skipped(book):
+    assert unchanged(book)
+
+
+def test_touched_file_with_the_same_content_is_not_change(book):
+    stat = os.stat(book / 'book.book')
+    os.utime(book / 'book.book', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert unchanged(book)
+
+
+def test_changed_text_of_book_is_found(book):
+    # size is the same, only content is different
+    stat = os.stat(book / 'book.book')
+    (book / 'book.book').write_text('@@01-first.mp3@Ala ma psa..', encoding='utf-8')
+    os.utime(book / 'book.book', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert not unchanged(book)
+
+
+@pytest.mark.parametrize('change', [
+    lambda book: os.remove(book / 'result' / '01-first.mp3'),
+    lambda book: (book / 'book.hsh.journal').write_text('first\tother\n', encoding='utf-8'),
+    lambda book: (book / 'book.hsh').write_text('first: other\n', encoding='utf-8'),
+    lambda book: (book / 'book.yaml').write_text('BookFile: "other.book"\n', encoding='utf-8'),
+    lambda book: (book / 'book.mnf').write_text('not: manifest\n', encoding='utf-8'),
+])
+def test_book_is_processed_after_change(book, change):
+    change(book)
+    assert not unchanged(book)
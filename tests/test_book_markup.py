@@ -0,0 +1,63 @@
+import pytest
+
+from creatorTools.BookMarkup import BookMarkup, MarkupError, Span
+from creatorTools.BookParser import BookParser
+
+LANGUAGES = ['ENG', 'EN', 'DEU']
+
+
+def test_text_without_markup_is_one_span():
+    assert BookMarkup.compile('Ala ma kota.', LANGUAGES) == [Span(None, 'Ala ma kota.', 0, 12)]
+
+
+def test_sections_in_other_languages():
+    text = 'Kot to @ENG cat@, pies to @DEU Hund@.'
+    assert BookMarkup.compile(text, LANGUAGES) == [
+        Span(None, 'Kot to ', 0, 7), Span('ENG', ' cat', 11, 15), Span(None, ', pies to ', 16, 26),
+        Span('DEU', ' Hund', 30, 35), Span(None, '.', 36, 37)]
+
+
+def test_longer_code_is_taken_before_its_beginning():
+    assert BookMarkup.compile('@ENG cat@@EN dog@', LANGUAGES) == [Span('ENG', ' cat', 4, 8), Span('EN', ' dog', 12, 16)]
+
+
+@pytest.mark.parametrize('text, offset, message', [
+    # section in language cant contain other section - its first @ closes outer section
+    ('Kot @ENG cat @DEU Katze@ end@', 23, 'not followed by language code'),
+    ('Kot @ENG cat', 4, 'not closed'),
+    ('Kot @ENG cat@ i @DEU Katze', 16, 'not closed'),
+    ('Adres ala@example.com', 9, 'not followed by language code'),
+    ('Koniec @', 7, 'not followed by language code'),
+    ('@FRA chat@', 0, 'not followed by language code'),
+])
+def test_markup_errors(text, offset, message):
+    with pytest.raises(MarkupError) as error:
+        BookMarkup.compile(text, LANGUAGES)
+    assert error.value.offset == offset
+    assert message in error.value.message
+
+
+def test_position_in_first_line():
+    assert BookMarkup.line_column(0, 3, 10, []) == (3, 10)
+    assert BookMarkup.line_column(5, 3, 10, [20]) == (3, 15)
+
+
+def test_position_after_new_lines():
+    # 'ab\ncd\n\nef' is read as 'ab  cd    ef'
+    breaks = [2, 6, 8]
+    assert BookMarkup.line_column(4, 1, 7, breaks) == (2, 1)
+    assert BookMarkup.line_column(5, 1, 7, breaks) == (2, 2)
+    assert BookMarkup.line_column(8, 1, 7, breaks) == (3, 1)
+    assert BookMarkup.line_column(10, 1, 7, breaks) == (4, 1)
+
+
+def test_positions_of_parsed_section_point_to_book_file(tmp_path):
+    lines = ['Wstep bez sekcji', '@@01-first.mp3@Pierwsza linia', 'druga @ENG second@ linia',
+             '', '   czwarta @ENG fourth', 'koniec@ tekstu']
+    book = tmp_path / 'book.book'
+    book.write_text('\n'.join(lines), encoding='utf-8')
+    section = next(BookParser.iter_sections(str(book)))
+    for word in ['Pierwsza', 'druga', 'second', 'czwarta', 'fourth', 'koniec', 'tekstu']:
+        line, column = BookMarkup.line_column(section.text.index(word), section.line, len(section.name) + 4,
+                                              section.breaks)
+        assert lines[line - 1][column - 1:].startswith(word), word
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from creatorTools.BookParser import BookParser
+from creatorTools.FileHashes import FileHashes
+
+TEXTS = [
+    '',
+    '@@',
+    '@@@',
+    '@@@@',
+    '@@@@@',
+    'no separator',
+    '@@01-a.mp3@Ala ma kota.',
+    '@@01-a.mp3@Ala ma kota.\n@@02-b.mp3@Pies.\n',
+    'header\n\n@@01-a.mp3@Line one\nline two @ENG@ english @.\n\n@@02-b.mp3@Text@@',
+    '@@01-a.mp3@@@02-b.mp3@Empty section before.',
+    '@@01-a.mp3@Triple@@@02-b.mp3@separator',
+    '@@01-ą.mp3@Zażółć gęślą jaźń.\n@@02-ę.mp3@Żółw.',
+    'a@\n@b@@c@d@@@',
+    '@@01-a.mp3@Windows\r\nnew lines\r\n@@02-b.mp3@text',
+]
+
+
+def baseline(text):
+    """
+    Sections as they were found before streaming parser: whole file read, new lines replaced, split by @@.
+    """
+    sections = []
+    line = 1
+    for raw in text.split('@@'):
+        file_text = raw.replace('\n', '  ')
+        struct = file_text.split('@', 1)
+        if len(file_text) > 0 and len(struct) == 2:
+            sections.append((struct[0], struct[1], FileHashes.calc_hash(file_text), line))
+        line += raw.count('\n')
+    return sections
+
+
+def random_texts():
+    generator = random.Random(7)
+    characters = ['@', '@', 'a', 'ż', '\n', ' ', '-', '.']
+    return [''.join(generator.choice(characters) for _ in range(generator.randint(0, 60))) for _ in range(200)]
+
+
+def parsed(path, use_mmap):
+    return [(section.name, section.text, section.hash, section.line)
+            for section in BookParser.iter_sections(str(path), use_mmap)]
+
+
+@pytest.mark.parametrize('chunk', [1, 2, 3, 5, 1024 * 1024])
+@pytest.mark.parametrize('use_mmap', [False, True])
+def test_sections_are_the_same_as_split(tmp_path, monkeypatch, chunk, use_mmap):
+    # chunks smaller than separator and separators divided between chunks
+    monkeypatch.setattr(BookParser, '_CHUNK', chunk)
+    book = tmp_path / 'book.book'
+    for text in TEXTS + random_texts():
+        book.write_bytes(text.encode('utf-8'))
+        with open(book, encoding='utf8') as file:
+            # text mode of open() translates new lines like baseline did
+            expected = baseline(file.read())
+        assert parsed(book, use_mmap) == expected, repr(text)
+
+
+def test_separator_divided_between_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(BookParser, '_CHUNK', 4)
+    book = tmp_path / 'book.book'
+    # first @ of separator is last character of chunk
+    book.write_text('abc@@01-a.mp3@x', encoding='utf-8')
+    assert parsed(book, False) == [('01-a.mp3', 'x', FileHashes.calc_hash('01-a.mp3@x'), 1)]
+
+
+def test_offsets_point_to_start_of_section(tmp_path):
+    text = 'intro\n@@01-a.mp3@Ala.\n@@02-ż.mp3@Pies.'
+    book = tmp_path / 'book.book'
+    book.write_text(text, encoding='utf-8')
+    for section in BookParser.iter_sections(str(book)):
+        assert text[section.offset:].startswith(section.name)
+    data = text.encode('utf-8')
+    for section in BookParser.iter_sections(str(book), use_mmap=True):
+        assert data[section.offset:].decode('utf-8').startswith(section.name)
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from creatorTools.BookValidator import BookValidator
+from creatorTools.FileHashes import FileHashes
+
+
+@pytest.fixture
+def book(tmp_path, global_config):
+    (tmp_path / 'book.book').write_text('@@01-first.mp3@Ala ma kota.\n@@02-second.mp3@Pies i @XX kot@.\n'
+                                        '@@bad name@Tekst.', encoding='utf-8')
+    (tmp_path / 'book.yaml').write_text(
+        'BookFile: "{0}/book.book"\nHashFile: "{0}/book.hsh"\nResultDir: "{0}/result"\nMainLanguage: "pl"\n'
+        .format(tmp_path.as_posix()), encoding='utf-8')
+    return tmp_path
+
+
+def test_all_errors_are_found(book):
+    assert BookValidator.validate([str(book / 'book.yaml')], all_sections=True) == 2
+
+
+def test_files_of_book_are_not_changed(book):
+    # journal left by stopped run - it is merged into hash file only by generation
+    (book / 'book.hsh').write_text('first: old\n', encoding='utf-8')
+    (book / 'book.hsh.journal').write_text('first: {}\n'.format(FileHashes.calc_hash('01-first.mp3@Ala ma kota.  '))
+                                           .replace(': ', '\t'), encoding='utf-8')
+    before = sorted(os.listdir(book))
+    assert BookValidator.validate([str(book / 'book.yaml')]) == 2
+    assert sorted(os.listdir(book)) == before
+    assert (book / 'book.hsh').read_text(encoding='utf-8') == 'first: old\n'
+
+
+def test_not_changed_sections_are_not_checked(book):
+    hashes = FileHashes(str(book / 'book.hsh'))
+    hashes.hashes = {'second': FileHashes.calc_hash('02-second.mp3@Pies i @XX kot@.  ')}
+    hashes.write_file_hashes()
+    # only wrong name of file is found
+    assert BookValidator.validate([str(book / 'book.yaml')]) == 1
+
+
+def test_missing_yaml_file_is_error(tmp_path, global_config):
+    assert BookValidator.validate([str(tmp_path / 'missing.yaml')]) == 1
+
+
+def write_book(directory, name, text):
+    (directory / (name + '.book')).write_text(text, encoding='utf-8')
+    (directory / (name + '.yaml')).write_text(
+        'BookFile: "{0}/{1}.book"\nHashFile: "{0}/{1}.hsh"\nResultDir: "{0}/result"\nMainLanguage: "pl"\n'
+        .format(directory.as_posix(), name), encoding='utf-8')
+    return str(directory / (name + '.yaml'))
+
+
+def test_word_longer_than_100_characters_is_error(tmp_path, global_config):
+    text = '@@01-first.mp3@' + 'slowo ' * 10 + 'a' * 150
+    assert BookValidator.validate([write_book(tmp_path, 'book', text)], all_sections=True) == 1
+
+
+def test_long_text_of_short_words_is_divided(tmp_path, global_config):
+    words = ' '.join('word{}'.format(number) for number in range(60))
+    assert BookValidator.validate([write_book(tmp_path, 'book', '@@01-first.mp3@' + words)], all_sections=True) == 0
+    from creatorTools.Mp3FileFromGoogleTranslate import Mp3FileFromGoogleTranslate
+    mp3 = Mp3FileFromGoogleTranslate(words, ['01', 'first.mp3'], 'hash', _Book())
+    mp3.encode_to_required_format()
+    parts = mp3._split_fragment(1)
+    assert all(len(part) <= 100 for part in parts)
+    # words are never cut
+    assert ' '.join(parts) == words
+
+
+def test_names_of_files_without_numbers_are_unique(tmp_path, global_config):
+    text = '@@01-first.mp3@Ala.\n@@02-first.mp3@Kot.\n@@03-second.mp3@Pies.'
+    assert BookValidator.validate([write_book(tmp_path, 'book', text)], all_sections=True) == 1
+
+
+def test_books_are_checked_in_processes(tmp_path, global_config, monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 2)
+    first = write_book(tmp_path, 'first', '@@01-first.mp3@Ala @XX ma@ kota.')
+    second = write_book(tmp_path, 'second', '@@bad@Pies.\n@@01-second.mp3@Kot.')
+    assert BookValidator.validate([first, second], all_sections=True) == 2
+
+
+class _Book:
+    def get_default_language(self):
+        return 'PL'
@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from creatorTools.EngineRegistry import EngineRegistry
+from creatorTools.Exceptions import GlobalException
+from creatorTools.Mp3File import Mp3File
+
+
+class EngineWithoutLanguages(Mp3File):
+    def encode_to_required_format(self):
+        pass
+
+    def save_mp3(self):
+        pass
+
+    def schedule_mp3_generation(self):
+        pass
+
+    def check_save_task(self, task_status=None):
+        pass
+
+
+class EngineWithLanguages(EngineWithoutLanguages):
+    @staticmethod
+    def supported_languages():
+        return 'PL XX'
+
+
+@pytest.fixture
+def registry(global_config, monkeypatch):
+    monkeypatch.setattr(EngineRegistry, '_classes', {})
+    global_config['engines'] = {
+        'without languages': '{}:EngineWithoutLanguages'.format(__name__),
+        'with languages': '{}:EngineWithLanguages'.format(__name__),
+        'not engine': '{}:FakeEngine'.format(__name__),
+    }
+    return global_config
+
+
+class FakeEngine:
+    pass
+
+
+def test_languages_of_built_in_engines_are_known_without_importing_them():
+    code = ('import sys\n'
+            'from creatorTools.EngineRegistry import EngineRegistry\n'
+            'print(EngineRegistry.get_supported_languages("aws polly"))\n'
+            'print(EngineRegistry.get_supported_languages("google translate"))\n'
+            'print(any(name.startswith("creatorTools.Mp3File") for name in sys.modules))\n')
+    # new process, because other tests import engines
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.split('\n')[:3] == ['PL ENG US GER FR ES IT', 'PL ENG US GER FR ES IT', 'False']
+
+
+def test_languages_of_other_engines_are_known_after_they_are_loaded(registry):
+    assert EngineRegistry.get_supported_languages('with languages') is None
+    EngineRegistry.get_engine_class('with languages')
+    assert EngineRegistry.get_supported_languages('with languages') == 'PL XX'
+
+
+def test_engine_must_implement_supported_languages(registry):
+    with pytest.raises(GlobalException) as error:
+        EngineRegistry.get_engine_class('without languages')
+    assert 'supported_languages' in error.value.message
+
+
+def test_engine_must_inherit_from_mp3_file(registry):
+    with pytest.raises(GlobalException):
+        EngineRegistry.get_engine_class('not engine')
@@ -0,0 +1,66 @@
+import os
+
+import yaml
+
+from creatorTools.FileHashes import FileHashes
+
+
+def hashes_in_file(path):
+    with open(path, encoding='utf-8') as file:
+        return yaml.safe_load(file)
+
+
+def test_updates_are_appended_to_journal(tmp_path, global_config):
+    path = str(tmp_path / 'book.hsh')
+    (tmp_path / 'book.hsh').write_text(yaml.dump({}), encoding='utf-8')
+    hashes = FileHashes(path)
+    hashes.read_file_hashes()
+    hashes.update_hash('first', 'a')
+    hashes.update_hash('second', 'b')
+    assert hashes_in_file(path) == {}
+    with open(path + '.journal', encoding='utf-8') as journal:
+        assert journal.read() == 'first\ta\nsecond\tb\n'
+    hashes.write_file_hashes()
+    assert hashes_in_file(path) == {'first': 'a', 'second': 'b'}
+    assert not os.path.exists(path + '.journal')
+
+
+def test_journal_is_compacted_after_configured_number_of_records(tmp_path, global_config):
+    global_config['hash_compact_every'] = 2
+    path = str(tmp_path / 'book.hsh')
+    (tmp_path / 'book.hsh').write_text(yaml.dump({}), encoding='utf-8')
+    hashes = FileHashes(path)
+    hashes.read_file_hashes()
+    for name in ['first', 'second', 'third']:
+        hashes.update_hash(name, name[0])
+    assert hashes_in_file(path) == {'first': 'f', 'second': 's'}
+    with open(path + '.journal', encoding='utf-8') as journal:
+        assert journal.read() == 'third\tt\n'
+
+
+def test_journal_of_stopped_run_is_replayed_and_compacted(tmp_path):
+    path = tmp_path / 'book.hsh'
+    path.write_text(yaml.dump({'first': 'old', 'second': 'b'}), encoding='utf-8')
+    # program was stopped while last record was written
+    (tmp_path / 'book.hsh.journal').write_text('first\tnew\nthird\tc\nfourth\td', encoding='utf-8')
+    read_only = FileHashes(str(path))
+    read_only.read_file_hashes(compact=False)
+    assert read_only.hashes == {'first': 'new', 'second': 'b', 'third': 'c'}
+    assert (tmp_path / 'book.hsh.journal').exists()
+    hashes = FileHashes(str(path))
+    hashes.read_file_hashes()
+    assert hashes.hashes == {'first': 'new', 'second': 'b', 'third': 'c'}
+    assert hashes_in_file(str(path)) == hashes.hashes
+    assert not (tmp_path / 'book.hsh.journal').exists()
+
+
+def test_journal_is_not_valid_without_hash_file(tmp_path, global_config):
+    path = str(tmp_path / 'book.hsh')
+    (tmp_path / 'book.hsh.journal').write_text('first\ta\n', encoding='utf-8')
+    hashes = FileHashes(path)
+    hashes.read_file_hashes()
+    assert hashes.hashes == {}
+    assert not (tmp_path / 'book.hsh.journal').exists()
+    # hash file is created before first record of journal, so that journal is valid
+    hashes.update_hash('second', 'b')
+    assert hashes_in_file(path) == {'second': 'b'}
@@ -0,0 +1,89 @@
+import io
+
+import pytest
+
+from creatorTools.Exceptions import Mp3Exception
+from creatorTools.Mp3Concatenation import FrameHeader, Mp3Concatenation
+
+# MPEG2 layer 3, 32 kbit/s, 24000 Hz, mono - frame has 96 bytes
+MONO_24K = bytes([0xFF, 0xF3, 0x44, 0xC0])
+# the same, but stereo
+STEREO_24K = bytes([0xFF, 0xF3, 0x44, 0x00])
+
+
+def frame(header, fill):
+    return header + bytes([fill]) * 92
+
+
+def xing_frame(header):
+    data = bytearray(frame(header, 0))
+    data[13:17] = b'Xing'
+    return bytes(data)
+
+
+def id3v2(size):
+    # size is written as syncsafe integer, 7 bits in every byte
+    return b'ID3\x03\x00\x00' + bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F]) \
+        + b'\x00' * size
+
+
+def id3v1():
+    return b'TAG' + b'\x00' * 125
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_header_of_frame():
+    assert Mp3Concatenation.parse_header(MONO_24K) == FrameHeader(3, 24000, 1, 96)
+    assert Mp3Concatenation.parse_header(STEREO_24K).channels == 2
+    # free bitrate and reserved sample rate are not supported
+    assert Mp3Concatenation.parse_header(bytes([0xFF, 0xF3, 0x04, 0xC0])) is None
+    assert Mp3Concatenation.parse_header(bytes([0xFF, 0xF3, 0x4C, 0xC0])) is None
+    assert Mp3Concatenation.parse_header(b'ID3\x03') is None
+
+
+def test_tags_and_data_between_frames_are_skipped():
+    data = id3v2(300) + frame(MONO_24K, 1) + b'\x00\xFF\x17' + frame(MONO_24K, 2) + id3v1()
+    frames = list(Mp3Concatenation.frames(io.BytesIO(data)))
+    assert [body for _, body in frames] == [frame(MONO_24K, 1), frame(MONO_24K, 2)]
+
+
+def test_frames_are_joined_without_tags_and_info_frames(tmp_path, global_config):
+    first = write(tmp_path, 'first.mp3', id3v2(20) + xing_frame(MONO_24K) + frame(MONO_24K, 1) + frame(MONO_24K, 2))
+    second = write(tmp_path, 'second.mp3', xing_frame(MONO_24K) + frame(MONO_24K, 3) + id3v1())
+    out = io.BytesIO()
+    Mp3Concatenation.concatenate([first, second], out)
+    assert out.getvalue() == frame(MONO_24K, 1) + frame(MONO_24K, 2) + frame(MONO_24K, 3)
+
+
+def test_info_frame_is_dropped_only_at_beginning_of_file(tmp_path, global_config):
+    path = write(tmp_path, 'first.mp3', frame(MONO_24K, 1) + xing_frame(MONO_24K))
+    out = io.BytesIO()
+    Mp3Concatenation.concatenate([path], out)
+    assert out.getvalue() == frame(MONO_24K, 1) + xing_frame(MONO_24K)
+
+
+def test_files_with_different_formats_are_encoded_again(tmp_path, monkeypatch, global_config):
+    encoded = []
+    monkeypatch.setattr(Mp3Concatenation, '_reencode',
+                        lambda paths, out_file, sample_rate, channels: encoded.append((paths, sample_rate, channels)))
+    mono = write(tmp_path, 'mono.mp3', frame(MONO_24K, 1))
+    # format changes in the middle of file - frames copied before are dropped
+    mixed = write(tmp_path, 'mixed.mp3', frame(MONO_24K, 2) + frame(STEREO_24K, 3))
+    out = io.BytesIO(b'start')
+    out.seek(5)
+    Mp3Concatenation.concatenate([mono, mixed], out)
+    assert out.getvalue() == b'start'
+    assert encoded == [([mono, mixed], 24000, 1)]
+    stereo = write(tmp_path, 'stereo.mp3', frame(STEREO_24K, 4))
+    Mp3Concatenation.concatenate([mono, stereo], io.BytesIO())
+    assert encoded[1] == ([mono, stereo], 24000, 2)
+
+
+def test_nothing_to_join(global_config):
+    with pytest.raises(Mp3Exception):
+        Mp3Concatenation.concatenate([], io.BytesIO())
@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from creatorTools.Exceptions import Mp3Exception
+from creatorTools.Mp3File import Mp3File
+
+
+class FakeBook:
+    def __init__(self, result_dir):
+        self.result_dir = result_dir
+        self.hashes = {}
+
+    def get_result_dir(self):
+        return self.result_dir
+
+    def get_mp3_tag(self, tag_name):
+        return {'Album': 'Album', 'Artist': 'Artist', 'AlbumArtist': 'Artist', 'AlbumDate': '2020'}[tag_name]
+
+    def update_and_save_hashes(self, only_name, new_hash):
+        # file is already in result directory when its hash is saved
+        assert os.path.isfile(os.path.join(self.result_dir, '01-first_chapter.mp3'))
+        self.hashes[only_name] = new_hash
+
+
+class PublishedMp3(Mp3File):
+    def __init__(self, book):
+        super().__init__('Ala ma kota.', 'hash', book)
+        self.file_no = '01'
+        self.file_tile = 'first_chapter'
+        self.file_name = '01-first_chapter.mp3'
+
+    def encode_to_required_format(self):
+        pass
+
+    def save_mp3(self):
+        pass
+
+    def schedule_mp3_generation(self):
+        pass
+
+    def check_save_task(self, task_status=None):
+        pass
+
+    @staticmethod
+    def supported_languages():
+        return 'PL'
+
+
+@pytest.fixture
+def mp3(tmp_path, global_config):
+    return PublishedMp3(FakeBook(str(tmp_path)))
+
+
+def test_tagged_file_is_written_once(mp3, tmp_path):
+    from mutagen.easyid3 import EasyID3
+    assert mp3._publish(lambda file: file.write(b'audio'))
+    path = tmp_path / '01-first_chapter.mp3'
+    assert path.read_bytes().endswith(b'audio')
+    tag = EasyID3(str(path))
+    assert (tag['title'], tag['tracknumber'], tag['album']) == (['First Chapter'], ['01'], ['Album'])
+    assert mp3.book.hashes == {'first_chapter': 'hash'}
+    assert os.listdir(tmp_path) == ['01-first_chapter.mp3']
+
+
+def test_audio_without_tag_is_published_for_worker(mp3, tmp_path):
+    mp3.tagged = False
+    (tmp_path / 'audio').write_bytes(b'audio')
+    mp3.publish_audio(str(tmp_path / 'audio'))
+    assert (tmp_path / '01-first_chapter.mp3').read_bytes() == b'audio'
+
+
+def test_nothing_is_published_without_audio(mp3, tmp_path):
+    assert not mp3._publish(lambda file: False)
+    assert os.listdir(tmp_path) == []
+    assert mp3.book.hashes == {}
+
+
+def test_interrupted_writing_leaves_no_file(mp3, tmp_path):
+    def write_audio(file):
+        file.write(b'part of audio')
+        raise OSError('disk full')
+    with pytest.raises(Mp3Exception):
+        mp3._publish(write_audio)
+    assert os.listdir(tmp_path) == []
+    assert mp3.book.hashes == {}
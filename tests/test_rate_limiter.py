@@ -0,0 +1,144 @@
+import threading
+
+import pytest
+
+from creatorTools.RateLimiter import FatalError, RateLimiter, RetriesExhausted, Throttled
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class MaxRandom:
+    """
+    Always returns longest delay of full jitter, so delays show growth of backoff.
+    """
+    def __init__(self):
+        self.ranges = []
+
+    def uniform(self, low, high):
+        self.ranges.append((low, high))
+        return high
+
+
+class FailingRequest:
+    def __init__(self, failures, error=Exception):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error('failure {}'.format(self.calls))
+        return 'ok'
+
+
+@pytest.fixture
+def clock(global_config):
+    return FakeClock()
+
+
+def limiter(clock, rate=0, burst=1, max_concurrency=4, max_attempts=5, retry_budget=100, rng=None):
+    return RateLimiter('service', rate, burst, max_concurrency, max_attempts, retry_budget, 1.0, 5.0,
+                       clock=clock, sleep=clock.sleep, rng=rng or MaxRandom())
+
+
+def test_bucket_is_refilled_with_rate_up_to_burst(clock):
+    tested = limiter(clock, rate=2, burst=3)
+    for _ in range(3):
+        tested.call(lambda: None, 'request')
+    assert tested._tokens == 0
+    clock.now += 0.5
+    tested.call(lambda: None, 'request')
+    assert tested._tokens == 0
+    clock.now += 60
+    tested.call(lambda: None, 'request')
+    assert tested._tokens == 2
+
+
+def test_request_waits_for_token(clock):
+    tested = limiter(clock, rate=1000, burst=1)
+    tested.call(lambda: None, 'request')
+    sent = threading.Event()
+    thread = threading.Thread(target=lambda: tested.call(sent.set, 'request'))
+    thread.start()
+    # time doesnt pass, so there is no new token
+    assert not sent.wait(0.1)
+    clock.now += 0.001
+    thread.join(5)
+    assert sent.is_set()
+
+
+def test_backoff_grows_up_to_maximum(clock):
+    rng = MaxRandom()
+    tested = limiter(clock, max_attempts=6, rng=rng)
+    request = FailingRequest(5)
+    assert tested.call(request, 'request') == 'ok'
+    assert clock.sleeps == [1.0, 2.0, 4.0, 5.0, 5.0]
+    assert all(low == 0 for low, high in rng.ranges)
+
+
+def test_attempts_of_one_request_are_limited(clock):
+    tested = limiter(clock, max_attempts=3)
+    request = FailingRequest(10)
+    with pytest.raises(RetriesExhausted) as error:
+        tested.call(request, 'request')
+    assert request.calls == 3
+    assert len(clock.sleeps) == 2
+    assert str(error.value.cause) == 'failure 3'
+
+
+def test_attempts_are_counted_for_every_request(clock):
+    tested = limiter(clock, max_attempts=3)
+    assert tested.call(FailingRequest(2), 'first') == 'ok'
+    assert tested.call(FailingRequest(2), 'second') == 'ok'
+
+
+def test_budget_of_run_is_shared_by_requests(clock):
+    tested = limiter(clock, max_attempts=10, retry_budget=3)
+    assert tested.call(FailingRequest(2), 'first') == 'ok'
+    request = FailingRequest(10)
+    with pytest.raises(RetriesExhausted) as error:
+        tested.call(request, 'second')
+    assert 'Budget' in str(error.value)
+    # one repeat left in budget, the next failure stops run
+    assert request.calls == 2
+
+
+def test_fatal_error_is_not_repeated(clock):
+    tested = limiter(clock)
+    request = FailingRequest(1, error=lambda message: FatalError(ValueError(message)))
+    with pytest.raises(FatalError):
+        tested.call(request, 'request')
+    assert request.calls == 1
+    assert clock.sleeps == []
+
+
+def test_throttling_halves_requests_in_flight_and_success_increases_them(clock):
+    tested = limiter(clock, max_concurrency=8)
+    assert tested.call(FailingRequest(1, error=Throttled), 'request') == 'ok'
+    assert tested.get_limit() == 4
+    for _ in range(4):
+        tested.call(lambda: None, 'request')
+    assert tested.get_limit() == 5
+
+
+@pytest.mark.parametrize('error', [Exception, lambda message: FatalError(ValueError(message))])
+def test_failed_requests_dont_increase_requests_in_flight(clock, error):
+    tested = limiter(clock, max_concurrency=8, max_attempts=2)
+    assert tested.call(FailingRequest(1, error=Throttled), 'request') == 'ok'
+    assert tested.get_limit() == 4
+    for _ in range(10):
+        with pytest.raises((RetriesExhausted, FatalError)):
+            tested.call(FailingRequest(2, error=error), 'request')
+    assert tested.get_limit() == 4
@@ -0,0 +1,76 @@
+import io
+
+import pytest
+
+from creatorTools.GlobalConfig import GlobalConfig
+from creatorTools.S3Transfer import S3Transfer
+
+moto = pytest.importorskip('moto')
+
+
+@pytest.fixture
+def s3(global_config):
+    global_config.update({'reading_engine': 'aws polly', 'aws_region': 'eu-west-1', 'aws_access_key_id': 'test',
+                          'aws_secret_access_key': 'test', 's3bucket': 'audiobook-test', 's3_chunk_size_mb': 5})
+    with moto.mock_aws():
+        yield GlobalConfig.get_aws_client('s3')
+
+
+def keys(s3):
+    return [item['Key'] for item in s3.list_objects_v2(Bucket='audiobook-test').get('Contents', [])]
+
+
+def test_download_writes_after_offset_and_deletes_object(s3):
+    S3Transfer.prepare_bucket()
+    s3.put_object(Bucket='audiobook-test', Key='task.mp3', Body=b'audio')
+    out_file = io.BytesIO()
+    out_file.write(b'ID3')
+    S3Transfer.download('task.mp3', out_file)
+    assert out_file.getvalue() == b'ID3audio'
+    assert keys(s3) == []
+
+
+def test_multipart_download(s3):
+    S3Transfer.prepare_bucket()
+    body = bytes(range(256)) * (12 * 1024 * 1024 // 256)
+    s3.put_object(Bucket='audiobook-test', Key='long.mp3', Body=body)
+    out_file = io.BytesIO()
+    S3Transfer.download('long.mp3', out_file)
+    assert out_file.getvalue() == body
+
+
+def test_delete_missing_object_is_ignored(s3):
+    S3Transfer.prepare_bucket()
+    S3Transfer.delete('missing.mp3')
+
+
+def test_cleanup_deletes_bucket_of_run(s3):
+    S3Transfer.prepare_bucket()
+    s3.put_object(Bucket='audiobook-test', Key='left.mp3', Body=b'audio')
+    S3Transfer.cleanup()
+    assert not S3Transfer.bucket_exists()
+
+
+def test_cleanup_of_persistent_bucket_keeps_other_runs(s3, global_config):
+    global_config['s3_persistent_bucket'] = True
+    S3Transfer.prepare_bucket()
+    prefix = S3Transfer.get_key_prefix()
+    s3.put_object(Bucket='audiobook-test', Key=prefix + 'left.mp3', Body=b'audio')
+    s3.put_object(Bucket='audiobook-test', Key='other-run/file.mp3', Body=b'audio')
+    S3Transfer.cleanup()
+    assert keys(s3) == ['other-run/file.mp3']
+
+
+def test_cleanup_after_run_that_only_resumed_tasks(s3):
+    # bucket created by previous run, this run only downloads files of resumed tasks
+    s3.create_bucket(Bucket='audiobook-test', CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+    s3.put_object(Bucket='audiobook-test', Key='resumed.mp3', Body=b'audio')
+    s3.put_object(Bucket='audiobook-test', Key='failed.mp3', Body=b'audio')
+    S3Transfer.download('resumed.mp3', io.BytesIO())
+    S3Transfer.cleanup()
+    assert not S3Transfer.bucket_exists()
+
+
+def test_cleanup_without_use_of_bucket_does_nothing(s3):
+    S3Transfer.cleanup()
+    assert not S3Transfer.bucket_exists()
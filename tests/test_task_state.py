@@ -0,0 +1,56 @@
+import yaml
+
+from creatorTools.BookFiles import BookFiles
+from creatorTools.S3Transfer import S3Transfer
+from creatorTools.TaskState import TaskState
+
+
+class FakeMp3:
+    statuses = {}   # {task id: status of task in reading engine}
+
+    def __init__(self, name, text_hash):
+        self.file_tile = name
+        self.file_name = '01-{}.mp3'.format(name)
+        self.raw_text_hash = text_hash
+        self.task_id = None
+        self.s3_key = None
+
+    @staticmethod
+    def list_tasks(task_ids):
+        return {task_id: {'TaskStatus': FakeMp3.statuses[task_id]} for task_id in task_ids
+                if task_id in FakeMp3.statuses}
+
+
+def test_tasks_are_saved_until_last_is_removed(tmp_path):
+    state = TaskState(str(tmp_path / 'book.hsh'))
+    state.add('first', 'task-1', 'run/task-1.mp3', 'hash-1', 'result/01-first.mp3')
+    state.add('second', 'task-2', 'run/task-2.mp3', 'hash-2', 'result/02-second.mp3')
+    assert state.remove('second')['task_id'] == 'task-2'
+    with open(str(tmp_path / 'book.hsh.tasks'), encoding='utf-8') as file:
+        assert list(yaml.safe_load(file)) == ['first']
+    read = TaskState(str(tmp_path / 'book.hsh'))
+    read.read()
+    assert read.tasks['first']['s3_key'] == 'run/task-1.mp3'
+    assert read.remove('unknown') is None
+    read.remove('first')
+    assert not (tmp_path / 'book.hsh.tasks').exists()
+
+
+def test_only_tasks_of_the_same_text_are_resumed(tmp_path, global_config, monkeypatch):
+    global_config.update({'reading_engine': 'aws polly', 'polly_long_text': 'async'})
+    deleted = []
+    monkeypatch.setattr(S3Transfer, 'delete', deleted.append)
+    monkeypatch.setattr(FakeMp3, 'statuses', {'task-1': 'inProgress', 'task-2': 'completed', 'task-4': 'failed'})
+    state = TaskState(str(tmp_path / 'book.hsh'))
+    for number, name in enumerate(['same', 'changed', 'removed', 'failed', 'unknown'], 1):
+        state.add(name, 'task-{}'.format(number), 'key-{}'.format(number), 'hash', name)
+    book = BookFiles(str(tmp_path / 'book.yaml'), {
+        'yaml_config': {'HashFile': str(tmp_path / 'book.hsh'), 'ResultDir': str(tmp_path)}, 'hashes': {},
+        'tasks': state.tasks, 'manifest': None, 'mp3_all_present': []})
+    book.mp3_map = {name: FakeMp3(name, 'hash') for name in ['same', 'failed', 'unknown']}
+    book.mp3_map['changed'] = FakeMp3('changed', 'other hash')
+    book._resume_tasks()
+    assert (book.mp3_map['same'].task_id, book.mp3_map['same'].s3_key) == ('task-1', 'key-1')
+    assert all(book.mp3_map[name].task_id is None for name in ['changed', 'failed', 'unknown'])
+    assert list(book.task_state.tasks) == ['same']
+    assert sorted(deleted) == ['key-2', 'key-3', 'key-4', 'key-5']
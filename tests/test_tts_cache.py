@@ -0,0 +1,44 @@
+import os
+
+from creatorTools.TtsCache import TtsCache
+
+KB = 1024
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+
+def store(tmp_path, text, size):
+    source = tmp_path / 'source.mp3'
+    source.write_bytes(b'x' * size)
+    TtsCache.store('engine', 'pl', text, str(source))
+
+
+def test_least_recently_used_entries_are_evicted(global_config, tmp_path):
+    global_config.update({'tts_cache_dir': str(tmp_path / 'cache'), 'tts_cache_size_mb': 64 / 1024})
+    for number in range(4):
+        store(tmp_path, 'text {}'.format(number), 16 * KB)
+    assert TtsCache.fetch('engine', 'pl', 'text 0', str(tmp_path / 'fetched.mp3'))
+    store(tmp_path, 'text 4', 16 * KB)
+    assert TtsCache.fetch('engine', 'pl', 'text 0', str(tmp_path / 'fetched.mp3'))
+    assert not TtsCache.fetch('engine', 'pl', 'text 1', str(tmp_path / 'fetched.mp3'))
+    assert directory_size(tmp_path / 'cache') <= 64 * KB
+
+
+def test_entries_stored_by_other_process_are_counted(global_config, tmp_path):
+    global_config.update({'tts_cache_dir': str(tmp_path / 'cache'), 'tts_cache_size_mb': 256 / 1024})
+    TtsCache.fetch('engine', 'pl', 'opens cache', str(tmp_path / 'fetched.mp3'))
+    # other process fills whole cache after this one has read directory
+    for number in range(16):
+        key = TtsCache._key('engine', 'pl', 'other {}'.format(number))
+        os.makedirs(os.path.dirname(TtsCache._path(key)), exist_ok=True)
+        with open(TtsCache._path(key), 'wb') as file:
+            file.write(b'x' * 16 * KB)
+        os.utime(TtsCache._path(key), (number, number))
+    for number in range(8):
+        store(tmp_path, 'text {}'.format(number), 16 * KB)
+    assert directory_size(tmp_path / 'cache') <= 256 * KB + 256 * KB / TtsCache.RESCAN_PART
+    # the oldest entries of other process were removed
+    assert not os.path.exists(TtsCache._path(TtsCache._key('engine', 'pl', 'other 0')))
+    assert TtsCache.fetch('engine', 'pl', 'text 7', str(tmp_path / 'fetched.mp3'))
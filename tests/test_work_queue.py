@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+from creatorTools.EngineRegistry import EngineRegistry
+from creatorTools.Exceptions import Mp3Exception
+from creatorTools.Mp3File import Mp3File
+from creatorTools.QueueWorker import QueueWorker
+from creatorTools.WorkQueue import WorkQueue
+
+
+class FailingEngine(Mp3File):
+    def __init__(self, text_to_read, mp3_no_name, hash_of_text, belongs_to_book):
+        super().__init__(text_to_read, hash_of_text, belongs_to_book)
+        self.file_name = mp3_no_name[0] + '-' + mp3_no_name[1]
+
+    def encode_to_required_format(self):
+        pass
+
+    def save_mp3(self):
+        raise Mp3Exception('engine failed', None)
+
+    def schedule_mp3_generation(self):
+        pass
+
+    def check_save_task(self, task_status=None):
+        pass
+
+
+def items(*names, text_hash='hash'):
+    return [{'name': name, 'file_no': '01', 'file_name': '01-{}.mp3'.format(name), 'language': 'pl',
+             'engine': 'google translate', 'text': 'Tekst {}.'.format(name), 'text_hash': text_hash,
+             'target': 'result/01-{}.mp3'.format(name)} for name in names]
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return WorkQueue(str(tmp_path / 'queue.db'))
+
+
+def expire(queue, item):
+    with queue._transaction() as db:
+        db.execute('UPDATE items SET lease_until = 0 WHERE id = ?', (item['id'],))
+
+
+def test_submit_keeps_items_with_the_same_text(queue):
+    assert queue.submit('book.yaml', items('first', 'second')) == 0
+    assert queue.submit('book.yaml', items('first') + items('second', text_hash='changed')) == 1
+    assert queue.count_open() == 2
+    assert queue.count_open(['other.yaml']) == 0
+
+
+def test_items_are_claimed_once(queue):
+    queue.submit('book.yaml', items('first', 'second'))
+    first = queue.claim('worker-1', 60, 3)
+    second = queue.claim('worker-2', 60, 3)
+    assert (first['name'], first['attempts']) == ('first', 1)
+    assert (second['name'], second['attempts']) == ('second', 1)
+    assert queue.claim('worker-3', 60, 3) is None
+    assert queue.count_open() == 2
+
+
+def test_complete_and_renew_need_current_lease(queue):
+    queue.submit('book.yaml', items('first'))
+    old = queue.claim('worker-1', 60, 3)
+    expire(queue, old)
+    new = queue.claim('worker-2', 60, 3)
+    assert new['attempts'] == 2
+    assert not queue.renew(old, 60)
+    assert not queue.complete(old, 'old.mp3')
+    assert queue.renew(new, 60)
+    assert queue.complete(new, 'new.mp3')
+    assert [(item['state'], item['audio']) for item in queue.finished_items(['book.yaml'])] == \
+        [(WorkQueue.DONE, 'new.mp3')]
+    assert queue.count_open() == 0
+
+
+def test_failed_item_is_returned_to_queue_until_last_attempt(queue):
+    queue.submit('book.yaml', items('first'))
+    assert queue.fail(queue.claim('worker', 60, 2), 'error 1', 2)
+    assert queue.count_open() == 1
+    assert queue.fail(queue.claim('worker', 60, 2), 'error 2', 2)
+    assert [(item['state'], item['error']) for item in queue.finished_items(['book.yaml'])] == \
+        [(WorkQueue.FAILED, 'error 2')]
+    assert queue.claim('worker', 60, 2) is None
+
+
+def test_item_whose_lease_expired_too_many_times_fails(queue):
+    queue.submit('book.yaml', items('first', 'second'))
+    for _ in range(2):
+        item = queue.claim('killed', 60, 2)
+        assert item['name'] == 'first'
+        expire(queue, item)
+    # first item was tried twice by workers that were killed, next one is claimed
+    assert queue.claim('worker', 60, 2)['name'] == 'second'
+    failed = queue.finished_items(['book.yaml'])
+    assert [(item['name'], item['state']) for item in failed] == [('first', WorkQueue.FAILED)]
+    assert 'expired' in failed[0]['error']
+
+
+def test_spool_is_removed_with_item(queue):
+    queue.submit('book.yaml', items('first'))
+    item = queue.claim('worker', 60, 3)
+    os.makedirs(queue.get_spool_dir(item))
+    queue.remove(item)
+    assert os.listdir(queue.spool_dir) == []
+    assert queue.count_open() == 0
+
+
+def test_worker_with_failed_file_ends_with_error(queue, global_config, monkeypatch):
+    monkeypatch.setattr(EngineRegistry, '_classes', {})
+    global_config.update({'engines': {'failing': '{}:FailingEngine'.format(__name__)}, 'queue_idle_timeout': 0,
+                          'queue_max_attempts': 1})
+    queue.submit('book.yaml', [dict(item, engine='failing') for item in items('first')])
+    worker = QueueWorker(queue.queue_file)
+    assert worker.run() == 1
+    assert worker.failed == 1
+    assert queue.count_open() == 0